@@ -0,0 +1,75 @@
+'''
+Packet log benchmark. Measures the cost of TransportABC.buffer_push() with a full
+buffer of 10k and 100k entries, next to the list based buffer it replaced (which trimmed
+the list with del on every push), plus the cost of taking a snapshot of the buffer.
+Runs offline, no hardware required:
+
+	$ python benchmarks/buffer_push.py
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import time
+
+from gkbus.hardware import VirtualHardware
+from gkbus.transport import PacketDirection, RawPacket, TransportABC
+
+PACKET = RawPacket(direction=PacketDirection.INCOMING, data=bytes(8), timestamp=0)
+
+class ListBuffer:
+	'''
+	The buffer as it was before - a list trimmed with del after every push
+	'''
+	def __init__ (self, buffer_size: int) -> None:
+		self.buffer: list[RawPacket] = []
+		self.buffer_size = buffer_size
+
+	def buffer_push (self, packet: RawPacket) -> None:
+		self.buffer.append(packet)
+		if (self.buffer_size != 0 and len(self.buffer) > self.buffer_size):
+			del self.buffer[0:(len(self.buffer)-self.buffer_size)]
+
+def ns_per_push (transport: TransportABC | ListBuffer, pushes: int) -> float:
+	for _ in range(transport.buffer_size): # fill it up first, the trimming is what we're after
+		transport.buffer_push(PACKET)
+
+	started = time.perf_counter_ns()
+	for _ in range(pushes):
+		transport.buffer_push(PACKET)
+	return round((time.perf_counter_ns() - started) / pushes, 1)
+
+def benchmark (sizes: list[int] | None = None, pushes: int = 100000) -> dict:
+	results = {}
+
+	for size in (sizes or [10000, 100000]):
+		transport = TransportABC(VirtualHardware()).set_buffer_size(size)
+		ring_buffer = ns_per_push(transport, pushes)
+
+		started = time.perf_counter_ns()
+		transport.buffer_snapshot()
+		snapshot = time.perf_counter_ns() - started
+
+		results[size] = {
+			'ns_per_push': ring_buffer,
+			'list_ns_per_push': ns_per_push(ListBuffer(size), pushes),
+			'snapshot_us': round(snapshot / 1000, 1)
+		}
+
+	return {'benchmark': 'buffer_push', 'pushes': pushes, 'results': results}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-s', '--size', type=int, action='append',
+		help='buffer size, can be given multiple times')
+	parser.add_argument('-n', '--pushes', type=int, default=100000)
+	args = parser.parse_args()
+
+	print(json.dumps(benchmark(args.size, args.pushes), indent=4))
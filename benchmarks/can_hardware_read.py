@@ -0,0 +1,101 @@
+'''
+CanHardware read benchmark. Floods a CAN interface with frames from a raw socket
+and measures how many of them each hardware backend is able to pick up,
+along with CPU time spent per frame in the reading thread.
+
+Requires a CAN interface, virtual one is fine:
+
+	$ ip link add dev vcan0 type vcan && ip link set up vcan0
+	$ python benchmarks/can_hardware_read.py vcan0
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import socket
+import struct
+import threading
+import time
+
+from gkbus.hardware import CanHardware, HardwareABC, SocketCanHardware, TimeoutException
+
+BACKENDS = {
+	'scapy': CanHardware,
+	'socketcan': SocketCanHardware
+}
+
+def flood (interface: str, frames: int, identifier: int) -> None:
+	sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+	sock.bind((interface,))
+
+	for index in range(frames):
+		frame = struct.pack('=IB3x8s', identifier, 8, index.to_bytes(8, 'little'))
+		while True:
+			try:
+				sock.send(frame)
+				break
+			except OSError: # ENOBUFS - tx queue is full, let the readers catch up
+				time.sleep(0.0001)
+
+	sock.close()
+
+def benchmark_backend (hardware: HardwareABC, interface: str, frames: int, identifier: int) -> dict:
+	hardware.open()
+
+	sender = threading.Thread(target=flood, args=(interface, frames, identifier))
+	received = 0
+
+	wall_start = time.perf_counter_ns()
+	cpu_start = time.thread_time_ns()
+	last_frame = wall_start
+	sender.start()
+
+	try:
+		while received < frames:
+			hardware.read(8)
+			received += 1
+			last_frame = time.perf_counter_ns()
+	except TimeoutException:
+		pass
+
+	cpu_elapsed = time.thread_time_ns() - cpu_start
+	sender.join()
+	hardware.close()
+
+	wall_elapsed = last_frame - wall_start
+
+	return {
+		'frames_sent': frames,
+		'frames_received': received,
+		'frames_per_second': round(received / (wall_elapsed / 1e9)) if received else 0,
+		'cpu_ns_per_frame': round(cpu_elapsed / received) if received else None
+	}
+
+def benchmark (interface: str,
+		frames: int = 100000,
+		backends: list[str] | None = None,
+		identifier: int = 0x7ea
+	) -> dict:
+	results = {}
+
+	for name in (backends or list(BACKENDS.keys())):
+		hardware = BACKENDS[name](interface, timeout=1)
+		results[name] = benchmark_backend(hardware, interface, frames, identifier)
+
+	return {'benchmark': 'can_hardware_read', 'interface': interface, 'results': results}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('interface', help='CAN interface to benchmark on, i.e. vcan0')
+	parser.add_argument('-n', '--frames', type=int, default=100000)
+	parser.add_argument('-b', '--backend', action='append', choices=BACKENDS.keys())
+	args = parser.parse_args()
+
+	print(json.dumps(benchmark(args.interface, args.frames, args.backend), indent=4))
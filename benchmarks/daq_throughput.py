@@ -0,0 +1,105 @@
+'''
+DAQ throughput benchmark. Sets up DAQ lists on a simulated CCP ECU the same way
+examples/example_ccp_daq.py does on a real one, then reads the DTO stream
+with hardware.read() for a given time, reporting frames per second received and
+CPU time spent per frame. Runs offline, no hardware required:
+
+	$ python benchmarks/daq_throughput.py
+
+For the same measurement against a real (or vcan) interface see can_hardware_read.py
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import time
+
+from virtual_ecu import CCP_BASE_ADDRESS, ccp_client, test_image
+
+from gkbus.hardware import CanFilter, TimeoutException
+from gkbus.protocol import ccp
+
+DTO_BASE_ID = 0x7D0
+
+def benchmark (duration: float = 2,
+		daq_lists: int = 4,
+		odts: int = 8,
+		period: float = 0.001,
+		batched: bool = False
+	) -> dict:
+	client, ecu = ccp_client(test_image(0x100),
+		daq_list_sizes=[odts]*daq_lists,
+		event_channel_periods={x: period for x in range(daq_lists)}
+	)
+	hardware = client.transport.hardware
+
+	for list_number in range(daq_lists):
+		client.execute(ccp.commands.GetSizeOfDaqList(
+			list_number=list_number, can_identifier=DTO_BASE_ID+list_number
+		))
+		for odt_number in range(odts):
+			client.execute(ccp.commands.SetDaqListPointer(
+				list_number=list_number, odt_number=odt_number, element_number=0
+			))
+			client.execute(ccp.commands.WriteDaqListEntry(
+				size=4, address_extension=0, address=CCP_BASE_ADDRESS+odt_number*4
+			))
+		client.execute(ccp.commands.StartStopDataTransmission(
+			mode=ccp.enums.DataTransmissionMode.PREPARE, daq_list_number=list_number,
+			last_odt_number=odts-1, event_channel=list_number, prescaler=1
+		))
+
+	hardware.add_filter(CanFilter(can_id=DTO_BASE_ID, can_mask=0x7F0))
+	client.execute(ccp.commands.StartStopSynchronisedDataTransmission(ccp.enums.DataTransmissionRequest.START))
+
+	received = 0
+	started = time.perf_counter_ns()
+	cpu_start = time.thread_time_ns()
+	deadline = started + int(duration*1000000000)
+	try:
+		while time.perf_counter_ns() < deadline:
+			if batched:
+				received += len(hardware.read_many(max_frames=256))
+			else:
+				hardware.read(8)
+				received += 1
+	except TimeoutException:
+		pass
+	cpu_elapsed = time.thread_time_ns() - cpu_start
+	elapsed = time.perf_counter_ns() - started
+
+	ecu.detach()
+	client.close()
+
+	return {
+		'benchmark': 'daq_throughput',
+		'daq_lists': daq_lists,
+		'odts_per_list': odts,
+		'period': period,
+		'read': 'read_many' if batched else 'read',
+		'frames_expected_per_second': round(daq_lists*odts/period),
+		'frames_received': received,
+		'frames_per_second': round(received / (elapsed / 1000000000)),
+		'cpu_ns_per_frame': round(cpu_elapsed / received) if received else None
+	}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-d', '--duration', type=float, default=2, help='seconds to read DTOs for')
+	parser.add_argument('-l', '--daq-lists', type=int, default=4)
+	parser.add_argument('-o', '--odts', type=int, default=8, help='ODTs per DAQ list')
+	parser.add_argument('-p', '--period', type=float, default=0.001,
+		help='event channel period, seconds')
+	parser.add_argument('--batched', action='store_true',
+		help='read with read_many() instead of read()')
+	args = parser.parse_args()
+
+	result = benchmark(args.duration, args.daq_lists, args.odts, args.period, args.batched)
+	print(json.dumps(result, indent=4))
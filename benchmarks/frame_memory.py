@@ -0,0 +1,90 @@
+'''
+Frame and packet allocation benchmark. Creates a million instances of every
+hot path type and reports memory held per million objects (tracemalloc) and
+construction time per object, next to an equivalent __dict__ based dataclass.
+Runs offline, no hardware required:
+
+	$ python benchmarks/frame_memory.py
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from dataclasses import MISSING, dataclass, fields
+from typing import Callable
+
+from gkbus.hardware import RawFrame
+from gkbus.protocol.ccp.ccp_protocol import CcpRequestFrame
+from gkbus.protocol.ccp.ccp_response import CcpResponseFrame
+from gkbus.protocol.kwp2000.kwp2000_response import Kwp2000ResponseFrame
+from gkbus.transport import PacketDirection, RawPacket
+
+PAYLOAD = bytes(range(8))
+
+FACTORIES = {
+	RawFrame: lambda cls: cls(identifier=0x7ea, data=PAYLOAD, timestamp=0),
+	RawPacket: lambda cls: cls(direction=PacketDirection.INCOMING, data=PAYLOAD, timestamp=0),
+	Kwp2000ResponseFrame: lambda cls: cls(status=0x63, data=PAYLOAD),
+	CcpResponseFrame: lambda cls: cls(packet_id=0xFF, status=0x00, counter=0x01, data=PAYLOAD),
+	CcpRequestFrame: lambda cls: cls(command_code=0x04, counter=0x01, data=PAYLOAD),
+}
+
+def dict_based (cls: type) -> type:
+	'''
+	Build a plain dataclass with the same fields, but without __slots__ - the baseline
+	'''
+	namespace = {x.name: x.default for x in fields(cls) if x.default is not MISSING}
+	annotations = {x.name: x.type for x in fields(cls)}
+	return dataclass(type(cls.__name__, (), {'__annotations__': annotations, **namespace}))
+
+def measure (factory: Callable[[], object], count: int) -> dict:
+	gc.collect()
+	tracemalloc.start()
+	objects = [factory() for _ in range(count)]
+	current, _peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del objects
+
+	gc.collect()
+	started = time.perf_counter_ns()
+	for _ in range(count):
+		factory()
+	elapsed = time.perf_counter_ns() - started
+
+	return {
+		'bytes_per_million': round(current * (1000000 / count)),
+		'ns_per_object': round(elapsed / count, 1)
+	}
+
+def benchmark (count: int = 1000000) -> dict:
+	results = {}
+
+	for cls, factory in FACTORIES.items():
+		baseline_cls = dict_based(cls)
+		slotted = measure(lambda: factory(cls), count)
+		baseline = measure(lambda: factory(baseline_cls), count)
+
+		results[cls.__name__] = {
+			'slots': slotted,
+			'dict': baseline,
+			'saved_bytes_per_million': baseline['bytes_per_million'] - slotted['bytes_per_million']
+		}
+
+	return {'benchmark': 'frame_memory', 'objects': count, 'results': results}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-n', '--count', type=int, default=1000000)
+	args = parser.parse_args()
+
+	print(json.dumps(benchmark(args.count), indent=4))
@@ -0,0 +1,79 @@
+'''
+Import time benchmark. Imports gkbus modules in fresh interpreters and reports
+how long the import took, next to the startup time of a bare interpreter.
+Scapy is only needed once a CAN class is used - the benchmark also reports whether
+importing a module pulled it in, and with --check fails if it did.
+Runs offline, no hardware required:
+
+	$ python benchmarks/import_time.py
+	$ python benchmarks/import_time.py --check
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import statistics
+import subprocess
+import time
+
+MODULES = ['gkbus', 'gkbus.hardware', 'gkbus.transport', 'gkbus.protocol', 'gkbus.simulator']
+
+MEASURE = '''
+import sys, time
+started = time.perf_counter_ns()
+import {module}
+print(time.perf_counter_ns() - started, int('scapy' in sys.modules))
+'''
+
+def import_ns (module: str) -> tuple[int, bool]:
+	'''
+	:return: import time in nanoseconds, whether Scapy got imported along
+	'''
+	output = subprocess.run([sys.executable, '-c', MEASURE.format(module=module)],
+		cwd=parentdir, capture_output=True, text=True, check=True)
+	elapsed, scapy_imported = output.stdout.strip().splitlines()[-1].split()
+	return int(elapsed), scapy_imported == '1'
+
+def startup_ns () -> int:
+	started = time.perf_counter_ns()
+	subprocess.run([sys.executable, '-c', 'pass'], check=True)
+	return time.perf_counter_ns() - started
+
+def benchmark (repeat: int = 10) -> dict:
+	startup = statistics.median([startup_ns() for _ in range(repeat)])
+	results = {'interpreter_startup_ms': round(startup / 1000000, 2)}
+
+	for module in MODULES:
+		samples = [import_ns(module) for _ in range(repeat)]
+		results[module] = {
+			'median_ms': round(statistics.median([x[0] for x in samples]) / 1000000, 2),
+			'min_ms': round(min([x[0] for x in samples]) / 1000000, 2),
+			'imports_scapy': any([x[1] for x in samples])
+		}
+
+	return {'benchmark': 'import_time', 'repeat': repeat, 'results': results}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-r', '--repeat', type=int, default=10)
+	parser.add_argument('--check', action='store_true',
+		help='exit with an error if any module imports Scapy')
+	args = parser.parse_args()
+
+	result = benchmark(args.repeat)
+	print(json.dumps(result, indent=4))
+
+	if args.check:
+		offending = [
+			name for name, x in result['results'].items()
+			if isinstance(x, dict) and x['imports_scapy']
+		]
+		if offending:
+			sys.exit('Scapy imported eagerly by: {}'.format(', '.join(offending)))
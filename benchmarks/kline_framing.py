@@ -0,0 +1,97 @@
+'''
+K-Line framing benchmark. Measures how fast Kwp2000OverKLineTransport builds request frames
+and KLineFrameParser parses responses, for every payload length a frame can carry.
+Before measuring, the wire format is checked - payloads up to 63 bytes carry their length
+in the format byte, longer ones (64-255 bytes) in a separate length byte. Lengths of
+64-126 bytes used to go into the format byte, corrupting its address mode bits, so a
+mismatch fails the run. Runs offline, no hardware required:
+
+	$ python benchmarks/kline_framing.py
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import time
+
+from gkbus.hardware import VirtualKLineHardware
+from gkbus.simulator import Kwp2000Ecu
+from gkbus.transport import KLineFrameParser, Kwp2000OverKLineTransport
+from gkbus.transport.kline_framing import parse_frame
+
+TX_ID, RX_ID = 0x11, 0xF1
+
+def expected_frame (data: bytes) -> bytes:
+	'''
+	ISO 14230-2 frame with physical addressing, written out byte by byte
+	'''
+	if len(data) <= 0x3F:
+		header = bytes([0x80 | len(data), TX_ID, RX_ID])
+	else:
+		header = bytes([0x80, TX_ID, RX_ID, len(data)])
+	return header + data + bytes([sum(header + data) & 0xFF])
+
+def check_wire_format (transport: Kwp2000OverKLineTransport) -> None:
+	'''
+	:raises RuntimeError: if a frame doesn't match ISO 14230-2 or doesn't parse back,
+		either with KLineFrameParser or with the simulated ECU
+	'''
+	ecu = Kwp2000Ecu(address=TX_ID, tester_address=RX_ID)
+	for length in range(1, 0x100): # an empty payload has no valid encoding
+		data = bytes([x & 0xFF for x in range(length)])
+		frame = transport.build_payload(data)
+		if frame != expected_frame(data):
+			raise RuntimeError('{} byte payload framed as {}, expected {}'.format(
+				length, frame.hex(), expected_frame(data).hex()))
+		if parse_frame(frame).data != data:
+			raise RuntimeError('{} byte payload doesn\'t parse back'.format(length))
+		if ecu.unframe(frame) != data:
+			raise RuntimeError('{} byte payload rejected by the simulated ECU'.format(length))
+
+def benchmark (iterations: int = 100000) -> dict:
+	transport = Kwp2000OverKLineTransport(VirtualKLineHardware(), tx_id=TX_ID, rx_id=RX_ID)
+	check_wire_format(transport)
+
+	payloads = [bytes(length) for length in (2, 63, 64, 126, 254)]
+	results = {}
+
+	for data in payloads:
+		started = time.perf_counter_ns()
+		for _ in range(iterations):
+			frame = transport.build_payload(data)
+		build_ns = (time.perf_counter_ns() - started) / iterations
+
+		parser = KLineFrameParser()
+		started = time.perf_counter_ns()
+		for _ in range(iterations):
+			parser.feed(frame)
+			parser.next_frame()
+		parse_ns = (time.perf_counter_ns() - started) / iterations
+
+		results[len(data)] = {
+			'build_ns': round(build_ns, 1),
+			'parse_ns': round(parse_ns, 1),
+			'frames_per_second': round(1000000000 / parse_ns) if parse_ns else None
+		}
+
+	return {
+		'benchmark': 'kline_framing',
+		'iterations': iterations,
+		'wire_format_verified': True,
+		'results': results
+	}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-n', '--iterations', type=int, default=100000,
+		help='frames built and parsed per payload length')
+	args = parser.parse_args()
+
+	print(json.dumps(benchmark(args.iterations), indent=4))
@@ -0,0 +1,50 @@
+'''
+K-Line adapter latency benchmark. Measures the effective byte latency of a K-Line
+adapter - time between writing a byte and receiving its echo - with the default
+serial settings and in KLineHardware low latency mode, unbuffered and buffered.
+
+Requires a K-Line adapter. Bytes are sent out on the bus, so leave the ECU disconnected
+(or at least switched off). Changing the latency timer of USB adapters usually requires root:
+
+	$ python benchmarks/kline_latency.py /dev/ttyUSB0
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+
+from gkbus.hardware import KLineHardware
+
+
+def benchmark (port: str, samples: int = 50) -> dict:
+	results = {}
+
+	for low_latency in [False, True]:
+		for buffered in [False, True]:
+			hardware = KLineHardware(port, low_latency=low_latency, buffered=buffered)
+			hardware.open()
+			try:
+				name = '{}_{}'.format(
+					'low_latency' if low_latency else 'default',
+					'buffered' if buffered else 'unbuffered'
+				)
+				results[name] = {'echo_latency_ms': hardware.measure_echo_latency(samples)}
+			finally:
+				hardware.close()
+
+	return {'benchmark': 'kline_latency', 'port': port, 'samples': samples, 'results': results}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('port', help='serial port of the K-Line adapter, i.e. /dev/ttyUSB0')
+	parser.add_argument('-n', '--samples', type=int, default=50)
+	args = parser.parse_args()
+
+	print(json.dumps(benchmark(args.port, args.samples), indent=4))
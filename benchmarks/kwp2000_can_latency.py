@@ -0,0 +1,98 @@
+'''
+KWP2000 over CAN latency benchmark. Compares execute() round-trip time of the
+ISO-TP request/response paths of Kwp2000OverCanTransport: Scapy's sr1()/sniff(),
+direct send/recv on the Scapy ISO-TP socket, and the built-in ISO-TP engine on top of
+CanHardware and SocketCanHardware. The ECU side is a thread answering every request
+with a positive response through the built-in engine on a raw socket.
+
+Requires a CAN interface, virtual one is fine:
+
+	$ ip link add dev vcan0 type vcan && ip link set up vcan0
+	$ python benchmarks/kwp2000_can_latency.py vcan0
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import threading
+
+from protocol_roundtrip import measure
+
+from gkbus.hardware import CanFilter, CanHardware, SocketCanHardware, TimeoutException
+from gkbus.protocol import kwp2000
+from gkbus.transport import IsoTp, IsoTpParameters, Kwp2000OverCanTransport
+
+TX_ID, RX_ID = 0x7E0, 0x7E8
+
+MODES = {
+	'scapy_sr1': lambda interface: Kwp2000OverCanTransport(
+		CanHardware(interface), TX_ID, RX_ID, use_sr1=True),
+	'scapy_direct': lambda interface: Kwp2000OverCanTransport(
+		CanHardware(interface), TX_ID, RX_ID),
+	'isotp_engine_scapy': lambda interface: Kwp2000OverCanTransport(
+		CanHardware(interface), TX_ID, RX_ID, isotp_parameters=IsoTpParameters()),
+	'isotp_engine_socketcan': lambda interface: Kwp2000OverCanTransport(
+		SocketCanHardware(interface), TX_ID, RX_ID, isotp_parameters=IsoTpParameters()),
+}
+
+def responder (interface: str, stop: threading.Event) -> None:
+	hardware = SocketCanHardware(interface, timeout=0.1,
+		filters=[CanFilter(can_id=TX_ID, can_mask=0x7FF)])
+	hardware.open()
+	isotp = IsoTp(hardware, tx_id=RX_ID, rx_id=TX_ID)
+
+	while not stop.is_set():
+		try:
+			request = isotp.recv().data
+		except TimeoutException:
+			continue
+		isotp.send(bytes([request[0]+0x40]) + request[1:])
+
+	hardware.close()
+
+def benchmark (interface: str, iterations: int = 2000, modes: list[str] | None = None) -> dict:
+	stop = threading.Event()
+	thread = threading.Thread(target=responder, args=(interface, stop), daemon=True)
+	thread.start()
+
+	results = {}
+	try:
+		for name in (modes or list(MODES.keys())):
+			client = kwp2000.Kwp2000Protocol(MODES[name](interface))
+			client.init(kwp2000.commands.StartCommunication())
+
+			tester_present = kwp2000.commands.TesterPresent(kwp2000.enums.ResponseType.REQUIRED)
+			# echoed back - multi frame both ways
+			write_data = kwp2000.commands.WriteDataByLocalIdentifier(0x01, bytes(0xFE))
+			results[name] = {
+				'single_frame': measure(lambda: client.execute(tester_present), iterations),
+				'multi_frame': measure(
+					lambda: client.execute(write_data), iterations//10, warmup=10)
+			}
+			client.close()
+	finally:
+		stop.set()
+		thread.join()
+
+	return {
+		'benchmark': 'kwp2000_can_latency',
+		'interface': interface,
+		'iterations': iterations,
+		'results': results
+	}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('interface', help='CAN interface to benchmark on, i.e. vcan0')
+	parser.add_argument('-n', '--iterations', type=int, default=2000)
+	parser.add_argument('-m', '--mode', action='append', choices=MODES.keys())
+	args = parser.parse_args()
+
+	print(json.dumps(benchmark(args.interface, args.iterations, args.mode), indent=4))
@@ -0,0 +1,133 @@
+'''
+Memory dump throughput benchmark. Dumps a memory image from a simulated ECU with
+KWP2000 ReadMemoryByAddress (over K-Line, and over CAN with the built-in ISO-TP engine),
+KWP2000 RequestUpload/TransferData (over K-Line) and CCP DataUpload (over CAN),
+reporting bytes per second. By default the virtual bus is infinitely fast, so the result
+is the ceiling gkbus itself imposes. Pass bitrates to see what to expect from a real bus.
+Runs offline, no hardware required:
+
+	$ python benchmarks/memory_dump.py
+	$ python benchmarks/memory_dump.py --size 4096 --kline-bitrate 10400 --can-bitrate 500000
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import time
+
+from virtual_ecu import (
+	CCP_BASE_ADDRESS,
+	KWP2000_BASE_ADDRESS,
+	ccp_client,
+	kwp2000_can_client,
+	kwp2000_client,
+	test_image,
+)
+
+from gkbus.protocol import ccp, kwp2000
+
+
+def dump_kwp2000 (client: kwp2000.Kwp2000Protocol, image: bytes, block_size: int) -> dict:
+	started = time.perf_counter_ns()
+	cpu_start = time.thread_time_ns()
+	dump = client.read_memory(KWP2000_BASE_ADDRESS, len(image), block_size=block_size)
+	cpu_elapsed = time.thread_time_ns() - cpu_start
+	elapsed = time.perf_counter_ns() - started
+
+	client.close()
+	result = summarize(image, dump, elapsed, cpu_elapsed, client.last_transfer.requests)
+
+	isotp_engine = getattr(client.transport, 'isotp_engine', None)
+	if isotp_engine is not None:
+		result['isotp_last_received'] = {
+			'frames': isotp_engine.last_received.frames,
+			'flow_control_frames': isotp_engine.last_received.flow_control_frames,
+			'bytes_per_second': round(isotp_engine.last_received.bytes_per_second)
+		}
+
+	return result
+
+def upload_kwp2000 (client: kwp2000.Kwp2000Protocol, image: bytes) -> dict:
+	dump = bytearray()
+
+	started = time.perf_counter_ns()
+	cpu_start = time.thread_time_ns()
+	for chunk in client.upload(KWP2000_BASE_ADDRESS, len(image)):
+		dump += chunk
+	cpu_elapsed = time.thread_time_ns() - cpu_start
+	elapsed = time.perf_counter_ns() - started
+
+	client.close()
+	return summarize(image, dump, elapsed, cpu_elapsed, client.last_transfer.requests + 2)
+
+def dump_ccp (image: bytes, bitrate: int | None) -> dict:
+	client, _ecu = ccp_client(image, bitrate)
+	dump = bytearray()
+
+	started = time.perf_counter_ns()
+	cpu_start = time.thread_time_ns()
+	client.execute(ccp.commands.SetMemoryTransferAddress(
+		mta_number=0, address_extension=0, address=CCP_BASE_ADDRESS
+	))
+	for offset in range(0, len(image), 5):
+		size = min(5, len(image) - offset)
+		dump += client.execute(ccp.commands.DataUpload(size=size)).get_data()[:size]
+	cpu_elapsed = time.thread_time_ns() - cpu_start
+	elapsed = time.perf_counter_ns() - started
+
+	client.close()
+	return summarize(image, dump, elapsed, cpu_elapsed, len(range(0, len(image), 5)) + 1)
+
+def summarize (image: bytes, dump: bytes, elapsed: int, cpu_elapsed: int, requests: int) -> dict:
+	return {
+		'bytes': len(dump),
+		'requests': requests,
+		'seconds': round(elapsed / 1000000000, 4),
+		'bytes_per_second': round(len(dump) / (elapsed / 1000000000)),
+		'cpu_us_per_request': round(cpu_elapsed / requests / 1000, 2),
+		'verified': bytes(dump) == image
+	}
+
+def benchmark (size: int = 0x10000,
+		block_size: int = 0xFE,
+		kline_bitrate: int | None = None,
+		can_bitrate: int | None = None
+	) -> dict:
+	image = test_image(size)
+
+	return {
+		'benchmark': 'memory_dump',
+		'size': size,
+		'kline_bitrate': kline_bitrate,
+		'can_bitrate': can_bitrate,
+		'results': {
+			'kwp2000_read_memory_by_address': dump_kwp2000(
+				kwp2000_client(image, kline_bitrate)[0], image, block_size),
+			'kwp2000_can_read_memory_by_address': dump_kwp2000(
+				kwp2000_can_client(image, can_bitrate)[0], image, block_size),
+			'kwp2000_request_upload': upload_kwp2000(
+				kwp2000_client(image, kline_bitrate)[0], image),
+			'ccp_data_upload': dump_ccp(image, can_bitrate)
+		}
+	}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-s', '--size', type=int, default=0x10000, help='bytes to dump')
+	parser.add_argument('--block-size', type=int, default=0xFE,
+		help='ReadMemoryByAddress block size')
+	parser.add_argument('--kline-bitrate', type=int, default=None,
+		help='emulated K-Line baudrate, i.e. 10400')
+	parser.add_argument('--can-bitrate', type=int, default=None,
+		help='emulated CAN bitrate, i.e. 500000')
+	args = parser.parse_args()
+
+	result = benchmark(args.size, args.block_size, args.kline_bitrate, args.can_bitrate)
+	print(json.dumps(result, indent=4))
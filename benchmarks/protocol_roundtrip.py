@@ -0,0 +1,81 @@
+'''
+Round-trip benchmark. Measures the time a single execute() takes for Kwp2000Protocol
+(over K-Line) and CcpProtocol (over CAN), talking to a simulated ECU that answers
+instantly over an infinitely fast virtual bus - whatever is measured is the overhead
+of gkbus itself. The replay results come from a ReplayTransport answering from a recording
+of the same session, no ECU and no bus involved at all. Runs offline, no hardware required:
+
+	$ python benchmarks/protocol_roundtrip.py
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import time
+from typing import Callable
+
+from virtual_ecu import ccp_client, kwp2000_client, summarize
+
+from gkbus.protocol import ccp, kwp2000
+from gkbus.transport import ReplayTransport
+
+
+def measure (execute: Callable[[], object], iterations: int, warmup: int = 100) -> dict:
+	for _ in range(warmup):
+		execute()
+
+	samples = []
+	cpu_start = time.thread_time_ns()
+	for _ in range(iterations):
+		started = time.perf_counter_ns()
+		execute()
+		samples.append(time.perf_counter_ns() - started)
+	cpu_elapsed = time.thread_time_ns() - cpu_start
+
+	return summarize(samples) | {
+		'executes_per_second': round(iterations / (sum(samples) / 1000000000)),
+		'cpu_us_per_execute': round(cpu_elapsed / iterations / 1000, 2)
+	}
+
+def benchmark (iterations: int = 5000) -> dict:
+	results = {}
+
+	kwp2000_protocol, _ecu = kwp2000_client(bytes(0x100))
+	tester_present = kwp2000.commands.TesterPresent(kwp2000.enums.ResponseType.REQUIRED)
+	results['kwp2000_tester_present'] = measure(
+		lambda: kwp2000_protocol.execute(tester_present), iterations)
+	read_memory = kwp2000.commands.ReadMemoryByAddress(offset=0x080000, size=0xFE)
+	results['kwp2000_read_memory_by_address'] = measure(
+		lambda: kwp2000_protocol.execute(read_memory), iterations)
+	recording = kwp2000_protocol.transport.buffer_dump()[-2:]
+	kwp2000_protocol.close()
+
+	replay_protocol = kwp2000.Kwp2000Protocol(ReplayTransport(recording, kline=True, loop=True))
+	replay_protocol.init(kwp2000.commands.StartCommunication())
+	results['kwp2000_replay_read_memory_by_address'] = measure(
+		lambda: replay_protocol.execute(read_memory), iterations)
+	replay_protocol.close()
+
+	ccp_protocol, _ecu = ccp_client(bytes(0x100))
+	test_availability = ccp.commands.TestAvailability(station_address=0x01)
+	results['ccp_test_availability'] = measure(
+		lambda: ccp_protocol.execute(test_availability), iterations)
+	short_upload = ccp.commands.ShortUpload(size=5, address_extension=0, address=0x010000)
+	results['ccp_short_upload'] = measure(lambda: ccp_protocol.execute(short_upload), iterations)
+	ccp_protocol.close()
+
+	return {'benchmark': 'protocol_roundtrip', 'iterations': iterations, 'results': results}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-n', '--iterations', type=int, default=5000)
+	args = parser.parse_args()
+
+	print(json.dumps(benchmark(args.iterations), indent=4))
@@ -0,0 +1,86 @@
+'''
+Run the benchmark suite and write the results as a single JSON document, so they can be
+compared release over release. Offline benchmarks always run, can_hardware_read and
+kwp2000_can_latency run only when a CAN interface is given, kline_latency only when
+a K-Line adapter is:
+
+	$ python benchmarks/run_all.py -o results.json
+	$ python benchmarks/run_all.py -o results.json --interface vcan0
+	$ python benchmarks/run_all.py -o results.json --kline-port /dev/ttyUSB0
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import datetime
+import json
+import platform
+
+import buffer_push
+import daq_throughput
+import frame_memory
+import import_time
+import kline_framing
+import memory_dump
+import protocol_roundtrip
+import transfer_codecs
+
+import gkbus
+
+
+def run (interface: str | None = None, quick: bool = False, kline_port: str | None = None) -> dict:
+	results = [
+		import_time.benchmark(repeat=3 if quick else 10),
+		protocol_roundtrip.benchmark(iterations=500 if quick else 5000),
+		memory_dump.benchmark(size=0x1000 if quick else 0x10000),
+		transfer_codecs.benchmark(size=0x1000 if quick else 0x10000),
+		kline_framing.benchmark(iterations=10000 if quick else 100000),
+		daq_throughput.benchmark(duration=0.5 if quick else 2),
+		daq_throughput.benchmark(duration=0.5 if quick else 2, batched=True),
+		frame_memory.benchmark(count=10000 if quick else 1000000),
+		buffer_push.benchmark(pushes=10000 if quick else 100000)
+	]
+
+	if interface:
+		import can_hardware_read
+		import kwp2000_can_latency
+		results.append(can_hardware_read.benchmark(interface, frames=10000 if quick else 100000))
+		results.append(kwp2000_can_latency.benchmark(interface, iterations=200 if quick else 2000))
+
+	if kline_port:
+		import kline_latency
+		results.append(kline_latency.benchmark(kline_port, samples=10 if quick else 50))
+
+	return {
+		'gkbus_version': gkbus.__version__,
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'platform': platform.platform(),
+		'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+		'results': {x['benchmark'] + ('_' + x['read'] if 'read' in x else ''): x for x in results}
+	}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-o', '--output', help='write results to this file instead of stdout')
+	parser.add_argument('-i', '--interface',
+		help='CAN interface for the benchmarks needing one, i.e. vcan0')
+	parser.add_argument('-k', '--kline-port',
+		help='K-Line adapter for the benchmarks needing one, i.e. /dev/ttyUSB0')
+	parser.add_argument('-q', '--quick', action='store_true',
+		help='smaller workloads, for a smoke test')
+	args = parser.parse_args()
+
+	output = json.dumps(run(args.interface, args.quick, args.kline_port), indent=4)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			f.write(output)
+	else:
+		print(output)
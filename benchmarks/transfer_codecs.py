@@ -0,0 +1,132 @@
+'''
+RequestDownload/RequestUpload codec benchmark. Encodes and decodes sample images with every
+built-in codec and weighs the CPU time spent against the K-Line bus time saved by sending
+fewer bytes. Bus time is estimated from the bitrate and the default ISO 14230 timing - every
+TransferData block costs its frames on the wire plus P2min and P3min. Runs offline:
+
+	$ python benchmarks/transfer_codecs.py
+	$ python benchmarks/transfer_codecs.py --size 65536 --bitrate 10400 --block-size 254
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import argparse
+import json
+import math
+import random
+import time
+
+from virtual_ecu import test_image
+
+from gkbus.hardware import KLineTiming
+from gkbus.protocol.kwp2000.codecs import Codec, DataFormatCodec, IdentityCodec, LzssCodec, XorCodec
+
+FRAME_OVERHEAD = 5 # format byte, target, source, length byte, checksum
+RESPONSE_LENGTH = 5 # positive TransferData response: header, service identifier, checksum
+BITS_PER_BYTE = 10 # start bit, 8 data bits, stop bit
+
+def calibration_image (size: int) -> bytes:
+	'''
+	Resembles a real flash image: code, lookup tables and erased (0xFF) areas
+	'''
+	generator = random.Random(0)
+	image = bytearray()
+
+	while len(image) < size:
+		kind = generator.choice(['code', 'table', 'erased'])
+		length = generator.randint(256, 4096)
+		if kind == 'code':
+			image += bytes(generator.getrandbits(8) for _ in range(length))
+		elif kind == 'table':
+			start, step = generator.randint(0, 0x8000), generator.randint(1, 16)
+			image += b''.join(
+				((start + x*step) & 0xFFFF).to_bytes(2, 'big') for x in range(length // 2))
+		else:
+			image += b'\xFF' * length
+
+	return bytes(image[:size])
+
+def bus_seconds (size: int, block_size: int, bitrate: int, timing: KLineTiming) -> float:
+	blocks = math.ceil(size / block_size)
+	wire_bytes = size + blocks * (FRAME_OVERHEAD + 1 + RESPONSE_LENGTH)
+	return wire_bytes * BITS_PER_BYTE / bitrate + blocks * (timing.p2min + timing.p3min)
+
+def measure (codec: Codec,
+		image: bytes,
+		block_size: int,
+		bitrate: int,
+		timing: KLineTiming
+	) -> dict:
+	started = time.perf_counter()
+	encoder = codec.encoder()
+	encoded = b''.join([
+		encoder.update(image[x:x+block_size]) for x in range(0, len(image), block_size)
+	]) + encoder.flush()
+	encode_seconds = time.perf_counter() - started
+
+	started = time.perf_counter()
+	decoder = codec.decoder()
+	decoded = b''.join([
+		decoder.update(encoded[x:x+block_size]) for x in range(0, len(encoded), block_size)
+	]) + decoder.flush()
+	decode_seconds = time.perf_counter() - started
+
+	return {
+		'encoded_bytes': len(encoded),
+		'ratio': round(len(image) / max(len(encoded), 1), 3),
+		'encode_bytes_per_second': round(len(image) / encode_seconds) if encode_seconds else None,
+		'decode_bytes_per_second': round(len(image) / decode_seconds) if decode_seconds else None,
+		'encode_seconds': round(encode_seconds, 4),
+		'bus_seconds': round(bus_seconds(len(encoded), block_size, bitrate, timing), 2),
+		'verified': decoded == image
+	}
+
+def benchmark (size: int = 0x10000, bitrate: int = 10400, block_size: int = 0xFE) -> dict:
+	timing = KLineTiming()
+	codecs = {
+		'identity': IdentityCodec(),
+		'xor': XorCodec(b'\x5A\xA5'),
+		'lzss': LzssCodec(),
+		'lzss_xor': DataFormatCodec(LzssCodec(), XorCodec(b'\x5A\xA5'))
+	}
+	images = {
+		'calibration': calibration_image(size),
+		'ramp': test_image(size),
+		'random': random.Random(1).randbytes(size)
+	}
+
+	results = {}
+	for (image_name, image) in images.items():
+		results[image_name] = {
+			name: measure(codec, image, block_size, bitrate, timing)
+			for (name, codec) in codecs.items()
+		}
+		baseline = results[image_name]['identity']['bus_seconds']
+		for result in results[image_name].values():
+			# positive - the codec pays for itself, encoding included
+			saved = baseline - result['bus_seconds'] - result['encode_seconds']
+			result['seconds_saved'] = round(saved, 2)
+
+	return {
+		'benchmark': 'transfer_codecs',
+		'size': size,
+		'bitrate': bitrate,
+		'block_size': block_size,
+		'results': results
+	}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-s', '--size', type=int, default=0x10000, help='image size in bytes')
+	parser.add_argument('--bitrate', type=int, default=10400,
+		help='K-Line baudrate the bus time is estimated for')
+	parser.add_argument('--block-size', type=int, default=0xFE, help='TransferData block size')
+	args = parser.parse_args()
+
+	print(json.dumps(benchmark(args.size, args.bitrate, args.block_size), indent=4))
@@ -0,0 +1,90 @@
+'''
+Shared setup for the offline benchmarks - protocol clients talking to a simulated ECU
+over virtual hardware. Not a benchmark on its own
+'''
+import inspect
+import os
+import sys
+
+# dirty hack to import gkbus from this package's source code, not the installed package
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import statistics
+
+from gkbus.hardware import VirtualCanHardware, VirtualKLineHardware
+from gkbus.protocol import ccp, kwp2000
+from gkbus.simulator import CcpEcu, EcuTiming, Kwp2000Ecu
+from gkbus.transport import (
+	CcpOverCanTransport,
+	IsoTpParameters,
+	Kwp2000OverCanTransport,
+	Kwp2000OverKLineTransport,
+)
+
+KWP2000_BASE_ADDRESS = 0x080000
+CCP_BASE_ADDRESS = 0x010000
+
+def test_image (size: int) -> bytes:
+	return bytes([x & 0xFF for x in range(size)])
+
+def kwp2000_client (image: bytes,
+		bitrate: int | None = None,
+		timing: EcuTiming | None = None
+	) -> tuple[kwp2000.Kwp2000Protocol, Kwp2000Ecu]:
+	hardware = VirtualKLineHardware(bitrate=bitrate)
+	ecu = Kwp2000Ecu(image, KWP2000_BASE_ADDRESS, timing).attach(hardware)
+
+	client = kwp2000.Kwp2000Protocol(Kwp2000OverKLineTransport(hardware, tx_id=0x11, rx_id=0xF1))
+	client.init(kwp2000.commands.StartCommunication())
+	return client, ecu
+
+def kwp2000_can_client (image: bytes,
+		bitrate: int | None = None,
+		timing: EcuTiming | None = None,
+		isotp_parameters: IsoTpParameters | None = None
+	) -> tuple[kwp2000.Kwp2000Protocol, Kwp2000Ecu]:
+	'''
+	KWP2000 over CAN, with the built-in ISO-TP engine on both ends
+	'''
+	hardware = VirtualCanHardware(bitrate=bitrate)
+	ecu = Kwp2000Ecu(image, KWP2000_BASE_ADDRESS, timing, request_id=0x7E0, response_id=0x7E8)
+	ecu.attach(hardware)
+
+	transport = Kwp2000OverCanTransport(hardware, tx_id=0x7E0, rx_id=0x7E8,
+		isotp_parameters=isotp_parameters or IsoTpParameters())
+	client = kwp2000.Kwp2000Protocol(transport)
+	client.init(kwp2000.commands.StartCommunication())
+	return client, ecu
+
+def ccp_client (image: bytes,
+		bitrate: int | None = None,
+		timing: EcuTiming | None = None,
+		daq_list_sizes: list[int] | None = None,
+		event_channel_periods: dict[int, float] | None = None
+	) -> tuple[ccp.CcpProtocol, CcpEcu]:
+	hardware = VirtualCanHardware(bitrate=bitrate)
+	ecu = CcpEcu(image, CCP_BASE_ADDRESS, timing, cro_id=0x7E8, dto_id=0x7EA,
+		daq_list_sizes=daq_list_sizes,
+		event_channel_periods=event_channel_periods
+	).attach(hardware)
+
+	client = ccp.CcpProtocol(CcpOverCanTransport(hardware, tx_id=0x7E8, rx_id=0x7EA, crm_only=True))
+	client.transport.init()
+	client.execute(ccp.commands.Connect(station_address=0x01))
+	return client, ecu
+
+def summarize (samples_ns: list[int]) -> dict:
+	'''
+	Latency distribution of a list of samples, in microseconds
+	'''
+	samples = sorted(samples_ns)
+	return {
+		'samples': len(samples),
+		'mean_us': round(statistics.fmean(samples)/1000, 2),
+		'median_us': round(statistics.median(samples)/1000, 2),
+		'p99_us': round(samples[min(len(samples)-1, (len(samples)*99)//100)]/1000, 2),
+		'min_us': round(samples[0]/1000, 2),
+		'max_us': round(samples[-1]/1000, 2)
+	}
@@ -160,9 +160,10 @@ def main() -> None:
 
 	try:
 		while True:
-			frame = hardware.read(length=8)
-			entry_values[frame.identifier] = frame.data
-			
+			# drain everything the ECU sent since the last iteration in one call
+			for frame in hardware.read_many(max_frames=256):
+				entry_values[frame.identifier] = frame.data
+
 			formatted = ''
 			for k, v in entry_values.items():
 				formatted += ('{}: {}, '.format(hex(k), ' '.join([hex(x)[2:].zfill(2) for x in list(v)])))
@@ -13,6 +13,8 @@ from .hardware_abc import (
     SendingException,
     TimeoutException,
 )
-from .kline_hardware import KLineHardware
+from .kline_hardware import KLineHardware, KLineTiming
+from .socketcan_hardware import SocketCanHardware
+from .virtual_hardware import VirtualCanHardware, VirtualHardware, VirtualKLineHardware
 
-__all__ = ['CanFilter', 'CanHardware', 'HardwareABC', 'HardwareException', 'HardwarePort', 'KLineHardware', 'OpeningPortException', 'RawFrame', 'ReadingException', 'SendingException', 'TimeoutException']
+__all__ = ['CanFilter', 'CanHardware', 'HardwareABC', 'HardwareException', 'HardwarePort', 'KLineHardware', 'KLineTiming', 'OpeningPortException', 'RawFrame', 'ReadingException', 'SendingException', 'SocketCanHardware', 'TimeoutException', 'VirtualCanHardware', 'VirtualHardware', 'VirtualKLineHardware']
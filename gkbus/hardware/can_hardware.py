@@ -1,30 +1,14 @@
+import functools
 import os
 import time
 from dataclasses import dataclass
 from sys import platform
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
 
-from scapy.config import conf
 from typing_extensions import Self
 
-if platform.startswith('win32'):
-	conf.contribs['CANSocket'] = {'use-python-can': True}
-else:
-	# If you're a linux guest in a windows host, this will cause
-	# "no data received, try increasing stmin" issues, ranging 
-	# from occasional to very common.
-	# Best guess so far is that since python-can won't use the
-	# native ISO-TP kernel module, the issue must be closely related
-	# to some low level device access handling in the passthrough hypervisor
-	#
-	# Case in point used a Canable interface with Candlelight firmware,
-	# Ubuntu 22.04 (5.15.0 kernel) guest on a Windows 10 v1803 host, 
-	# through VMware Workstation 16
-	conf.contribs['CANSocket'] = {'use-python-can': False}
-
-from scapy.contrib.cansocket import CANSocket
-from scapy.error import Scapy_Exception
-from scapy.layers.can import CAN, CAN_MAX_DLEN, CAN_MTU
-
+from ..utils import monotonic_from_wall_clock_ns
 from .hardware_abc import (
 	HardwareABC,
 	HardwarePort,
@@ -33,7 +17,53 @@ from .hardware_abc import (
 	TimeoutException,
 )
 
-CAN_HEADER_LEN = CAN_MTU-CAN_MAX_DLEN
+if TYPE_CHECKING:
+	from scapy.packet import Packet
+
+CAN_HEADER_LEN = 8 # CAN_MTU-CAN_MAX_DLEN, struct can_frame header
+
+# from linux/can.h - not exposed by the socket module outside of Linux
+CAN_SFF_MASK = 0x7FF
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_EFF_FLAG = 0x80000000
+
+def scapy_timestamp (packet: 'Packet') -> int:
+	'''
+	Receive timestamp of a Scapy packet (seconds since the epoch) as a monotonic_ns() timestamp
+	'''
+	return monotonic_from_wall_clock_ns(int(packet.time*1000000000))
+
+@functools.cache
+def import_scapy_can () -> SimpleNamespace:
+	'''
+	Import Scapy CAN support on first use - Scapy takes a long time to import
+	and K-Line users don't need it at all. Scapy's configuration is set up
+	before the import, as CANSocket reads it at import time
+
+	:return: namespace with CANSocket, CAN and Scapy_Exception
+	'''
+	from scapy.config import conf
+
+	if platform.startswith('win32'):
+		conf.contribs['CANSocket'] = {'use-python-can': True}
+	else:
+		# If you're a linux guest in a windows host, this will cause
+		# "no data received, try increasing stmin" issues, ranging 
+		# from occasional to very common.
+		# Best guess so far is that since python-can won't use the
+		# native ISO-TP kernel module, the issue must be closely related
+		# to some low level device access handling in the passthrough hypervisor
+		#
+		# Case in point used a Canable interface with Candlelight firmware,
+		# Ubuntu 22.04 (5.15.0 kernel) guest on a Windows 10 v1803 host, 
+		# through VMware Workstation 16
+		conf.contribs['CANSocket'] = {'use-python-can': False}
+
+	from scapy.contrib.cansocket import CANSocket
+	from scapy.error import Scapy_Exception
+	from scapy.layers.can import CAN
+
+	return SimpleNamespace(CANSocket=CANSocket, CAN=CAN, Scapy_Exception=Scapy_Exception)
 
 @dataclass
 class CanFilter:
@@ -58,7 +88,15 @@ class CanHardware(HardwareABC):
 		filters = []
 		
 		for can_filter in self.filters:
-			filters.append({'can_id': can_filter.can_id, 'can_mask': can_filter.can_mask})
+			can_id, can_mask = can_filter.can_id, can_filter.can_mask
+			if can_id > CAN_SFF_MASK:
+				# the kernel compares CAN_EFF_FLAG too - without it in both the id and the mask,
+				# a 29 bit filter never matches. a standard 11 bit mask is widened to the whole id
+				if can_mask <= CAN_SFF_MASK:
+					can_mask = CAN_EFF_MASK
+				can_id |= CAN_EFF_FLAG
+				can_mask |= CAN_EFF_FLAG
+			filters.append({'can_id': can_id, 'can_mask': can_mask})
 
 		if len(filters) == 0:
 			filters = None
@@ -66,21 +104,23 @@ class CanHardware(HardwareABC):
 		return filters
 
 	def open (self) -> bool:
+		scapy = import_scapy_can()
+
 		try:
 			if platform.startswith("win32"):
-				self.socket = CANSocket(
+				self.socket = scapy.CANSocket(
 					bustype="pcan",
 					channel=self.port,
 					bitrate=self.bitrate,
 					#can_filters=self._build_filters()
 				)
 			else:
-				self.socket = CANSocket(
+				self.socket = scapy.CANSocket(
 					channel=self.port,
 					can_filters=self._build_filters()
 				)
 
-		except (OSError, Scapy_Exception) as e:
+		except (OSError, scapy.Scapy_Exception) as e:
 			raise OpeningPortException(e)
 
 		return True
@@ -97,10 +137,34 @@ class CanHardware(HardwareABC):
 		except IndexError:
 			raise TimeoutException
 
-		return RawFrame(identifier=packet.identifier, data=packet.data)
+		return RawFrame(identifier=packet.identifier, data=packet.data,
+			timestamp=scapy_timestamp(packet))
+
+	def read_many (self, max_frames: int, timeout: float | None = None) -> list[RawFrame]:
+		'''
+		Wait for the socket to become readable, then drain up to max_frames
+		frames that are already queued - without spinning up a sniffer per frame
+		'''
+		if not self.socket.select([self.socket], self.timeout if timeout is None else timeout):
+			raise TimeoutException
+
+		frames: list[RawFrame] = []
+		while len(frames) < max_frames:
+			packet = self.socket.recv()
+			if packet is not None:
+				frames.append(RawFrame(identifier=packet.identifier, data=packet.data,
+					timestamp=scapy_timestamp(packet)))
+
+			if not self.socket.select([self.socket], 0):
+				break
+
+		if len(frames) == 0:
+			raise TimeoutException
+
+		return frames
 
 	def write (self, frame: RawFrame) -> int:
-		packet = CAN(identifier=frame.identifier, data=frame.data)
+		packet = import_scapy_can().CAN(identifier=frame.identifier, data=frame.data)
 
 		bytes_written = self.socket.send(packet)
 
@@ -118,7 +182,8 @@ class CanHardware(HardwareABC):
 
 			for can_filter in filters:
 				if (can_id & can_filter['can_mask']) == (can_filter['can_id'] & can_filter['can_mask']):
-					return RawFrame(identifier=packet.identifier, data=packet.data)
+					return RawFrame(identifier=packet.identifier, data=packet.data,
+						timestamp=scapy_timestamp(packet))
 
 			if (time.time()-time_started) > timeout:
 				raise TimeoutException
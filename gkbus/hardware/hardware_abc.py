@@ -19,10 +19,21 @@ class ReadingException(HardwareException):
 class TimeoutException(ReadingException):
 	pass
 
-@dataclass
+@dataclass(slots=True)
 class RawFrame:
+	'''
+	Single frame as read from or written to the hardware port
+
+	:param identifier: Frame identifier - CAN ID, unused on K-Line
+	:param data: Frame payload
+	:param timestamp: Receive timestamp in nanoseconds, time.perf_counter_ns() clock
+		(see gkbus.utils.monotonic_ns()), taken as close to the wire as the hardware allows.
+		Kernel/hardware timestamps on CAN are converted from the wall clock when received.
+		0 if unknown, for example on outgoing frames
+	'''
 	identifier: int
 	data: bytes
+	timestamp: int = 0
 
 @dataclass
 class HardwarePort:
@@ -78,6 +89,28 @@ class HardwareABC(ABC):
 		'''
 		pass
 
+	def read_many (self, max_frames: int, timeout: float | None = None) -> list[RawFrame]:
+		'''
+		Read a batch of frames. Blocks until the first frame arrives, then collects
+		up to max_frames frames that are already waiting, without blocking any further.
+		Default implementation returns a single frame read with :py:meth:`read`
+
+		:param max_frames: maximum number of frames to return
+		:param timeout: how long to wait for the first frame, in seconds.
+			None - use hardware timeout
+		:return: list of read frames, never empty - TimeoutException is thrown if nothing arrived
+		:rtype: list[RawFrame]
+		'''
+		if timeout is None or timeout == self.get_timeout():
+			return [self.read(8)]
+
+		previous_timeout = self.get_timeout()
+		self.set_timeout(timeout)
+		try:
+			return [self.read(8)]
+		finally:
+			self.set_timeout(previous_timeout)
+
 	def write (self, data: RawFrame) -> int:
 		'''
 		Write to the port
@@ -1,10 +1,18 @@
+import array
+import json
 import logging
+import os
+import statistics
+import threading
 import time
+from collections import deque
+from dataclasses import dataclass
 
 import serial
 import serial.tools.list_ports
 from typing_extensions import Self
 
+from ..utils import ms_to_ns, ns_to_ms, sleep_until_ns
 from .hardware_abc import (
 	HardwareABC,
 	HardwarePort,
@@ -13,21 +21,128 @@ from .hardware_abc import (
 	TimeoutException,
 )
 
-from ..utils import ns_to_ms, ms_to_ns
-
 logger = logging.getLogger(__name__)
 
+TIOCGSERIAL, TIOCSSERIAL = 0x541E, 0x541F
+ASYNC_LOW_LATENCY = 0x2000
+SERIAL_STRUCT_FLAGS = 4 # index of the flags field in struct serial_struct, read as an array of ints
+
+# suggested calibration_file, nothing is stored unless it's passed to KLineHardware
+CALIBRATION_FILE = os.path.join(
+	os.path.expanduser('~'), '.config', 'gkbus', 'kline_calibration.json'
+)
+
+@dataclass(slots=True)
+class KLineTiming:
+	'''
+	ISO 14230 timing parameters, defaults are the ISO 14230-2 normal timing. All values in seconds
+
+	:param p2min: minimum time between the end of a request and the start of the response
+	:param p2max: maximum time between the end of a request and the start of the response
+	:param p3min: minimum time between the end of a response and the next request
+	:param p3max: maximum time between the end of a response and the next request
+	:param p4min: minimum time between bytes of a request
+	'''
+	p2min: float = 0.025
+	p2max: float = 0.05
+	p3min: float = 0.055
+	p3max: float = 5
+	p4min: float = 0.005
+
+	@classmethod
+	def from_bytes (cls, data: bytes) -> Self:
+		'''
+		Decode timing parameters as sent by the ECU in response to AccessTimingParameters -
+		the five bytes following the timing parameter identifier:
+
+			request = commands.AccessTimingParameters().read_currently_active_timing_parameters()
+			response = kwp.execute(request)
+			hardware.set_timing(KLineTiming.from_bytes(response.get_data()[1:]))
+		'''
+		if len(data) < 5:
+			raise ValueError('Timing parameters are 5 bytes long, got {}'.format(len(data)))
+		return cls(
+			p2min=data[0]*0.0005, p2max=data[1]*0.025,
+			p3min=data[2]*0.0005, p3max=data[3]*0.25,
+			p4min=data[4]*0.0005
+		)
+
+	def to_bytes (self) -> bytes:
+		'''
+		Encode for AccessTimingParameters.set_timing_parameters_to_given_values(*timing.to_bytes())
+		'''
+		return bytes([
+			min(round(self.p2min/0.0005), 0xFF),
+			min(round(self.p2max/0.025), 0xFF),
+			min(round(self.p3min/0.0005), 0xFF),
+			min(round(self.p3max/0.25), 0xFF),
+			min(round(self.p4min/0.0005), 0xFF)
+		])
+
 class KLineHardware(HardwareABC):
 	'''
 	Hardware class for serial devices, using pyserial as a backend
+
+	Requests are not sent earlier than P3min after the last byte seen on the bus.
+	The wait is the remainder of P3min, not a fixed delay - if the application took
+	longer than that to issue the next request, it's sent immediately
+
+	In buffered mode a background thread reads whatever the adapter receives into
+	an in-memory buffer and strips the echo of transmitted requests on the fly.
+	write() returns as soon as the request is handed over to the driver, reads are served
+	from the buffer - there's no polling for the transmission to finish, and no syscalls
+	when the transport reads a frame header and its body separately
+
+	FastInit timing is corrected by the adapter's latency in toggling the break condition,
+	measured with calibrate(). calibrate(save=True) stores it per adapter in calibration_file,
+	load_calibration() applies the stored offset - nothing is read or written otherwise
+
+	Low latency mode (Linux only) sets ASYNC_LOW_LATENCY on the port and the latency
+	timer of USB serial adapters (FTDI, 16ms by default) to 1ms, so received bytes are
+	passed on right away instead of being held back by the adapter or the driver.
+	Writing the latency timer requires write access to sysfs.
+	Original settings are restored on close()
+
+	:param timing: ISO 14230 timing parameters, ISO 14230-2 defaults if not given
+	:param buffered: read through a background reader thread
+	:param calibration_file: JSON file with FastInit offsets of calibrated adapters, i.e.
+		CALIBRATION_FILE. None - offsets can't be stored or loaded
+	:param low_latency: enable low latency mode when opening the port
 	'''
 
-	def __init__ (self, port: str, baudrate: int = 10400, timeout: float = 2) -> None:
+	READER_POLL_INTERVAL = 0.05 # how often the reader thread checks whether it should stop, seconds
+
+	def __init__ (self,
+			port: str,
+			baudrate: int = 10400,
+			timeout: float = 2,
+			timing: KLineTiming | None = None,
+			buffered: bool = False,
+			calibration_file: str | None = None,
+			low_latency: bool = False
+		) -> None:
 		self.port, self.baudrate = port, baudrate
 		self.timeout = timeout
+		self.timing: KLineTiming = timing or KLineTiming()
+		self.buffered = buffered
+		self.calibration_file = calibration_file
+		self.timing_offset_ms: float = 0
+		self.low_latency = low_latency
+		self._original_async_low_latency: bool | None = None
+		self._original_latency_timer: str | None = None
 		self._port_opened = False
+		self._bus_idle_since: int = 0 # time.perf_counter_ns() of the last byte seen on the bus
 		self.socket: serial.Serial = None
 
+		self._rx_condition = threading.Condition()
+		self._rx_chunks: deque[tuple[bytes, int]] = deque() # (data, receive timestamp)
+		self._rx_length: int = 0
+		self._echo_pending: bytes = bytes()
+		self._echo_received: bytes = bytes()
+		self._echo_expected: bytes = bytes()
+		self._reader_thread: threading.Thread | None = None
+		self._reader_stop = threading.Event()
+
 	def open (self) -> bool:
 		try:
 			self.socket = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
@@ -38,29 +153,174 @@ class KLineHardware(HardwareABC):
 		self._reset_adapter()
 		self._set_kline_mode()
 
+		if self.low_latency:
+			self._enable_low_latency()
+
+		if self.buffered:
+			self._start_reader()
+
 		return True
 
+	def _start_reader (self) -> None:
+		self.socket.timeout = self.READER_POLL_INTERVAL
+		self._reader_stop.clear()
+		self._reader_thread = threading.Thread(target=self._reader, daemon=True)
+		self._reader_thread.start()
+
+	def _stop_reader (self) -> None:
+		if self._reader_thread is None:
+			return
+		self._reader_stop.set()
+		self._reader_thread.join()
+		self._reader_thread = None
+
+	def _reader (self) -> None:
+		'''
+		Reader thread: move everything the adapter receives to the buffer, minus the echo
+		'''
+		while not self._reader_stop.is_set():
+			try:
+				data = self.socket.read(self.socket.in_waiting or 1)
+			except (serial.serialutil.SerialException, OSError) as e:
+				logger.error('K-Line reader stopped: {}'.format(e))
+				return
+
+			if not data:
+				continue
+
+			timestamp = time.perf_counter_ns()
+
+			with self._rx_condition:
+				if self._echo_pending:
+					data = self._strip_echo(data)
+
+				if data:
+					self._rx_chunks.append((data, timestamp))
+					self._rx_length += len(data)
+
+				self._bus_idle_since = timestamp
+				self._rx_condition.notify_all()
+
+	def _strip_echo (self, data: bytes) -> bytes:
+		'''
+		Drop the echo of the last request from the beginning of received data.
+		Call with _rx_condition held
+		'''
+		count = min(len(self._echo_pending), len(data))
+		self._echo_received += data[:count]
+		self._echo_pending = self._echo_pending[count:]
+
+		if not self._echo_pending and self._echo_received != self._echo_expected:
+			logger.error('K-Line echo different than sent payload! \nPayload: {}\nEcho: {}'.format(
+				' '.join([hex(x) for x in list(self._echo_expected)]),
+				' '.join([hex(x) for x in list(self._echo_received)])
+			))
+
+		return data[count:]
+
+	def _read_buffered (self,
+			length: int | None,
+			timeout: float,
+			partial: bool = False
+		) -> RawFrame:
+		'''
+		Take bytes from the buffer, waiting up to timeout seconds for them to arrive
+
+		:param length: number of bytes, None - everything buffered, at least one byte
+		:param partial: return what arrived within the timeout instead of raising TimeoutException
+		'''
+		deadline = time.monotonic() + timeout
+
+		with self._rx_condition:
+			while self._rx_length < (length or 1):
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					break
+				self._rx_condition.wait(remaining)
+
+			length = length or self._rx_length
+			timestamp = self._rx_chunks[0][1] if self._rx_chunks else time.perf_counter_ns()
+			message = bytearray()
+
+			while len(message) < length and self._rx_chunks:
+				chunk, chunk_timestamp = self._rx_chunks.popleft()
+				needed = length - len(message)
+				if len(chunk) > needed:
+					self._rx_chunks.appendleft((chunk[needed:], chunk_timestamp))
+					chunk = chunk[:needed]
+				message += chunk
+
+			self._rx_length -= len(message)
+
+		if (len(message) < length or not message) and not partial:
+			raise TimeoutException
+
+		return RawFrame(identifier=False, data=bytes(message), timestamp=timestamp)
+
+	def _clear_buffer (self) -> None:
+		with self._rx_condition:
+			self._rx_chunks.clear()
+			self._rx_length = 0
+
 	def read (self, length: int) -> RawFrame:
+		if self.buffered:
+			return self._read_buffered(length, self.timeout)
+
 		message = self.socket.read(length)
+		timestamp = self._bus_idle_since = time.perf_counter_ns()
 
 		if (len(message) < length):
 			raise TimeoutException
 
-		return RawFrame(identifier=False, data=message)
+		return RawFrame(identifier=False, data=message, timestamp=timestamp)
+
+	def read_many (self, max_frames: int, timeout: float | None = None) -> list[RawFrame]:
+		'''
+		Block for the first byte, then drain everything waiting in the input buffer in one read.
+		K-Line has no frame boundaries at this level, so the batch always consists
+		of a single frame holding all the bytes received so far - max_frames is ignored
+		'''
+		if self.buffered:
+			return [self._read_buffered(None, self.timeout if timeout is None else timeout)]
+
+		if timeout is not None and timeout != self.timeout:
+			self.socket.timeout = timeout
+
+		try:
+			message = self.socket.read(1)
+		finally:
+			if timeout is not None and timeout != self.timeout:
+				self.socket.timeout = self.timeout
+
+		timestamp = time.perf_counter_ns()
+
+		if len(message) < 1:
+			raise TimeoutException
+
+		waiting = self.socket.in_waiting
+		if waiting > 0:
+			message += self.socket.read(waiting)
+		self._bus_idle_since = time.perf_counter_ns()
+
+		return [RawFrame(identifier=False, data=message, timestamp=timestamp)]
 
 	def write (self, frame: RawFrame) -> int:
-		# @todo - this timeout is needed for now, otherwise 
-		# we'll get a timeout when trying to start diagnostic session
-		# find out _why_ is it needed - some magic value instead 
-		# of something calculated shouldnt be required here
-		time.sleep((50/1000)*2)
+		self._wait_p3min()
 		data = frame.data
-		bytes_written = self.socket.write(data)
+
+		if self.buffered:
+			with self._rx_condition:
+				self._echo_pending = self._echo_expected = bytes(data)
+				self._echo_received = bytes()
+			return int(self.socket.write(data))
+
+		bytes_written = int(self.socket.write(data))
 
 		while self.socket.out_waiting > 0:
 			time.sleep(0.001)
 
 		echo = self.socket.read(bytes_written)
+		self._bus_idle_since = time.perf_counter_ns()
 		if (echo != data):
 			logger.error('K-Line echo different than sent payload! \nPayload: {}\nEcho: {}'.format(
 				' '.join([hex(x) for x in list(data)]),
@@ -73,6 +333,9 @@ class KLineHardware(HardwareABC):
 		if not self.is_open():
 			logger.info('Tried to close an already closed port')
 			return # should this be an exception?
+		self._stop_reader()
+		self._clear_buffer()
+		self._restore_latency()
 		try:
 			self.socket.break_condition = False
 			self.socket.reset_input_buffer()
@@ -91,8 +354,37 @@ class KLineHardware(HardwareABC):
 
 		self._port_opened = False
 
+	def set_timing (self, timing: KLineTiming) -> Self:
+		'''
+		Apply timing parameters, i.e. after changing them with AccessTimingParameters
+		'''
+		self.timing = timing
+		return self
+
+	def get_timing (self) -> KLineTiming:
+		return self.timing
+
+	def _wait_p3min (self) -> None:
+		'''
+		Sleep for whatever is left of P3min since the last byte seen on the bus
+		'''
+		if self._echo_pending:
+			with self._rx_condition: # the previous request is still being transmitted
+				self._rx_condition.wait_for(lambda: not self._echo_pending, self.timeout)
+				if self._echo_pending:
+					logger.warning(
+						'K-Line echo of the previous request incomplete, got {} bytes'.format(
+							len(self._echo_received)))
+					self._echo_pending = bytes()
+
+		p3min_ns = int(self.timing.p3min*1000000000)
+		remaining = self._bus_idle_since + p3min_ns - time.perf_counter_ns()
+		if remaining > 0:
+			time.sleep(remaining/1000000000)
+
 	def set_timeout (self, timeout: float) -> Self:
-		self.socket.timeout = timeout
+		if not self.buffered: # in buffered mode, socket timeout belongs to the reader thread
+			self.socket.timeout = timeout
 		self.timeout = timeout
 		return self
 
@@ -121,15 +413,27 @@ class KLineHardware(HardwareABC):
 		self.socket.setRTS(0)
 		time.sleep(0.1)
 
-	def iso14230_fast_init (self, payload: bytes, timing_offset_ms: int = 0) -> tuple[bytes, int, int]:
+	def iso14230_fast_init (self,
+			payload: bytes,
+			timing_offset_ms: float | None = None
+		) -> tuple[bytes, int, int]:
 		'''
 		Perform FastInit by bringing the bus down for 25ms and then up for 25ms followed by a payload
 
+		:param timing_offset_ms: shorten both periods by this many miliseconds, to make up for
+			the adapter's latency. None - use the calibrated offset, see calibrate()
 		:return: input buffer contents (up to 40 bytes), elapsed time in low position (ms), elapsed time in high position (ms)
 		'''
+		if timing_offset_ms is None:
+			timing_offset_ms = self.timing_offset_ms
 
 		fastinit_time = ms_to_ns(25-timing_offset_ms)
 
+		if self.buffered:
+			with self._rx_condition: # reentrant, _clear_buffer() takes it too
+				self._clear_buffer()
+				self._echo_pending = bytes()
+
 		# FastInit low
 		self.socket.break_condition = True
 		start_time = time.perf_counter_ns()
@@ -139,9 +443,7 @@ class KLineHardware(HardwareABC):
 		# any issue, it'll be removed completely
 		#self.socket.flush()  # Ensure the break is sent immediately
 
-		while (time.perf_counter_ns() - start_time) < fastinit_time:
-			pass  # Busy-wait until 25 ms has passed
-		elapsed_time_low = time.perf_counter_ns() - start_time
+		elapsed_time_low = sleep_until_ns(start_time + fastinit_time) - start_time
 
 		# FastInit high
 		self.socket.break_condition = False
@@ -152,9 +454,7 @@ class KLineHardware(HardwareABC):
 		# any issue, it'll be removed completely
 		#self.socket.flush()  # Ensure the break is sent immediately
 
-		while (time.perf_counter_ns() - start_time) < fastinit_time:
-			pass  # Busy-wait until 25 ms has passed
-		elapsed_time_high = time.perf_counter_ns() - start_time
+		elapsed_time_high = sleep_until_ns(start_time + fastinit_time) - start_time
 		
 		self.socket.write(bytes(payload))
 
@@ -177,10 +477,175 @@ class KLineHardware(HardwareABC):
 		Is this the perfect solution? Probably not, but we're dealing with non-perfect
 		hardware, and we want to support all of it.
 		'''
-		response = self.socket.read(40)
+		if self.buffered:
+			response = self._read_buffered(40, self.timeout, partial=True).data
+		else:
+			response = self.socket.read(40)
+		self._bus_idle_since = time.perf_counter_ns()
 
 		return response, ns_to_ms(elapsed_time_low), ns_to_ms(elapsed_time_high)
 
+	def _latency_timer_path (self) -> str:
+		device = os.path.basename(os.path.realpath(self.port))
+		return '/sys/bus/usb-serial/devices/{}/latency_timer'.format(device)
+
+	def _set_async_low_latency (self, enabled: bool) -> bool:
+		'''
+		Set ASYNC_LOW_LATENCY serial flag
+
+		:return: previous state of the flag
+		'''
+		import fcntl
+
+		serial_struct = array.array('i', [0]*32)
+		fcntl.ioctl(self.socket.fileno(), TIOCGSERIAL, serial_struct)
+		previous = bool(serial_struct[SERIAL_STRUCT_FLAGS] & ASYNC_LOW_LATENCY)
+
+		if enabled:
+			serial_struct[SERIAL_STRUCT_FLAGS] |= ASYNC_LOW_LATENCY
+		else:
+			serial_struct[SERIAL_STRUCT_FLAGS] &= ~ASYNC_LOW_LATENCY
+		fcntl.ioctl(self.socket.fileno(), TIOCSSERIAL, serial_struct)
+
+		return previous
+
+	def _enable_low_latency (self) -> None:
+		try:
+			self._original_async_low_latency = self._set_async_low_latency(True)
+		except (ImportError, OSError, AttributeError) as e:
+			logger.warning('Couldn\'t set ASYNC_LOW_LATENCY on {}: {}'.format(self.port, e))
+
+		try:
+			with open(self._latency_timer_path(), 'r') as f:
+				original = f.read().strip()
+			with open(self._latency_timer_path(), 'w') as f:
+				f.write('1')
+			self._original_latency_timer = original
+			logger.debug('Latency timer of {} lowered from {}ms to 1ms'.format(
+				self.port, self._original_latency_timer))
+		except FileNotFoundError:
+			pass # not an USB serial adapter, or one without a latency timer
+		except OSError as e:
+			logger.warning('Couldn\'t set latency timer of {}: {}'.format(self.port, e))
+
+	def _restore_latency (self) -> None:
+		if self._original_async_low_latency is not None:
+			try:
+				self._set_async_low_latency(self._original_async_low_latency)
+			except (ImportError, OSError, AttributeError) as e:
+				logger.warning('Couldn\'t restore ASYNC_LOW_LATENCY on {}: {}'.format(self.port, e))
+			self._original_async_low_latency = None
+
+		if self._original_latency_timer is not None:
+			try:
+				with open(self._latency_timer_path(), 'w') as f:
+					f.write(self._original_latency_timer)
+			except OSError as e:
+				logger.warning('Couldn\'t restore latency timer of {}: {}'.format(self.port, e))
+			self._original_latency_timer = None
+
+	def measure_echo_latency (self, samples: int = 20, byte: int = 0x55) -> float:
+		'''
+		Effective byte latency of the adapter: time between writing a single byte and
+		receiving its echo back, including transmitting it at the current baudrate.
+		Use it to compare adapters or settings, i.e. before and after enabling low latency mode.
+		The bytes do go out on the bus - measure with the ECU disconnected or before initializing it
+
+		:return: median latency, miliseconds
+		'''
+		latencies = []
+		for _ in range(samples):
+			started = time.perf_counter_ns()
+
+			if self.buffered:
+				with self._rx_condition:
+					self._echo_pending = self._echo_expected = bytes([byte])
+					self._echo_received = bytes()
+				self.socket.write(bytes([byte]))
+				with self._rx_condition:
+					echoed = self._rx_condition.wait_for(
+						lambda: not self._echo_pending, self.timeout)
+					if not echoed:
+						self._echo_pending = bytes()
+						raise TimeoutException
+			elif len(self.socket.read(self.socket.write(bytes([byte])))) < 1:
+				raise TimeoutException
+
+			latencies.append(time.perf_counter_ns() - started)
+			time.sleep(self.timing.p4min)
+
+		return round(statistics.median(latencies) / 1000000, 3)
+
+	def adapter_id (self) -> str:
+		'''
+		Identify the adapter plugged into the port: USB VID:PID and serial number if available,
+		port name otherwise. Scans the serial ports, called for calibration only
+		'''
+		for port in serial.tools.list_ports.comports():
+			if port.device == self.port and port.vid is not None:
+				return '{:04x}:{:04x}:{}'.format(port.vid, port.pid, port.serial_number or '')
+		return self.port
+
+	def calibrate (self, samples: int = 20, save: bool = False) -> float:
+		'''
+		Measure how long the adapter takes to apply a break condition change and use it as
+		the FastInit timing offset. The break is only cleared while measuring (the line is
+		idle already), so this won't wake up or disturb anything connected to the bus.
+
+		This is an approximation: what's measured is how long the driver call (ioctl or USB
+		request) takes to return, not when the line actually changes level - that would take
+		sending a real break and timing its echo. It covers the usual USB round trip, not
+		delays inside the adapter after it acknowledged the request
+
+		:param samples: number of measurements, the median is used
+		:param save: store the offset in calibration_file for this adapter, see load_calibration()
+		:return: FastInit timing offset, miliseconds
+		'''
+		durations = []
+		for _ in range(samples):
+			started = time.perf_counter_ns()
+			self.socket.break_condition = False
+			durations.append(time.perf_counter_ns() - started)
+
+		self.timing_offset_ms = round(statistics.median(durations) / 1000000, 2)
+		logger.info('{}: break condition latency {}ms'.format(self.port, self.timing_offset_ms))
+
+		if save and self.calibration_file:
+			calibration = self._read_calibration_file()
+			calibration[self.adapter_id()] = self.timing_offset_ms
+			os.makedirs(os.path.dirname(self.calibration_file), exist_ok=True)
+			with open(self.calibration_file, 'w') as f:
+				json.dump(calibration, f, indent=4)
+
+		return self.timing_offset_ms
+
+	def load_calibration (self) -> float | None:
+		'''
+		Apply the FastInit offset stored for this adapter by calibrate(save=True)
+
+		:return: the offset, miliseconds. None if none is stored, the offset is left as it is then
+		'''
+		calibration = self._read_calibration_file().get(self.adapter_id())
+		if calibration is not None:
+			self.timing_offset_ms = calibration
+			logger.debug('Using FastInit offset of {}ms for {}'.format(calibration, self.port))
+		return calibration
+
+	def _read_calibration_file (self) -> dict[str, float]:
+		if not self.calibration_file:
+			return {}
+		try:
+			with open(self.calibration_file, 'r') as f:
+				calibrations: dict[str, float] = json.load(f)
+				return calibrations
+		except FileNotFoundError:
+			return {}
+		except (OSError, ValueError) as e:
+			logger.warning('Couldn\'t load FastInit calibration from {}: {}'.format(
+				self.calibration_file, e
+			))
+			return {}
+
 	@staticmethod
 	def available_ports () -> list[HardwarePort]:
 		devices = []
@@ -0,0 +1,179 @@
+import socket
+import struct
+
+from typing_extensions import Self
+
+from ..utils import monotonic_from_wall_clock_ns, monotonic_ns
+from .can_hardware import CanFilter, CanHardware
+from .hardware_abc import OpeningPortException, RawFrame, TimeoutException
+
+# struct can_frame from linux/can.h: 32 bit can_id, 8 bit dlc, 3 bytes of padding, 8 bytes of data
+CAN_FRAME = struct.Struct('=IB3x8s')
+
+# from linux/socket.h, linux/net_tstamp.h - not always exposed by the socket module
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+SO_TIMESTAMPING = 37
+SOF_TIMESTAMPING_RX_HARDWARE = 1 << 2
+SOF_TIMESTAMPING_RX_SOFTWARE = 1 << 3
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+SOF_TIMESTAMPING_RAW_HARDWARE = 1 << 6
+
+# struct timespec. SO_TIMESTAMPING delivers three of them: software, legacy and raw hardware
+TIMESPEC = struct.Struct('@ll')
+SCM_TIMESTAMPING = struct.Struct('@llllll')
+
+class SocketCanHardware(CanHardware):
+	'''
+	Hardware class for CAN Bus interfaces. Uses a native Linux SocketCAN
+	raw socket (AF_CAN/SOCK_RAW) as a backend, bypassing Scapy completely -
+	frames are unpacked from struct can_frame straight into RawFrame.
+	Filters are applied in the kernel with CAN_RAW_FILTER.
+
+	Every frame is stamped by the kernel on reception (SO_TIMESTAMPNS), or by the
+	interface itself if hardware_timestamps is enabled and the driver supports it.
+
+	Linux only. Can be tested against a virtual interface:
+
+	.. code-block:: console
+
+		$ ip link add dev vcan0 type vcan && ip link set up vcan0
+
+	:param filters: list of CanFilter objects, applied as CAN_RAW_FILTER
+	:param hardware_timestamps: request SO_TIMESTAMPING hardware timestamps,
+		falling back to software ones if the interface doesn't provide them
+	'''
+
+	def __init__ (self,
+			port: str,
+			timeout: int = 1,
+			filters: list[CanFilter] | None = None,
+			bitrate: int = 500000,
+			hardware_timestamps: bool = False
+		) -> None:
+		super().__init__(port, timeout, filters, bitrate)
+		self.hardware_timestamps: bool = hardware_timestamps
+
+	def open (self) -> bool:
+		try:
+			self.socket = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+			self._apply_filters()
+			self._enable_timestamps()
+			self.socket.bind((self.port,))
+			self.socket.settimeout(self.timeout)
+		# AttributeError - AF_CAN is not available on this platform
+		except (OSError, AttributeError) as e:
+			raise OpeningPortException(e)
+
+		return True
+
+	def is_open (self) -> bool:
+		try:
+			return self.socket.fileno() != -1
+		except AttributeError:
+			return False
+
+	def _apply_filters (self) -> None:
+		'''
+		Apply CAN_RAW_FILTER on the socket. With no filters set,
+		a single catch-all filter is installed so that all frames are received
+		'''
+		filters = self._build_filters() or [{'can_id': 0, 'can_mask': 0}]
+		packed = b''.join([struct.pack('=II', x['can_id'], x['can_mask']) for x in filters])
+		self.socket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER, packed)
+
+	def _enable_timestamps (self) -> None:
+		if self.hardware_timestamps:
+			self.socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPING,
+				SOF_TIMESTAMPING_RX_HARDWARE | SOF_TIMESTAMPING_RAW_HARDWARE
+				| SOF_TIMESTAMPING_RX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE
+			)
+			self._ancillary_size = socket.CMSG_SPACE(SCM_TIMESTAMPING.size)
+		else:
+			self.socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+			self._ancillary_size = socket.CMSG_SPACE(TIMESPEC.size)
+
+	def read (self, length: int) -> RawFrame:
+		try:
+			message = self.socket.recvmsg(CAN_FRAME.size, self._ancillary_size)
+		except socket.timeout:
+			raise TimeoutException
+
+		return self._unpack_message(message)
+
+	def read_many (self, max_frames: int, timeout: float | None = None) -> list[RawFrame]:
+		'''
+		Block for the first frame, then switch the socket to non-blocking mode and drain
+		frames already queued in it until it's empty or max_frames is reached
+		'''
+		recvmsg, unpack_message = self.socket.recvmsg, self._unpack_message
+		ancillary_size = self._ancillary_size
+
+		try:
+			if timeout is not None:
+				self.socket.settimeout(timeout)
+			frames = [unpack_message(recvmsg(CAN_FRAME.size, ancillary_size))]
+
+			self.socket.settimeout(0.0)
+			while len(frames) < max_frames:
+				frames.append(unpack_message(recvmsg(CAN_FRAME.size, ancillary_size)))
+		except BlockingIOError:
+			pass
+		except socket.timeout:
+			raise TimeoutException
+		finally:
+			self.socket.settimeout(self.timeout)
+
+		return frames
+
+	@staticmethod
+	def _unpack_message (message: tuple[bytes, list, int, tuple]) -> RawFrame:
+		'''
+		Unpack the result of recvmsg() - struct can_frame and the timestamp from ancillary data
+		'''
+		frame, ancillary_data, _flags, _address = message
+		can_id, dlc, data = CAN_FRAME.unpack(frame)
+
+		if can_id & socket.CAN_EFF_FLAG:
+			identifier = can_id & socket.CAN_EFF_MASK
+		else:
+			identifier = can_id & socket.CAN_SFF_MASK
+
+		timestamp = 0
+		for _level, kind, value in ancillary_data:
+			if kind == SO_TIMESTAMPNS:
+				seconds, nanoseconds = TIMESPEC.unpack_from(value)
+			elif kind == SO_TIMESTAMPING:
+				timestamps = SCM_TIMESTAMPING.unpack_from(value)
+				# prefer raw hardware timestamp, if the driver didn't fill it - the software one
+				seconds, nanoseconds = timestamps[4:6] if any(timestamps[4:6]) else timestamps[0:2]
+			else:
+				continue
+			timestamp = monotonic_from_wall_clock_ns(seconds*1000000000 + nanoseconds)
+
+		return RawFrame(identifier=identifier, data=data[:dlc],
+			timestamp=timestamp or monotonic_ns())
+
+	def write (self, frame: RawFrame) -> int:
+		can_id = frame.identifier
+		if can_id > socket.CAN_SFF_MASK:
+			can_id |= socket.CAN_EFF_FLAG
+
+		self.socket.send(CAN_FRAME.pack(can_id, len(frame.data), bytes(frame.data)))
+
+		return len(frame.data)
+
+	def set_filters (self, filters: list[CanFilter]) -> Self:
+		'''
+		Replace hardware canbus id filters.
+		Unlike the Scapy backend, filters are swapped on the open socket without a restart
+		'''
+		self.filters = filters
+		if self.is_open():
+			self._apply_filters()
+		return self
+
+	def set_timeout (self, timeout: float) -> Self:
+		self.timeout = timeout
+		if self.is_open():
+			self.socket.settimeout(timeout)
+		return self
@@ -0,0 +1,295 @@
+import queue
+import time
+from typing import Callable, Iterable
+
+from typing_extensions import Self
+
+from .can_hardware import CanFilter
+from .hardware_abc import HardwareABC, HardwarePort, RawFrame, TimeoutException
+
+Responder = Callable[[RawFrame], Iterable[RawFrame] | None]
+
+class VirtualHardware(HardwareABC):
+	'''
+	In-process hardware, not connected to any physical bus. Every written frame
+	is handed over to the responder callback, frames it returns are queued for reading.
+	Frames can also be queued directly with :py:meth:`inject`, for example to emulate
+	a DAQ stream or an ECU answering with a delay.
+
+	The receive queue is a :py:class:`queue.SimpleQueue` - appends and pops don't
+	contend on a Python level lock, so the virtual bus costs next to nothing compared to
+	the library code being exercised. Bus timing is only emulated when asked for.
+
+	:param port: free-form name of the virtual port
+	:param responder: callable receiving every written frame and returning frames
+		to be received in response (or None)
+	:param latency: seconds between a write and its responses becoming readable
+	:param bitrate: emulated bus speed in bits per second - frames become readable only
+		after the time needed to transmit them passed. None - infinitely fast bus
+	'''
+
+	def __init__ (self,
+			port: str = 'virtual',
+			timeout: float = 1,
+			responder: Responder | None = None,
+			latency: float = 0,
+			bitrate: int | None = None
+		) -> None:
+		self.port: str = port
+		self.timeout: float = timeout
+		self.responder: Responder | None = responder
+		self.latency: float = latency
+		self.bitrate: int | None = bitrate
+		self._port_opened: bool = False
+		self._rx_queue: queue.SimpleQueue = queue.SimpleQueue()
+		self._rx_pending: tuple[int, RawFrame] | None = None # popped, but not yet arrived
+		self._bus_free_at: int = 0
+
+	def open (self) -> bool:
+		self._port_opened = True
+		return True
+
+	def close (self) -> None:
+		self._port_opened = False
+
+	def set_responder (self, responder: Responder | None) -> Self:
+		'''
+		Replace the callable answering written frames
+		'''
+		self.responder = responder
+		return self
+
+	def set_timeout (self, timeout: float) -> Self:
+		self.timeout = timeout
+		return self
+
+	def set_baudrate (self, baudrate: int) -> Self:
+		self.bitrate = baudrate
+		return self
+
+	def get_baudrate (self) -> int:
+		'''
+		:return: emulated bitrate, 0 - infinitely fast bus
+		'''
+		return self.bitrate or 0
+
+	def frame_bits (self, frame: RawFrame) -> int:
+		'''
+		Number of bits needed to transmit the frame on the emulated bus
+		'''
+		return len(frame.data)*8
+
+	def inject (self, frame: RawFrame, delay: float = 0) -> Self:
+		'''
+		Queue a frame for reading, as if it was received from the bus
+
+		:param frame: frame to be received
+		:param delay: seconds until the frame arrives, on top of the emulated transmission time
+		'''
+		available_at = 0
+		if delay or self.latency or self.bitrate:
+			available_at = time.perf_counter_ns() + int((delay+self.latency)*1000000000)
+			available_at = max(available_at, self._bus_free_at)
+			if self.bitrate:
+				available_at += (self.frame_bits(frame)*1000000000)//self.bitrate
+			self._bus_free_at = available_at
+
+		self._rx_queue.put((available_at, frame))
+		return self
+
+	def write (self, frame: RawFrame) -> int:
+		if self.bitrate:
+			# the bus stays busy while our own frame is being transmitted
+			transmission_ns = (self.frame_bits(frame)*1000000000)//self.bitrate
+			self._bus_free_at = max(time.perf_counter_ns(), self._bus_free_at) + transmission_ns
+
+		if self.responder is not None:
+			for response in (self.responder(frame) or []):
+				self.inject(response)
+
+		return len(frame.data)
+
+	def _get (self, timeout: float | None) -> RawFrame:
+		'''
+		Pop the next frame from the receive queue, waiting until its emulated arrival time
+		'''
+		if self._rx_pending is not None:
+			(available_at, frame), self._rx_pending = self._rx_pending, None
+		else:
+			try:
+				available_at, frame = self._rx_queue.get(timeout=timeout)
+			except queue.Empty:
+				raise TimeoutException
+
+		if available_at:
+			remaining = available_at - time.perf_counter_ns()
+			if remaining > 0:
+				time.sleep(remaining/1000000000)
+
+		return RawFrame(identifier=frame.identifier, data=frame.data,
+			timestamp=time.perf_counter_ns())
+
+	def _get_arrived (self) -> RawFrame | None:
+		'''
+		Pop the next frame only if its emulated arrival time already passed, never waits
+
+		:return: the frame, None if the queue is empty or the next frame is still on the bus
+		'''
+		if self._rx_pending is not None:
+			available_at, frame = self._rx_pending
+		else:
+			try:
+				available_at, frame = self._rx_queue.get_nowait()
+			except queue.Empty:
+				return None
+
+		if available_at and available_at > time.perf_counter_ns():
+			self._rx_pending = (available_at, frame)
+			return None
+
+		self._rx_pending = None
+		return RawFrame(identifier=frame.identifier, data=frame.data,
+			timestamp=time.perf_counter_ns())
+
+	def read (self, length: int) -> RawFrame:
+		return self._get(self.timeout)
+
+	def read_many (self, max_frames: int, timeout: float | None = None) -> list[RawFrame]:
+		frames = [self._get(self.timeout if timeout is None else timeout)]
+
+		while len(frames) < max_frames and (frame := self._get_arrived()) is not None:
+			frames.append(frame)
+
+		return frames
+
+	def flush (self) -> Self:
+		'''
+		Drop all frames waiting in the receive queue
+		'''
+		self._rx_queue = queue.SimpleQueue()
+		self._rx_pending = None
+		return self
+
+	@staticmethod
+	def available_ports () -> list[HardwarePort]:
+		return [HardwarePort(port='virtual', port_name='virtual')]
+
+class VirtualCanHardware(VirtualHardware):
+	'''
+	Virtual CAN interface. Frames are delivered whole, as on a real CAN bus,
+	and incoming frames not matching the CanFilter list are dropped - just like
+	hardware filters would drop them
+
+	:param filters: list of CanFilter objects
+	:param bitrate: emulated CAN bitrate, for example 500000. None - infinitely fast bus
+	'''
+
+	def __init__ (self,
+			port: str = 'vcan',
+			timeout: float = 1,
+			filters: list[CanFilter] | None = None,
+			responder: Responder | None = None,
+			latency: float = 0,
+			bitrate: int | None = None
+		) -> None:
+		super().__init__(port, timeout, responder, latency, bitrate)
+		self.filters: list[CanFilter] = filters if filters is not None else []
+
+	def get_filters (self) -> list[CanFilter]:
+		return self.filters
+
+	def set_filters (self, filters: list[CanFilter]) -> Self:
+		self.filters = filters
+		return self
+
+	def add_filter (self, can_filter: CanFilter) -> Self:
+		return self.set_filters([*self.get_filters(), can_filter])
+
+	def frame_bits (self, frame: RawFrame) -> int:
+		'''
+		Standard 11 bit identifier frame: 44 bits of overhead, 3 bits of interframe space
+		and roughly 10% of bit stuffing
+		'''
+		return ((47 + len(frame.data)*8)*11)//10
+
+	def inject (self, frame: RawFrame, delay: float = 0) -> Self:
+		if self.filters and not any(
+				(frame.identifier & x.can_mask) == (x.can_id & x.can_mask) for x in self.filters
+			):
+			return self
+		return super().inject(frame, delay)
+
+class VirtualKLineHardware(VirtualHardware):
+	'''
+	Virtual K-Line (serial) port. Received frames are concatenated into a byte stream
+	and :py:meth:`read` returns exactly the number of bytes requested, like a serial port.
+	The echo of written bytes is not emulated - KLineHardware strips it before returning,
+	so the transport never sees it either
+
+	:param bitrate: emulated baudrate, for example 10400. None - infinitely fast bus
+	'''
+	timing_offset_ms: float = 0
+
+	def __init__ (self,
+			port: str = 'vkline',
+			timeout: float = 1,
+			responder: Responder | None = None,
+			latency: float = 0,
+			bitrate: int | None = None
+		) -> None:
+		super().__init__(port, timeout, responder, latency, bitrate)
+		self._rx_buffer: bytes = bytes()
+
+	def frame_bits (self, frame: RawFrame) -> int:
+		'''
+		8N1 - start bit, 8 data bits, stop bit
+		'''
+		return len(frame.data)*10
+
+	def read (self, length: int) -> RawFrame:
+		timestamp = 0
+		while len(self._rx_buffer) < length:
+			frame = self._get(self.timeout)
+			timestamp = timestamp or frame.timestamp
+			self._rx_buffer += frame.data
+
+		data, self._rx_buffer = self._rx_buffer[:length], self._rx_buffer[length:]
+		return RawFrame(identifier=False, data=data, timestamp=timestamp or time.perf_counter_ns())
+
+	def read_many (self, max_frames: int, timeout: float | None = None) -> list[RawFrame]:
+		if not self._rx_buffer:
+			self._rx_buffer += self._get(self.timeout if timeout is None else timeout).data
+
+		while (frame := self._get_arrived()) is not None:
+			self._rx_buffer += frame.data
+
+		data, self._rx_buffer = self._rx_buffer, bytes()
+		return [RawFrame(identifier=False, data=data, timestamp=time.perf_counter_ns())]
+
+	def flush (self) -> Self:
+		self._rx_buffer = bytes()
+		return super().flush()
+
+	def iso14230_fast_init (self,
+			payload: bytes,
+			timing_offset_ms: float | None = None
+		) -> tuple[bytes, int, int]:
+		'''
+		Emulate FastInit: the payload is written without the wake up pattern,
+		and whatever was received in response is consumed - same as KLineHardware does.
+		Like on genuine FTDI adapters, the consumed buffer starts with the payload echo
+
+		:return: consumed input buffer contents, 25ms low time, 25ms high time
+		'''
+		self.flush()
+		self.write(RawFrame(identifier=False, data=bytes(payload)))
+
+		try:
+			response = self.read_many(max_frames=1)[0].data
+		except TimeoutException:
+			response = bytes()
+
+		if timing_offset_ms is None:
+			timing_offset_ms = self.timing_offset_ms
+
+		return bytes(payload) + response, round(25-timing_offset_ms), round(25-timing_offset_ms)
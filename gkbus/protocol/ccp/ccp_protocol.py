@@ -21,7 +21,7 @@ class CcpNegativeResponseException(CcpException):
 	def __repr__ (self) -> str:
 		return self.__str__()
 
-@dataclass
+@dataclass(slots=True)
 class CcpRequestFrame:
 	'''
 	Also known as Command Receive Object - CRO. 
@@ -79,7 +79,7 @@ class CcpReturnCode (Enum):
 	def __repr__ (self) -> str:
 		return self.__str__()
 
-@dataclass
+@dataclass(slots=True)
 class CcpResponseFrame:
 	'''
 	Also known as Data Transmission Object - DTO. 
@@ -105,7 +105,7 @@ class CcpResponseFrame:
 	def __repr__ (self) -> str:
 		return self.__str__()
 
-@dataclass
+@dataclass(slots=True)
 class CcpResponse:
 	return_code: CcpReturnCode
 	frame: CcpResponseFrame 
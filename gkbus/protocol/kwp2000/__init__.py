@@ -2,9 +2,16 @@
 KWP2000 protocol, also known as ISO 14230-3
 '''
 
-from . import commands, enums
+from . import codecs, commands, enums
 from .kwp2000_command import Kwp2000Command
 from .kwp2000_negative_status import Kwp2000NegativeStatusIdentifierEnum
-from .kwp2000_protocol import Kwp2000Exception, Kwp2000NegativeResponseException, Kwp2000Protocol
+from .kwp2000_protocol import (
+    Kwp2000Exception,
+    Kwp2000NegativeResponseException,
+    Kwp2000Protocol,
+    RequestStatistics,
+    RetryPolicy,
+)
+from .transfer import TransferProgress
 
-__all__ = ['Kwp2000Command', 'Kwp2000Exception', 'Kwp2000NegativeResponseException', 'Kwp2000NegativeStatusIdentifierEnum', 'Kwp2000Protocol', 'commands', 'enums']
+__all__ = ['Kwp2000Command', 'Kwp2000Exception', 'Kwp2000NegativeResponseException', 'Kwp2000NegativeStatusIdentifierEnum', 'Kwp2000Protocol', 'RequestStatistics', 'RetryPolicy', 'TransferProgress', 'codecs', 'commands', 'enums']
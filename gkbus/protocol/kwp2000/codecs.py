@@ -0,0 +1,354 @@
+'''
+Codecs behind the RequestDownload/RequestUpload data format byte - compression in the high
+nibble, encryption in the low one. Codecs are streaming: data goes through update() in chunks
+of any size, so images of any size are processed block by block.
+
+Which scheme a data format value stands for is up to the ECU manufacturer. Only uncompressed,
+unencrypted data (0x0) is registered, register_compression_codec()/register_encryption_codec()
+add the values the ECU in question uses, i.e.:
+
+	register_compression_codec(0x1, LzssCodec)
+	register_encryption_codec(0x1, lambda: XorCodec(b'...'))
+'''
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable
+
+from .enums import CompressionType, EncryptionType
+
+
+class CodecException(IOError):
+	pass
+
+class CodecStream(ABC):
+	'''
+	One direction of a codec - feed data with update(), finish with flush()
+	'''
+	@abstractmethod
+	def update (self, data: bytes) -> bytes:
+		'''
+		:return: output available so far, may be empty
+		'''
+
+	def flush (self) -> bytes:
+		'''
+		End of data
+
+		:return: remaining output
+		'''
+		return bytes()
+
+class Codec(ABC):
+	@abstractmethod
+	def encoder (self) -> CodecStream:
+		pass
+
+	@abstractmethod
+	def decoder (self) -> CodecStream:
+		pass
+
+	def is_identity (self) -> bool:
+		'''
+		Data is not changed - the encoded stream matches the memory byte for byte
+		'''
+		return False
+
+	def encode (self, data: bytes) -> bytes:
+		stream = self.encoder()
+		return stream.update(data) + stream.flush()
+
+	def decode (self, data: bytes) -> bytes:
+		stream = self.decoder()
+		return stream.update(data) + stream.flush()
+
+class _IdentityStream(CodecStream):
+	def update (self, data: bytes) -> bytes:
+		return bytes(data)
+
+class IdentityCodec(Codec):
+	'''
+	Data is sent as it is
+	'''
+	def is_identity (self) -> bool:
+		return True
+
+	def encoder (self) -> CodecStream:
+		return _IdentityStream()
+
+	def decoder (self) -> CodecStream:
+		return _IdentityStream()
+
+class _XorStream(CodecStream):
+	def __init__ (self, key: bytes) -> None:
+		self.key = key
+		self.position = 0
+
+	def update (self, data: bytes) -> bytes:
+		key, start = self.key, self.position
+		self.position = (start + len(data)) % len(key)
+		return bytes([x ^ key[(start+i) % len(key)] for (i, x) in enumerate(data)])
+
+class XorCodec(Codec):
+	'''
+	Data XORed with a repeating key, counted from the first byte of the transfer
+
+	:param key: key, at least one byte
+	'''
+	def __init__ (self, key: bytes) -> None:
+		if not key:
+			raise CodecException('XOR key can\'t be empty')
+		self.key = bytes(key)
+
+	def encoder (self) -> CodecStream:
+		return _XorStream(self.key)
+
+	def decoder (self) -> CodecStream:
+		return _XorStream(self.key)
+
+LZSS_WINDOW = 4096
+LZSS_MAX_MATCH = 18
+LZSS_THRESHOLD = 2 # matches this long or shorter are stored as literals
+LZSS_FILL = 0x20 # the window starts filled with spaces
+
+class _LzssEncoder(CodecStream):
+	def __init__ (self, max_chain: int) -> None:
+		self.max_chain = max_chain
+		self.data = bytearray() # window and lookahead
+		self.base = 0 # stream position of data[0]
+		self.position = 0 # stream position of the next byte to encode
+		self.chains: dict[bytes, deque[int]] = {}
+		self.flags, self.items, self.group = 0, 0, bytearray()
+
+	def _emit (self, flag: int, item: bytes) -> bytes:
+		self.flags |= flag << self.items
+		self.group += item
+		self.items += 1
+		if self.items < 8:
+			return bytes()
+		return self._end_group()
+
+	def _end_group (self) -> bytes:
+		output = bytes([self.flags]) + self.group if self.items else bytes()
+		self.flags, self.items, self.group = 0, 0, bytearray()
+		return output
+
+	def _longest_match (self, end: int) -> tuple[int, int]:
+		data, start = self.data, self.position - self.base
+		best_length, best_position = 0, 0
+
+		for candidate in reversed(self.chains.get(bytes(data[start:start+LZSS_THRESHOLD+1]), ())):
+			if self.position - candidate > LZSS_WINDOW - LZSS_MAX_MATCH:
+				break
+			offset, length = candidate - self.base, LZSS_THRESHOLD+1
+			limit = min(LZSS_MAX_MATCH, end - start)
+			while length < limit and data[offset+length] == data[start+length]:
+				length += 1
+			if length > best_length:
+				best_length, best_position = length, candidate
+				if length == limit:
+					break
+
+		return best_length, best_position
+
+	def _index (self, position: int) -> None:
+		start = position - self.base
+		key = bytes(self.data[start:start+LZSS_THRESHOLD+1])
+		if len(key) <= LZSS_THRESHOLD:
+			return
+		chain = self.chains.setdefault(key, deque(maxlen=self.max_chain))
+		chain.append(position)
+
+	def _encode (self, final: bool) -> bytes:
+		output = bytearray()
+		end = len(self.data)
+		# until flushed, keep enough lookahead for the longest match and for indexing
+		# every position it covers - the output doesn't depend on how data is chunked
+		lookahead = LZSS_MAX_MATCH + LZSS_THRESHOLD
+
+		while (self.position - self.base < end
+				and (final or end - (self.position - self.base) >= lookahead)):
+			length, match = self._longest_match(end)
+
+			if length > LZSS_THRESHOLD:
+				ring = (match + LZSS_WINDOW - LZSS_MAX_MATCH) % LZSS_WINDOW
+				reference = bytes([
+					ring & 0xFF,
+					((ring >> 4) & 0xF0) | (length - LZSS_THRESHOLD - 1)
+				])
+				output += self._emit(0, reference)
+			else:
+				length = 1
+				output += self._emit(1, bytes([self.data[self.position - self.base]]))
+
+			for position in range(self.position, self.position + length):
+				self._index(position)
+			self.position += length
+
+		# forget what fell out of the window
+		drop = self.position - self.base - LZSS_WINDOW
+		if drop > LZSS_WINDOW:
+			del self.data[:drop]
+			self.base += drop
+			self.chains = {
+				key: chain for (key, chain) in self.chains.items() if chain[-1] >= self.base
+			}
+
+		return bytes(output)
+
+	def update (self, data: bytes) -> bytes:
+		self.data += data
+		return self._encode(final=False)
+
+	def flush (self) -> bytes:
+		return self._encode(final=True) + self._end_group()
+
+class _LzssDecoder(CodecStream):
+	def __init__ (self) -> None:
+		self.ring = bytearray([LZSS_FILL]) * LZSS_WINDOW
+		self.ring_position = LZSS_WINDOW - LZSS_MAX_MATCH
+		self.flags = 0 # flag bits of the current group, above a marker bit
+		self.pending = bytearray()
+
+	def update (self, data: bytes) -> bytes:
+		output = bytearray()
+		ring, mask = self.ring, LZSS_WINDOW - 1
+		position = self.ring_position
+		data = self.pending + data
+		index = 0
+
+		while index < len(data):
+			if self.flags <= 1:
+				self.flags = data[index] | 0x100
+				index += 1
+				continue
+
+			if self.flags & 1:
+				byte = data[index]
+				index += 1
+				output.append(byte)
+				ring[position] = byte
+				position = (position + 1) & mask
+			else:
+				if index + 1 >= len(data):
+					break
+				source = data[index] | ((data[index+1] & 0xF0) << 4)
+				length = (data[index+1] & 0x0F) + LZSS_THRESHOLD + 1
+				index += 2
+				for k in range(length):
+					byte = ring[(source + k) & mask]
+					output.append(byte)
+					ring[position] = byte
+					position = (position + 1) & mask
+
+			self.flags >>= 1
+
+		self.pending = bytearray(data[index:])
+		self.ring_position = position
+		return bytes(output)
+
+	def flush (self) -> bytes:
+		if self.pending:
+			raise CodecException('LZSS stream ended in the middle of a reference')
+		return bytes()
+
+class LzssCodec(Codec):
+	'''
+	LZSS as published by Haruhiko Okumura, the variant most ECU bootloaders implement:
+	4096 byte window filled with spaces, matches of 3 to 18 bytes, groups of 8 items
+	led by a flag byte - 1 for a literal, 0 for a 2 byte window reference
+
+	:param max_chain: how many earlier occurrences of a 3 byte sequence are tried when
+		looking for a match - more compress better, but slower
+	'''
+	def __init__ (self, max_chain: int = 16) -> None:
+		self.max_chain = max_chain
+
+	def encoder (self) -> CodecStream:
+		return _LzssEncoder(self.max_chain)
+
+	def decoder (self) -> CodecStream:
+		return _LzssDecoder()
+
+class _ChainStream(CodecStream):
+	def __init__ (self, streams: list[CodecStream]) -> None:
+		self.streams = streams
+
+	def update (self, data: bytes) -> bytes:
+		for stream in self.streams:
+			data = stream.update(data)
+		return data
+
+	def flush (self) -> bytes:
+		data = bytes()
+		for stream in self.streams:
+			data = stream.update(data) + stream.flush()
+		return data
+
+class DataFormatCodec(Codec):
+	'''
+	Compression and encryption of a data format byte together:
+	compressed, then encrypted when encoding - decrypted, then decompressed when decoding
+	'''
+	def __init__ (self, compression: Codec, encryption: Codec) -> None:
+		self.compression, self.encryption = compression, encryption
+
+	def encoder (self) -> CodecStream:
+		return _ChainStream([self.compression.encoder(), self.encryption.encoder()])
+
+	def decoder (self) -> CodecStream:
+		return _ChainStream([self.encryption.decoder(), self.compression.decoder()])
+
+	def is_identity (self) -> bool:
+		return self.compression.is_identity() and self.encryption.is_identity()
+
+COMPRESSION_CODECS: dict[int, Callable[..., Codec]] = {
+	CompressionType.UNCOMPRESSED.value: IdentityCodec,
+}
+
+ENCRYPTION_CODECS: dict[int, Callable[..., Codec]] = {
+	EncryptionType.UNENCRYPTED.value: IdentityCodec,
+}
+
+def register_compression_codec (compression_type: CompressionType | int,
+		factory: Callable[..., Codec]
+	) -> None:
+	if isinstance(compression_type, CompressionType):
+		compression_type = compression_type.value
+	COMPRESSION_CODECS[compression_type] = factory
+
+def register_encryption_codec (encryption_type: EncryptionType | int,
+		factory: Callable[..., Codec]
+	) -> None:
+	if isinstance(encryption_type, EncryptionType):
+		encryption_type = encryption_type.value
+	ENCRYPTION_CODECS[encryption_type] = factory
+
+def data_format_codec (compression_type: CompressionType | int,
+		encryption_type: EncryptionType | int,
+		compression_options: dict | None = None,
+		encryption_options: dict | None = None
+	) -> DataFormatCodec:
+	'''
+	Codec for a RequestDownload/RequestUpload data format
+
+	:param compression_options: keyword arguments for the compression codec
+	:param encryption_options: keyword arguments for the encryption codec,
+		i.e. {'key': b'...'} for XorCodec
+	:raises CodecException: if no codec is registered for either type
+	'''
+	if isinstance(compression_type, CompressionType):
+		compression_type = compression_type.value
+	if isinstance(encryption_type, EncryptionType):
+		encryption_type = encryption_type.value
+
+	if compression_type not in COMPRESSION_CODECS:
+		raise CodecException(
+			'No codec registered for compression type {}'.format(hex(compression_type)))
+	if encryption_type not in ENCRYPTION_CODECS:
+		raise CodecException(
+			'No codec registered for encryption type {}'.format(hex(encryption_type)))
+
+	return DataFormatCodec(
+		COMPRESSION_CODECS[compression_type](**(compression_options or {})),
+		ENCRYPTION_CODECS[encryption_type](**(encryption_options or {}))
+	)
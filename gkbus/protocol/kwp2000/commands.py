@@ -16,7 +16,7 @@ class AccessTimingParameters(Kwp2000CommandWithSubservices): # TimingParameterId
 		return self.set_subservice_identifier(TimingParameterIdentifier.SET_TIMING_PARAMETERS_TO_DEFAULT_VALUES.value)
 
 	def read_currently_active_timing_parameters (self) -> Self:
-		return self.set_subservice_identifier(TimingParameterIdentifier.SET_TIMING_PARAMETERS_TO_GIVEN_VALUES.value)
+		return self.set_subservice_identifier(TimingParameterIdentifier.READ_CURRENTLY_ACTIVE_TIMING_PARAMETERS.value)
 
 	def set_timing_parameters_to_given_values (self,
 			p2min: int,
@@ -108,12 +108,16 @@ class RequestDownload(Kwp2000Command):
 
 	def init (self, 
 			offset: int, 
-			compression_type: CompressionType,
-			encryption_type: EncryptionType,
+			compression_type: CompressionType | int,
+			encryption_type: EncryptionType | int,
 			size: int
 		) -> None:
 		address = struct.pack('>L', offset)[1:]
-		data_format = (compression_type.value << 4) | encryption_type.value
+		if isinstance(compression_type, CompressionType):
+			compression_type = compression_type.value
+		if isinstance(encryption_type, EncryptionType):
+			encryption_type = encryption_type.value
+		data_format = (compression_type << 4) | encryption_type
 		size = struct.pack('>L', size)[1:]
 
 		self.set_data(bytes([*address, data_format, *size]))
@@ -132,12 +136,16 @@ class RequestUpload(Kwp2000Command):
 
 	def init (self, 
 			offset: int, 
-			compression_type: CompressionType,
-			encryption_type: EncryptionType,
+			compression_type: CompressionType | int,
+			encryption_type: EncryptionType | int,
 			size: int
 		) -> None:
 		address = struct.pack('>L', offset)[1:]
-		data_format = (compression_type.value << 4) | encryption_type.value
+		if isinstance(compression_type, CompressionType):
+			compression_type = compression_type.value
+		if isinstance(encryption_type, EncryptionType):
+			encryption_type = encryption_type.value
+		data_format = (compression_type << 4) | encryption_type
 		size = struct.pack('>L', size)[1:]
 
 		self.set_data(bytes([*address, data_format, *size]))
@@ -32,6 +32,8 @@ class InputOutputControlParameter(Enum):
 	SHORT_TERM_ADJUSTMENT = 0x07
 	LONG_TERM_ADJUSTMENT = 0x08
 
+# values other than 0x0 are manufacturer specific - register the codecs behind them
+# with codecs.register_compression_codec()/register_encryption_codec()
 class CompressionType(Enum):
 	UNCOMPRESSED = 0x0
 
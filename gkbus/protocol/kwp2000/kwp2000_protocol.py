@@ -1,17 +1,45 @@
+import io
 import logging
+import mmap
 import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Iterator
 
 from ...hardware import TimeoutException
-from ...transport import Kwp2000OverKLineTransport
+from ...transport import KLineFrameException, Kwp2000OverKLineTransport, TransportABC
+from ...utils import monotonic_ns
 from ..protocol_abc import ProtocolABC, ProtocolException
+from . import commands
+from .codecs import Codec, CodecException, IdentityCodec, data_format_codec
+from .enums import CompressionType, DiagnosticSession, EncryptionType, ResponseType
 from .kwp2000_command import Kwp2000Command
 from .kwp2000_negative_status import Kwp2000NegativeStatus, Kwp2000NegativeStatusIdentifierEnum
 from .kwp2000_response import Kwp2000Response, Kwp2000ResponseFrame
+from .transfer import TransferProgress
 
 logger = logging.getLogger(__name__)
 
+# StartDiagnosticSession baudrate identifiers, as (identifier, baudrate), fastest first.
+# 0x03-0x05 are the ISO 14230-3 values, manufacturers may define more -
+# check what the ECU in question uses
+BAUDRATE_CANDIDATES = [(0x05, 115200), (0x04, 57600), (0x03, 38400)]
+
+MAX_READ_BLOCK_SIZE = 0xFF # ReadMemoryByAddress size is a single byte
+MAX_WRITE_BLOCK_SIZE = 0xFF # so is WriteMemoryByAddress size
+# TransferData is limited by the transport only, 0xFFF is the usual ISO-TP limit
+MAX_TRANSFER_BLOCK_SIZE = 0xFFE
+VERIFY_WINDOW = 0x10000 # bytes read back and compared at once after a download
+
+REQUEST_SEQUENCE_ERROR = Kwp2000NegativeStatusIdentifierEnum.REQUEST_SEQUENCE_ERROR.value
+
+# negative responses after which the ECU and the tester may disagree on the transfer position
+TRANSFER_SEQUENCE_ERRORS = [
+	REQUEST_SEQUENCE_ERROR,
+	Kwp2000NegativeStatusIdentifierEnum.TRANSFER_SUSPENDED.value,
+	Kwp2000NegativeStatusIdentifierEnum.WRONG_BLOCK_SEQUENCE_COUNTER.value
+]
+
 class Kwp2000Exception(ProtocolException):
 	pass
 
@@ -25,7 +53,7 @@ class Kwp2000NegativeResponseException(Kwp2000Exception):
 	def __repr__ (self) -> str:
 		return self.__str__()
 
-@dataclass
+@dataclass(slots=True)
 class Kwp2000RequestFrame:
 	service_identifier: int
 	data: bytes
@@ -33,7 +61,72 @@ class Kwp2000RequestFrame:
 	def to_pdu (self) -> bytes:
 		return self.service_identifier.to_bytes(1, 'big') + self.data
 
+@dataclass(slots=True)
+class RetryPolicy:
+	'''
+	How requests answered with a transient negative response are repeated
+
+	:param attempts: how many times a request is repeated before the negative response
+		is raised, 0 (default) - never, i.e. RetryPolicy(attempts=5) to opt in
+	:param delay: time before the first repetition, seconds
+	:param backoff: the delay is multiplied by it after every repetition
+	:param max_delay: longest delay, seconds
+	:param codes: negative response codes worth repeating the request for,
+		BUSY_REPEAT_REQUEST and ROUTINE_NOT_COMPLETE by default
+	'''
+	attempts: int = 0
+	delay: float = 0.05
+	backoff: float = 2
+	max_delay: float = 1
+	codes: tuple[int, ...] = (
+		Kwp2000NegativeStatusIdentifierEnum.BUSY_REPEAT_REQUEST.value,
+		Kwp2000NegativeStatusIdentifierEnum.ROUTINE_NOT_COMPLETE.value
+	)
+
+	def delays (self) -> Iterator[float]:
+		delay = self.delay
+		for _ in range(self.attempts):
+			yield min(delay, self.max_delay)
+			delay *= self.backoff
+
+@dataclass(slots=True)
+class RequestStatistics:
+	'''
+	What it took to get the response to a single request
+
+	:param service_identifier: service identifier of the request
+	:param response_pending: number of response pending (0x78) messages received
+	:param retries: number of times the request was repeated, see RetryPolicy
+	:param started: monotonic timestamp of the first attempt, nanoseconds
+	:param duration_ns: time until the final response (or error), nanoseconds
+	'''
+	service_identifier: int
+	response_pending: int = 0
+	retries: int = 0
+	started: int = field(default_factory=monotonic_ns)
+	duration_ns: int = 0
+
 class Kwp2000Protocol (ProtocolABC):
+	'''
+	:param retry_policy: how requests answered with BUSY_REPEAT_REQUEST/ROUTINE_NOT_COMPLETE
+		are repeated, by default they aren't - the negative response is raised right away
+	:param p2_extended_timeout: how long to wait for the response after every response pending
+		(0x78) message (P2*max), seconds. The hardware timeout applies to the first response only
+	'''
+	# statistics of the last read_memory()/upload()/download()
+	last_transfer: TransferProgress | None = None
+	last_request: RequestStatistics | None = None # statistics of the last executed request
+	_init_command: Kwp2000Command | None = None # set by init()
+
+	def __init__ (self,
+			transport: TransportABC,
+			retry_policy: RetryPolicy | None = None,
+			p2_extended_timeout: float = 5
+		) -> None:
+		super().__init__(transport)
+		self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+		self.p2_extended_timeout = p2_extended_timeout
+
 	def open (self) -> bool:
 		if not self.transport.hardware.is_open():
 			return self.transport.hardware.open()
@@ -41,21 +134,11 @@ class Kwp2000Protocol (ProtocolABC):
 		return True
 
 	def init (self, init_command: Kwp2000Command, keepalive_command: Kwp2000Command | None = None, keepalive_delay: float = 1.5) -> bool:
+		self._init_command = init_command
+
 		if isinstance(self.transport, Kwp2000OverKLineTransport):
 			self.open()
-			
-			init_payload = Kwp2000RequestFrame(init_command.get_service_identifier(), init_command.get_data())
-
-			try:
-				self.transport.hardware.set_timeout(0.4)
-				for (response, time_low, time_high) in self.transport.init(init_payload.to_pdu()):
-					logger.debug('K-Line FastInit: response: {!r}, time low: {}, time high: {}'.format(response, time_low, time_high))
-					self.transport.read_pdu()
-				self.transport.hardware.set_timeout(2)
-			except TimeoutException:
-				pass
-
-			self.transport.hardware.set_timeout(2)
+			self._fast_init(init_command)
 		else:
 			self.transport.init()
 
@@ -72,29 +155,639 @@ class Kwp2000Protocol (ProtocolABC):
 		return True # there should be some error checking - but at this stage its hard to determine whether we succeeded
 
 
+	def _fast_init (self, init_command: Kwp2000Command) -> None:
+		init_payload = Kwp2000RequestFrame(
+			init_command.get_service_identifier(), init_command.get_data())
+
+		try:
+			self.transport.hardware.set_timeout(0.4)
+			for (response, time_low, time_high) in self.transport.init(init_payload.to_pdu()):
+				logger.debug('K-Line FastInit: response: {!r}, time low: {}, time high: {}'.format(
+					response, time_low, time_high))
+				self.transport.read_pdu()
+			self.transport.hardware.set_timeout(2)
+		except TimeoutException:
+			pass
+
+		self.transport.hardware.set_timeout(2)
+
 	def execute (self, command: Kwp2000Command) -> Kwp2000Response:
+		with self._execute_lock:
+			return self._execute(command)
+
+	def _execute (self, command: Kwp2000Command) -> Kwp2000Response:
 		frame = Kwp2000RequestFrame(command.get_service_identifier(), command.get_data())
+		statistics = RequestStatistics(service_identifier=frame.service_identifier)
+		self.last_request = statistics
+		delays = self.retry_policy.delays()
+
+		try:
+			while True:
+				response_pdu = self.transport.send_read_pdu(data=frame.to_pdu())
+				self._last_execution_time = time.time()
+
+				try:
+					return self.handle_errors(Kwp2000Response(
+						Kwp2000ResponseFrame(status=response_pdu[0], data=response_pdu[1:])
+					))
+				except Kwp2000NegativeResponseException as e:
+					delay = None
+					if e.status.identifier in self.retry_policy.codes:
+						delay = next(delays, None)
+					if delay is None:
+						raise
+					statistics.retries += 1
+					logger.info('{}, repeating {} in {}s'.format(
+						e, hex(frame.service_identifier), delay
+					))
+					time.sleep(delay)
+		finally:
+			statistics.duration_ns = monotonic_ns() - statistics.started
+
+	def negotiate_baudrate (self,
+			session_type: DiagnosticSession,
+			candidates: list[tuple[int, int]] | None = None,
+			p3max: float = 5
+		) -> int:
+		'''
+		Start a diagnostic session at the highest K-Line baudrate the ECU and the adapter agree on.
+		Candidates are tried in order: the ECU is asked to switch with StartDiagnosticSession,
+		the adapter follows once the (still slow) positive response arrived and the link is verified
+		with TesterPresent. If the ECU refuses, the next candidate is tried. If it accepts but
+		doesn't answer at the new baudrate, the adapter goes back to the original baudrate - and if
+		the ECU can't be reached there either, the session is left to time out and the
+		connection is initialized again. Without any luck, the session is started at
+		the original baudrate
+
+		:param session_type: diagnostic session to start
+		:param candidates: list of (baudrate identifier, baudrate), see BAUDRATE_CANDIDATES
+		:param p3max: how long the ECU takes to drop an abandoned session, seconds
+		:return: baudrate in use
+		:raises Kwp2000Exception: if the transport is not K-Line, or if called before init()
+		'''
+		if not isinstance(self.transport, Kwp2000OverKLineTransport):
+			raise Kwp2000Exception(
+				'Baudrate negotiation is supported on K-Line only, not over {}'
+				.format(type(self.transport).__name__)
+			)
+
+		init_command = self._init_command
+		if init_command is None:
+			raise Kwp2000Exception(
+				'Connection is not initialized, call init() before negotiate_baudrate()'
+			)
+
+		hardware = self.transport.hardware
+		original_baudrate = hardware.get_baudrate()
 
 		with self._execute_lock:
-			response_pdu = self.transport.send_read_pdu(data=frame.to_pdu())
-			self._last_execution_time = time.time()
+			if candidates is None:
+				candidates = BAUDRATE_CANDIDATES
+			for (identifier, baudrate) in candidates:
+				try:
+					self._execute(commands.StartDiagnosticSession(session_type, identifier))
+				except Kwp2000NegativeResponseException as e:
+					logger.info('ECU refused switching to {} baud: {}'.format(baudrate, e))
+					continue
+
+				hardware.set_baudrate(baudrate)
+				if self._link_alive():
+					logger.info('Switched to {} baud'.format(baudrate))
+					return baudrate
 
-			response = self.handle_errors(
-				Kwp2000Response(Kwp2000ResponseFrame(status=response_pdu[0], data=response_pdu[1:]))
+				logger.warning('No response at {} baud, going back to {}'.format(
+					baudrate, original_baudrate
+				))
+				hardware.set_baudrate(original_baudrate)
+				if not self._link_alive():
+					logger.warning(
+						'No response at {} baud either, waiting for the session to time out'
+						.format(original_baudrate)
+					)
+					time.sleep(p3max)
+					self._fast_init(init_command)
+
+			self._execute(commands.StartDiagnosticSession(session_type))
+
+		return original_baudrate
+
+	def max_read_block_size (self) -> int:
+		'''
+		Largest ReadMemoryByAddress block the transport can carry
+		'''
+		if self.transport.max_pdu_size is None:
+			return MAX_READ_BLOCK_SIZE
+		# one byte goes to the response service identifier
+		return min(MAX_READ_BLOCK_SIZE, self.transport.max_pdu_size - 1)
+
+	def read_memory (self,
+			address: int,
+			length: int,
+			output: bytearray | memoryview | mmap.mmap | None = None,
+			block_size: int | None = None,
+			retries: int = 3,
+			progress: Callable[[TransferProgress], None] | None = None
+		) -> bytearray | memoryview | mmap.mmap:
+		'''
+		Read a memory range with ReadMemoryByAddress, in the largest blocks the transport
+		and the ECU accept. The first block is as big as the transport allows (or block_size),
+		if the ECU rejects it with CANT_UPLOAD_REQUESTED_NUMBER_OF_BYTES the block size is
+		halved for the rest of the transfer. REQUEST_OUT_OF_RANGE shrinks only the rejected
+		block - the block may just cross the end of a memory region. Blocks that timed out or
+		arrived corrupted are requested again, up to retries times in a row
+
+		:param address: first address to read
+		:param length: number of bytes to read
+		:param output: buffer to read into (i.e. bytearray, mmap), at least length bytes long.
+			A new bytearray if None
+		:param block_size: largest block to request, defaults to max_read_block_size()
+		:param retries: how many times a block is repeated before giving up
+		:param progress: called with a TransferProgress after every block
+		:return: output
+		'''
+		buffer = output if output is not None else bytearray(length)
+		view = memoryview(buffer)
+		if len(view) < length:
+			raise ValueError('Output buffer holds {} bytes, {} requested'.format(len(view), length))
+
+		block_size = min(block_size or MAX_READ_BLOCK_SIZE, self.max_read_block_size())
+		transfer = TransferProgress(address=address, size=length, block_size=block_size)
+		self.last_transfer = transfer
+		limit, failures = block_size, 0
+		status = Kwp2000NegativeStatusIdentifierEnum
+		too_many_bytes = status.CANT_UPLOAD_REQUESTED_NUMBER_OF_BYTES.value
+		out_of_range = status.REQUEST_OUT_OF_RANGE.value
+
+		with self._execute_lock:
+			while transfer.done < length:
+				size = min(limit, length - transfer.done)
+				position = address + transfer.done
+				transfer.requests += 1
+
+				try:
+					command = commands.ReadMemoryByAddress(offset=position, size=size)
+					data = self._execute(command).get_data()
+				except Kwp2000NegativeResponseException as e:
+					if size == 1 or e.status.identifier not in (too_many_bytes, out_of_range):
+						raise
+					limit = size // 2
+					if e.status.identifier == too_many_bytes:
+						transfer.block_size = limit
+					logger.info('ECU rejected reading {} bytes at {}: {}, trying {}'.format(
+						size, hex(position), e, limit
+					))
+					continue
+				except (TimeoutException, KLineFrameException) as e:
+					failures += 1
+					if failures > retries:
+						raise
+					transfer.retries += 1
+					logger.warning('Reading {} bytes at {} failed: {!r}, retrying'.format(
+						size, hex(position), e
+					))
+					continue
+
+				if not data:
+					raise Kwp2000Exception('Empty response reading {} bytes at {}'.format(
+						size, hex(position)
+					))
+
+				data = data[:length - transfer.done]
+				view[transfer.done:transfer.done+len(data)] = data
+				transfer.done += len(data)
+				limit, failures = transfer.block_size, 0
+
+				if progress is not None:
+					progress(transfer)
+
+		return buffer
+
+	def read_memory_to_file (self,
+			address: int,
+			length: int,
+			path: str,
+			block_size: int | None = None,
+			retries: int = 3,
+			progress: Callable[[TransferProgress], None] | None = None
+		) -> int:
+		'''
+		read_memory() straight into a memory-mapped file, overwritten if it exists.
+		block_size, retries and progress are passed on to read_memory()
+
+		:return: number of bytes written
+		'''
+		with open(path, 'w+b') as f:
+			if not length:
+				return 0
+			f.truncate(length)
+			with mmap.mmap(f.fileno(), length) as output:
+				self.read_memory(address, length, output, block_size, retries, progress)
+				output.flush()
+
+		return length
+
+	def upload (self,
+			address: int,
+			size: int,
+			compression_type: CompressionType | int = CompressionType.UNCOMPRESSED,
+			encryption_type: EncryptionType | int = EncryptionType.UNENCRYPTED,
+			codec: Codec | None = None,
+			retries: int = 3,
+			progress: Callable[[TransferProgress], None] | None = None
+		) -> Iterator[bytes]:
+		'''
+		Upload a memory range from the ECU with RequestUpload, TransferData and
+		RequestTransferExit.
+		Blocks are yielded as they arrive, so they can be written to disk or hashed right away -
+		memory use doesn't depend on the size of the range. Statistics are kept in last_transfer.
+
+		Response pending is waited out. KWP2000 has no block sequence counter, so a lost or
+		corrupted TransferData response (or REQUEST_SEQUENCE_ERROR, TRANSFER_SUSPENDED,
+		WRONG_BLOCK_SEQUENCE_COUNTER) leaves the position unknown. The transfer is then
+		exited and requested again from the first byte not received yet. This happens
+		up to retries times in a row before giving up.
+
+		Compressed or encrypted data doesn't map to memory byte by byte: the stream ends
+		with an empty or short block, or REQUEST_SEQUENCE_ERROR once everything was sent,
+		and the decoder is flushed then. Such a stream can't be resumed in the middle,
+		it's requested again from the start and the bytes yielded already are skipped
+
+		:param address: first address to upload
+		:param size: number of bytes to upload
+		:param compression_type: data format the ECU is asked for, data is decoded on the fly.
+			Values other than 0x0 are the ECU's own, see codecs.register_compression_codec()
+		:param encryption_type: data format the ECU is asked for, data is decoded on the fly.
+			Values other than 0x0 are the ECU's own, see codecs.register_encryption_codec()
+		:param codec: codec decoding the data, by default the one registered for the data format
+			(see codecs.data_format_codec())
+		:param progress: called with a TransferProgress after every block
+		'''
+		transfer = TransferProgress(address=address, size=size, block_size=0)
+		self.last_transfer = transfer
+		codec = codec or data_format_codec(compression_type, encryption_type)
+		decoder, resumable = codec.decoder(), codec.is_identity()
+		failures = 0
+		received = 0 # bytes of the current stream, since the last RequestUpload
+		skip = 0 # decoded bytes yielded already, before the stream was requested again
+
+		transfer.block_size = self._request_transfer(
+			commands.RequestUpload, address, size, compression_type, encryption_type
+		)
+		try:
+			while transfer.done < size:
+				transfer.requests += 1
+				# the ECU has sent everything - decoders may hold back the end of the stream
+				ended = False
+				error: Exception | None = None
+
+				try:
+					data = self.execute(commands.TransferData()).get_data()
+				except Kwp2000NegativeResponseException as e:
+					if e.status.identifier not in TRANSFER_SEQUENCE_ERRORS:
+						raise
+					data, error = bytes(), e
+					ended = received > 0 and e.status.identifier == REQUEST_SEQUENCE_ERROR
+				except (TimeoutException, KLineFrameException) as e:
+					data, error = bytes(), e
+				else:
+					ended = not data or len(data) < transfer.block_size
+					if not data and resumable:
+						error = Kwp2000Exception('Empty TransferData response')
+
+				if not resumable and ended:
+					error = None
+
+				if error is None:
+					received += len(data)
+					transfer.wire_bytes += len(data)
+					try:
+						data = decoder.update(data)
+						if ended and not resumable:
+							data += decoder.flush()
+					except CodecException as e:
+						data, error = bytes(), e
+
+				if error is None:
+					dropped = min(skip, len(data))
+					skip -= dropped
+					data = data[dropped:size - transfer.done + dropped]
+					transfer.done += len(data)
+
+					if progress is not None:
+						progress(transfer)
+
+					if data:
+						yield data
+
+					if not ended or resumable or transfer.done >= size:
+						failures = 0
+						continue
+					error = Kwp2000Exception('Upload ended after {} of {} bytes'.format(
+						transfer.done, size
+					))
+
+				failures += 1
+				if failures > retries:
+					raise error
+				transfer.retries += 1
+				self._exit_transfer()
+
+				if resumable:
+					position = address + transfer.done
+					logger.warning('Upload at {} failed: {!r}, requesting again from there'.format(
+						hex(position), error
+					))
+					self._request_transfer(
+						commands.RequestUpload, position, size - transfer.done,
+						compression_type, encryption_type
+					)
+				else:
+					# a compressed or encrypted stream can only be decoded from its start
+					logger.warning('Upload at {} failed: {!r}, requesting it again'.format(
+						hex(address), error
+					))
+					self._request_transfer(
+						commands.RequestUpload, address, size, compression_type, encryption_type
+					)
+					decoder, skip = codec.decoder(), transfer.done
+				received = 0
+
+			self.execute(commands.RequestTransferExit())
+		finally:
+			if transfer.done < size:
+				self._exit_transfer()
+
+	def download (self,
+			address: int,
+			image: str | bytes | BinaryIO,
+			end: int | None = None,
+			offset: int = 0,
+			block_size: int | None = None,
+			write_memory_by_address: bool = False,
+			compression_type: CompressionType | int = CompressionType.UNCOMPRESSED,
+			encryption_type: EncryptionType | int = EncryptionType.UNENCRYPTED,
+			codec: Codec | None = None,
+			verify: bool = True,
+			retries: int = 3,
+			progress: Callable[[TransferProgress], None] | None = None
+		) -> TransferProgress:
+		'''
+		Download an image to the ECU with RequestDownload, TransferData and RequestTransferExit,
+		or with WriteMemoryByAddress. The image is streamed from disk block by block, every block
+		as big as the transport and the ECU (RequestDownload response) allow.
+
+		BUSY_REPEAT_REQUEST is handled by retry_policy, like for every request. After
+		TRANSFER_SUSPENDED, a sequence error or a lost response, the transfer is exited and
+		requested again from the first unconfirmed block - the rest of the image is not sent
+		again. This happens up to retries times in a row before giving up. An interrupted
+		download can be resumed with offset. Finally the written range is read back with
+		ReadMemoryByAddress and compared to the image.
+
+		With compression or encryption, the image is encoded on the fly and the blocks carry
+		the encoded stream. Such a stream can't be resumed in the middle, so a lost block fails
+		the download right away - start it again with offset at the last TransferProgress.done
+
+		:param address: address the image starts at
+		:param image: path to the image, its contents, or a binary file opened for reading
+		:param end: offset in the image to stop at, by default its end. Bytes offset to end
+			are downloaded
+		:param offset: resume a download - skip that many bytes of the image, they are already
+			written. The transfer (and TransferProgress) starts at address+offset
+		:param block_size: largest block to send, by default the largest one the transport carries
+		:param write_memory_by_address: write with WriteMemoryByAddress instead of a
+			RequestDownload/TransferData transfer, i.e. for RAM. Data is always written as it is
+		:param compression_type: data format announced with RequestDownload, see upload()
+		:param encryption_type: data format announced with RequestDownload, see upload()
+		:param codec: codec encoding the image, by default the one registered for the data format
+			(see codecs.data_format_codec())
+		:param verify: read the range back and compare it to the image
+		:param progress: called with a TransferProgress after every block
+		:raises Kwp2000Exception: if the image is shorter than end, or verification failed
+		'''
+		if isinstance(image, str):
+			with open(image, 'rb') as f:
+				return self.download(
+					address, f, end, offset, block_size, write_memory_by_address,
+					compression_type, encryption_type, codec, verify, retries, progress
+				)
+		if isinstance(image, (bytes, bytearray, memoryview)):
+			image = io.BytesIO(image)
+
+		if end is None:
+			end = image.seek(0, io.SEEK_END)
+		image.seek(offset)
+
+		transfer = TransferProgress(address=address+offset, size=end-offset, block_size=0)
+		self.last_transfer = transfer
+		limit = min(
+			block_size or MAX_TRANSFER_BLOCK_SIZE,
+			self.max_write_block_size(write_memory_by_address)
+		)
+		if write_memory_by_address:
+			codec = IdentityCodec()
+		elif codec is None:
+			codec = data_format_codec(compression_type, encryption_type)
+		encoder, resumable = codec.encoder(), codec.is_identity()
+		pending, consumed, produced, failures = bytearray(), 0, 0, 0
+
+		if not write_memory_by_address:
+			ecu_limit = self._request_transfer(
+				commands.RequestDownload, transfer.address, transfer.size,
+				compression_type, encryption_type
 			)
+			limit = min(limit, ecu_limit or limit)
+		transfer.block_size = limit
+
+		try:
+			while transfer.done < transfer.size:
+				# pending - encoded, not sent yet. Without a codec that's exactly
+				# the image from done on
+				while len(pending) < limit and consumed < transfer.size:
+					chunk = image.read(min(limit, transfer.size - consumed))
+					if not chunk:
+						raise Kwp2000Exception('Image ended after {} bytes, {} to download'.format(
+							offset+consumed, end
+						))
+					consumed += len(chunk)
+					chunk = encoder.update(chunk)
+					if consumed == transfer.size:
+						chunk += encoder.flush()
+					produced += len(chunk)
+					pending += chunk
+
+				block = bytes(pending[:limit])
+				position = transfer.address + transfer.done
+				transfer.requests += 1
 
-		return response
+				try:
+					if write_memory_by_address:
+						self.execute(
+							commands.WriteMemoryByAddress(offset=position, data_to_write=block)
+						)
+					else:
+						self.execute(commands.TransferData(block))
+				except Kwp2000NegativeResponseException as e:
+					if write_memory_by_address:
+						raise
+					if e.status.identifier not in TRANSFER_SEQUENCE_ERRORS:
+						raise
+					error = e
+				except (TimeoutException, KLineFrameException) as e:
+					error = e
+				else:
+					error = None
+
+				if error is not None:
+					failures += 1
+					if failures > retries or not resumable:
+						raise error
+					transfer.retries += 1
+					if not write_memory_by_address:
+						logger.warning(
+							'Download at {} failed: {!r}, requesting again from there'
+							.format(hex(position), error)
+						)
+						self._exit_transfer()
+						ecu_limit = self._request_transfer(
+							commands.RequestDownload, position, transfer.size - transfer.done,
+							compression_type, encryption_type
+						)
+						# the ECU may ask for smaller blocks in the new transfer
+						limit = min(limit, ecu_limit or limit)
+						transfer.block_size = limit
+					continue
+
+				failures = 0
+				del pending[:len(block)]
+				transfer.wire_bytes += len(block)
+				# exact without a codec, proportional to the encoded stream sent so far otherwise
+				if produced:
+					transfer.done = consumed * (produced - len(pending)) // produced
+				else:
+					transfer.done = consumed
+
+				if progress is not None:
+					progress(transfer)
+
+			if not write_memory_by_address:
+				self.execute(commands.RequestTransferExit())
+		finally:
+			if not write_memory_by_address and transfer.done < transfer.size:
+				self._exit_transfer()
+
+		if verify:
+			image.seek(offset)
+			self._verify(transfer.address, image, transfer.size)
+			self.last_transfer = transfer # read_memory() replaced it
+
+		return transfer
+
+	def max_write_block_size (self, write_memory_by_address: bool = False) -> int:
+		'''
+		Largest TransferData (or WriteMemoryByAddress) block the transport can carry
+		'''
+		if write_memory_by_address:
+			limit, overhead = MAX_WRITE_BLOCK_SIZE, 5 # service identifier, address and size
+		else:
+			limit, overhead = MAX_TRANSFER_BLOCK_SIZE, 1
+
+		if self.transport.max_pdu_size is None:
+			return limit
+		return min(limit, self.transport.max_pdu_size - overhead)
+
+	def _verify (self, address: int, image: BinaryIO, size: int) -> None:
+		'''
+		Read a range back and compare it to the image, VERIFY_WINDOW bytes at a time
+
+		:raises Kwp2000Exception: on the first difference
+		'''
+		buffer = bytearray(min(VERIFY_WINDOW, size))
+
+		for position in range(0, size, VERIFY_WINDOW):
+			length = min(VERIFY_WINDOW, size - position)
+			expected = image.read(length)
+			written = self.read_memory(address+position, length, output=buffer)
+
+			if memoryview(written)[:length] != expected:
+				mismatch = next(x for x in range(length) if written[x] != expected[x])
+				raise Kwp2000Exception('Verification failed at {}: wrote {}, read back {}'.format(
+					hex(address+position+mismatch), hex(expected[mismatch]), hex(written[mismatch])
+				))
+
+	def _request_transfer (self,
+			command: type[Kwp2000Command],
+			address: int,
+			size: int,
+			compression_type: CompressionType | int,
+			encryption_type: EncryptionType | int
+		) -> int:
+		'''
+		Send RequestUpload/RequestDownload
+
+		:return: maximum block length reported by the ECU, 0 if it didn't report one
+		'''
+		response = self.execute(command(
+			offset=address, compression_type=compression_type,
+			encryption_type=encryption_type, size=size
+		)).get_data()
+		return response[0] if response else 0
+
+	def _exit_transfer (self) -> None:
+		'''
+		RequestTransferExit, errors are ignored - the transfer may be already over on the ECU side
+		'''
+		try:
+			self.execute(commands.RequestTransferExit())
+		except (Kwp2000NegativeResponseException, TimeoutException, KLineFrameException) as e:
+			logger.debug('RequestTransferExit failed: {!r}'.format(e))
+
+	def _link_alive (self, attempts: int = 2) -> bool:
+		'''
+		Check if the ECU answers. Negative response is an answer too
+		'''
+		for _ in range(attempts):
+			try:
+				self._execute(commands.TesterPresent(ResponseType.REQUIRED))
+				return True
+			except Kwp2000NegativeResponseException:
+				return True
+			except (TimeoutException, KLineFrameException):
+				continue
+		return False
 
 	def handle_errors (self, response: Kwp2000Response) -> Kwp2000Response:
-		if response.success():
-			return response
+		'''
+		Wait out response pending (0x78) messages - every next response is awaited for up to
+		p2_extended_timeout, as many times as the ECU asks for - and raise on a negative response
 
-		if response.frame.data[1] == Kwp2000NegativeStatusIdentifierEnum.REQUEST_CORRECTLY_RECEIVED_RESPONSE_PENDING.value:
-			logger.info('ECU is busy, request received, response pending.')
+		:raises Kwp2000NegativeResponseException: if the final response is negative
+		'''
+		hardware = self.transport.hardware
+		timeout = None
+		status = Kwp2000NegativeStatusIdentifierEnum
+		pending = status.REQUEST_CORRECTLY_RECEIVED_RESPONSE_PENDING.value
 
-			response_pdu = self.transport.read_pdu()
-			self._last_execution_time = time.time()
-			return self.handle_errors(Kwp2000Response(Kwp2000ResponseFrame(status=response_pdu[0], data=response_pdu[1:])))
+		try:
+			while not response.success() and response.frame.data[1] == pending:
+				logger.debug('ECU is busy, request received, response pending.')
+				if self.last_request is not None:
+					self.last_request.response_pending += 1
+
+				if timeout is None:
+					timeout = hardware.get_timeout()
+					hardware.set_timeout(self.p2_extended_timeout)
+
+				response_pdu = self.transport.read_pdu()
+				self._last_execution_time = time.time()
+				response = Kwp2000Response(
+					Kwp2000ResponseFrame(status=response_pdu[0], data=response_pdu[1:])
+				)
+		finally:
+			if timeout is not None:
+				hardware.set_timeout(timeout)
+
+		if response.success():
+			return response
 
 		raise Kwp2000NegativeResponseException(Kwp2000NegativeStatus(identifier=response.frame.data[1]))
 
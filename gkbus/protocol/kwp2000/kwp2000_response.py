@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class Kwp2000ResponseFrame:
 	'''
 	Kwp2000 response frame. 
@@ -15,7 +15,7 @@ class Kwp2000ResponseFrame:
 	def __repr__ (self) -> str:
 		return 'Kwp2000ResponseFrame(status={}, data={!r})'.format(hex(self.status), self.data)
 
-@dataclass
+@dataclass(slots=True)
 class Kwp2000Response:
 	frame: Kwp2000ResponseFrame 
 
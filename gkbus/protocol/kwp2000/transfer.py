@@ -0,0 +1,54 @@
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True)
+class TransferProgress:
+	'''
+	State of a bulk memory transfer, handed to the progress callback after every block
+
+	:param address: first address of the transferred range
+	:param size: number of bytes to transfer
+	:param block_size: block size currently in use, shrinks when the ECU rejects blocks
+	:param done: number of bytes transferred so far
+	:param requests: number of requests sent, failed ones included
+	:param retries: number of blocks which had to be repeated
+	:param wire_bytes: number of data bytes carried by the bus - less than done if the transfer
+		is compressed
+	:param started: time.perf_counter() when the transfer started
+	'''
+	address: int
+	size: int
+	block_size: int
+	done: int = 0
+	requests: int = 0
+	retries: int = 0
+	wire_bytes: int = 0
+	started: float = field(default_factory=time.perf_counter)
+
+	@property
+	def elapsed (self) -> float:
+		return time.perf_counter() - self.started
+
+	@property
+	def bytes_per_second (self) -> float:
+		elapsed = self.elapsed
+		if not elapsed:
+			return 0
+		return self.done / elapsed
+
+	@property
+	def eta (self) -> float | None:
+		'''
+		Seconds until the transfer is done at the current rate, None before the first block
+		'''
+		bytes_per_second = self.bytes_per_second
+		if not bytes_per_second:
+			return None
+		return (self.size - self.done) / bytes_per_second
+
+	def __str__ (self) -> str:
+		eta = self.eta
+		remaining = '?' if eta is None else '{:.1f}s'.format(eta)
+		return '{}/{} bytes, {:.0f} B/s, ETA {}'.format(
+			self.done, self.size, self.bytes_per_second, remaining)
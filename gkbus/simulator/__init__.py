@@ -0,0 +1,9 @@
+'''
+ECU simulators - answer requests sent over virtual hardware from an in-memory image
+'''
+
+from .ccp_ecu import CcpEcu
+from .kwp2000_ecu import Kwp2000Ecu
+from .simulated_ecu import EcuTiming, SimulatedEcu, SimulatedEcuException
+
+__all__ = ['CcpEcu', 'EcuTiming', 'Kwp2000Ecu', 'SimulatedEcu', 'SimulatedEcuException']
@@ -0,0 +1,330 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+from typing_extensions import Self
+
+from ..hardware.hardware_abc import RawFrame
+from ..hardware.virtual_hardware import VirtualCanHardware, VirtualHardware
+from ..protocol.ccp import commands
+from ..protocol.ccp.ccp_response import CcpReturnCode
+from .simulated_ecu import EcuTiming, SimulatedEcu, SimulatedEcuException
+
+logger = logging.getLogger(__name__)
+
+class CcpNegativeResponse(Exception):
+	def __init__ (self, return_code: CcpReturnCode) -> None:
+		self.return_code = return_code
+
+class CcpEcu(SimulatedEcu):
+	'''
+	CCP (CAN Calibration Protocol) ECU simulator. Answers memory transfer commands
+	(SetMemoryTransferAddress, DataUpload, ShortUpload, DataDownload), seed & key,
+	session status and DAQ list setup from the memory image. Started DAQ lists
+	are sampled from the memory image and transmitted periodically as DTOs from a background thread
+
+	:param cro_id: CAN identifier the ECU listens on (tx_id of the tester transport)
+	:param dto_id: CAN identifier the ECU answers on (rx_id of the tester transport)
+	:param station_address: station address the ECU answers Connect/TestAvailability to
+	:param seed: seed returned by GetSeedForKey
+	:param key_algorithm: callable calculating the expected key from the seed.
+		None - any key is accepted
+	:param daq_list_sizes: number of ODTs in each of the DAQ lists
+	:param event_channel_periods: period in seconds of each event channel.
+		Channels not listed tick every 10ms
+	'''
+	def __init__ (self,
+			image: bytes = bytes(),
+			base_address: int = 0,
+			timing: EcuTiming | None = None,
+			cro_id: int = 0x7E8,
+			dto_id: int = 0x7EA,
+			station_address: int = 0x01,
+			seed: bytes = b'\x12\x34\x56\x78',
+			key_algorithm: Callable[[bytes], bytes] | None = None,
+			daq_list_sizes: list[int] | None = None,
+			event_channel_periods: dict[int, float] | None = None
+		) -> None:
+		super().__init__(image, base_address, timing)
+		self.cro_id, self.dto_id = cro_id, dto_id
+		self.station_address = station_address
+		self.seed = seed
+		self.key_algorithm = key_algorithm
+		self.event_channel_periods: dict[int, float] = event_channel_periods or {}
+
+		self.connected: bool = False
+		self.session_status: int = 0x00
+		self.unlocked_resources: int = 0x00
+		self.mta: list[int] = [self.base_address, self.base_address]
+		self.daq_lists: list[dict] = [
+			{
+				'odts': [[] for _ in range(size)], 'can_id': self.dto_id,
+				'mode': 0, 'last_odt': 0, 'period': 0.01, 'next_due': 0
+			}
+			for size in (daq_list_sizes if daq_list_sizes is not None else [4, 4])
+		]
+		self._daq_pointer: tuple[int, int, int] = (0, 0, 0)
+		self._daq_lock = threading.Lock()
+		self._daq_event = threading.Event()
+		self._daq_thread: threading.Thread | None = None
+
+		self.handlers: dict[int, Callable[[bytes], bytes | None]] = {
+			commands.Connect.code: self._connect,
+			commands.Disconnect.code: self._disconnect,
+			commands.TestAvailability.code: lambda data: bytes(),
+			commands.GetImplementedVersionOfCcp.code: lambda data: bytes([0x02, 0x01]),
+			commands.ExchangeStationIdentifications.code: lambda data: b'\x00\x00\x03\x03',
+			commands.GetSeedForKey.code: self._get_seed,
+			commands.UnlockProtection.code: self._unlock,
+			commands.SetSessionStatus.code: self._set_session_status,
+			commands.GetSessionStatus.code: lambda data: bytes([self.session_status, 0x00]),
+			commands.GetCurrentlyActiveCalibrationPage.code: self._active_calibration_page,
+			commands.SetMemoryTransferAddress.code: self._set_mta,
+			commands.DataUpload.code: self._upload,
+			commands.ShortUpload.code: self._short_upload,
+			commands.DataDownload.code: self._download,
+			commands.GetSizeOfDaqList.code: self._get_daq_size,
+			commands.SetDaqListPointer.code: self._set_daq_pointer,
+			commands.WriteDaqListEntry.code: self._write_daq_entry,
+			commands.StartStopDataTransmission.code: self._start_stop,
+			commands.StartStopSynchronisedDataTransmission.code: self._start_stop_all,
+		}
+
+	def attach (self, hardware: VirtualHardware) -> Self:
+		if not isinstance(hardware, VirtualCanHardware):
+			raise SimulatedEcuException(
+				'{} is not supported by the CCP simulator'.format(type(hardware).__name__)
+			)
+		return super().attach(hardware)
+
+	def detach (self) -> None:
+		self.stop_daq()
+		super().detach()
+
+	def handle_cro (self, cro: bytes) -> bytes | None:
+		'''
+		Process a Command Receive Object
+
+		:return: Command Return Message (8 bytes), None if the ECU stays silent
+		'''
+		code, counter, data = cro[0], cro[1], bytes(cro[2:8])
+
+		connectionless = [commands.Connect.code, commands.TestAvailability.code]
+		if not self.connected and code not in connectionless:
+			return None
+
+		handler = self.handlers.get(code)
+		try:
+			if handler is None:
+				raise CcpNegativeResponse(CcpReturnCode.UNKNOWN_COMMAND)
+			payload = handler(data)
+		except CcpNegativeResponse as e:
+			return bytes([0xFF, e.return_code.value, counter]) + bytes(5)
+
+		if payload is None:
+			return None
+
+		header = bytes([0xFF, CcpReturnCode.ACKNOWLEDGE.value, counter])
+		return header + payload[:5] + bytes(5-len(payload[:5]))
+
+	def on_frame (self, frame: RawFrame) -> None:
+		if frame.identifier != self.cro_id or len(frame.data) < 2:
+			return
+
+		if not self._accepts_request():
+			logger.debug('CRO received before P3min elapsed, ignoring')
+			return
+
+		crm = self.handle_cro(frame.data)
+		if crm is not None:
+			self._send(RawFrame(identifier=self.dto_id, data=crm), self.timing.p2)
+
+	def _read (self, address: int, size: int) -> bytes:
+		try:
+			return self.read_memory(address, size)
+		except SimulatedEcuException:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+
+	def _connect (self, data: bytes) -> bytes | None:
+		if int.from_bytes(data[0:2], 'little') != self.station_address:
+			return None
+		self.connected = True
+		return bytes()
+
+	def _disconnect (self, data: bytes) -> bytes:
+		if data[0] == 0x01: # end of session
+			self.connected = False
+			self.unlocked_resources = 0x00
+			self.stop_daq()
+		return bytes()
+
+	def _get_seed (self, data: bytes) -> bytes:
+		protected = 0x00 if (self.unlocked_resources & data[0]) else 0x01
+		return bytes([protected]) + self.seed[:4]
+
+	def _unlock (self, data: bytes) -> bytes:
+		if self.key_algorithm is not None:
+			key = self.key_algorithm(self.seed)
+			if data[:len(key)] != key:
+				raise CcpNegativeResponse(CcpReturnCode.ACCESS_LOCKED)
+		self.unlocked_resources = 0xFF
+		return bytes([self.unlocked_resources])
+
+	def _set_session_status (self, data: bytes) -> bytes:
+		self.session_status = data[0]
+		return bytes()
+
+	def _active_calibration_page (self, data: bytes) -> bytes:
+		return bytes([0x00]) + self.base_address.to_bytes(4, 'little')
+
+	def _set_mta (self, data: bytes) -> bytes:
+		if data[0] not in [0, 1]:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+		self.mta[data[0]] = int.from_bytes(data[2:6], 'little')
+		return bytes()
+
+	def _upload (self, data: bytes) -> bytes:
+		size = data[0]
+		if size > 5:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+		chunk = self._read(self.mta[0], size)
+		self.mta[0] += size
+		return chunk
+
+	def _short_upload (self, data: bytes) -> bytes:
+		size = data[0]
+		if size > 5:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+		return self._read(int.from_bytes(data[2:6], 'little'), size)
+
+	def _download (self, data: bytes) -> bytes:
+		size = data[0]
+		if size > 5:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+		try:
+			self.write_memory(self.mta[0], data[1:1+size])
+		except SimulatedEcuException:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+		self.mta[0] += size
+		return bytes([0x00]) + self.mta[0].to_bytes(4, 'little')
+
+	def _get_daq_size (self, data: bytes) -> bytes:
+		list_number = data[0]
+		if list_number >= len(self.daq_lists):
+			return bytes([0x00, 0x00])
+
+		daq_list = self.daq_lists[list_number]
+		can_identifier = int.from_bytes(data[2:6], 'little')
+		with self._daq_lock:
+			daq_list['odts'] = [[] for _ in daq_list['odts']]
+			daq_list['mode'] = 0
+			daq_list['can_id'] = can_identifier if can_identifier else self.dto_id
+
+		return bytes([len(daq_list['odts']), self._first_pid(list_number)])
+
+	def _first_pid (self, list_number: int) -> int:
+		return sum([len(x['odts']) for x in self.daq_lists[:list_number]])
+
+	def _set_daq_pointer (self, data: bytes) -> bytes:
+		list_number, odt_number, element_number = data[0], data[1], data[2]
+		if list_number >= len(self.daq_lists) or element_number > 6:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+		if odt_number >= len(self.daq_lists[list_number]['odts']):
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+		self._daq_pointer = (list_number, odt_number, element_number)
+		return bytes()
+
+	def _write_daq_entry (self, data: bytes) -> bytes:
+		list_number, odt_number, element_number = self._daq_pointer
+		size, address = data[0], int.from_bytes(data[2:6], 'little')
+		if size not in [1, 2, 4]:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+
+		with self._daq_lock:
+			odt = self.daq_lists[list_number]['odts'][odt_number]
+			odt[element_number:element_number+1] = [(size, address)]
+
+		self._daq_pointer = (list_number, odt_number, element_number+1)
+		return bytes()
+
+	def _start_stop (self, data: bytes) -> bytes:
+		mode, list_number, last_odt, event_channel = data[0], data[1], data[2], data[3]
+		prescaler = max(1, int.from_bytes(data[4:6], 'little'))
+		if list_number >= len(self.daq_lists) or mode not in [0, 1, 2]:
+			raise CcpNegativeResponse(CcpReturnCode.PARAMETERS_OUT_OF_RANGE)
+
+		with self._daq_lock:
+			daq_list = self.daq_lists[list_number]
+			daq_list['mode'] = mode # 0x00 - stop, 0x01 - start, 0x02 - prepare
+			daq_list['last_odt'] = last_odt
+			daq_list['period'] = self.event_channel_periods.get(event_channel, 0.01)*prescaler
+			daq_list['next_due'] = time.perf_counter()
+
+		if mode == 1:
+			self.start_daq()
+		return bytes()
+
+	def _start_stop_all (self, data: bytes) -> bytes:
+		with self._daq_lock:
+			for daq_list in self.daq_lists:
+				if data[0] == 0x01 and daq_list['mode'] == 2:
+					daq_list['mode'] = 1
+					daq_list['next_due'] = time.perf_counter()
+				elif data[0] == 0x00:
+					daq_list['mode'] = 0
+
+		if data[0] == 0x01:
+			self.start_daq()
+		return bytes()
+
+	def start_daq (self) -> None:
+		'''
+		Start the background thread transmitting DTOs of started DAQ lists
+		'''
+		if self._daq_thread is not None and self._daq_thread.is_alive():
+			return
+		self._daq_event.clear()
+		self._daq_thread = threading.Thread(target=self._daq_loop, daemon=True)
+		self._daq_thread.start()
+
+	def stop_daq (self) -> None:
+		self._daq_event.set()
+		if self._daq_thread is not None and self._daq_thread is not threading.current_thread():
+			self._daq_thread.join()
+		self._daq_thread = None
+
+	def _sample_odt (self, pid: int, odt: list[tuple[int, int]]) -> bytes:
+		data = bytes([pid])
+		for size, address in odt:
+			try:
+				data += self.read_memory(address, size)
+			except SimulatedEcuException:
+				data += bytes(size)
+		return data[:8] + bytes(8-len(data[:8]))
+
+	def _daq_loop (self) -> None:
+		while not self._daq_event.is_set() and (hardware := self.hardware) is not None:
+			now = time.perf_counter()
+			next_due = now + 0.1
+
+			with self._daq_lock:
+				for list_number, daq_list in enumerate(self.daq_lists):
+					if daq_list['mode'] != 1:
+						continue
+
+					if daq_list['next_due'] <= now:
+						first_pid = self._first_pid(list_number)
+						for odt_number, odt in enumerate(daq_list['odts'][:daq_list['last_odt']+1]):
+							dto = self._sample_odt(first_pid+odt_number, odt)
+							hardware.inject(
+								RawFrame(identifier=daq_list['can_id'], data=dto),
+								odt_number*self.timing.st_min
+							)
+						daq_list['next_due'] += daq_list['period']
+						if daq_list['next_due'] < now: # we're late - don't try to catch up
+							daq_list['next_due'] = now + daq_list['period']
+
+					next_due = min(next_due, daq_list['next_due'])
+
+			self._daq_event.wait(max(0, next_due - time.perf_counter()))
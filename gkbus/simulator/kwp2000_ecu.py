@@ -0,0 +1,423 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from typing_extensions import Self
+
+from ..hardware.hardware_abc import RawFrame
+from ..hardware.virtual_hardware import VirtualCanHardware, VirtualHardware, VirtualKLineHardware
+from ..protocol.kwp2000 import commands
+from ..protocol.kwp2000.codecs import Codec, CodecException, CodecStream, IdentityCodec
+from ..protocol.kwp2000.kwp2000_negative_status import Kwp2000NegativeStatusIdentifierEnum as Nrc
+from ..transport.isotp import (
+	FlowStatus,
+	IsoTpException,
+	IsoTpFrameType,
+	IsoTpParameters,
+	IsoTpReassembler,
+	decode_st_min,
+	flow_control,
+	frame_type,
+	segment,
+)
+from .simulated_ecu import EcuTiming, SimulatedEcu, SimulatedEcuException
+
+logger = logging.getLogger(__name__)
+
+class Kwp2000NegativeResponse(Exception):
+	def __init__ (self, code: Nrc) -> None:
+		self.code = code
+
+@dataclass(slots=True)
+class _Transfer:
+	'''
+	RequestUpload/RequestDownload in progress
+
+	:param direction: 'upload' or 'download'
+	:param address: next address to read from or write to
+	:param remaining: number of memory bytes left to transfer
+	:param stream: encoder of the image (upload) or decoder of the received data (download)
+	:param pending: encoded bytes not sent yet, upload only
+	'''
+	direction: str
+	address: int
+	remaining: int
+	stream: CodecStream
+	pending: bytearray = field(default_factory=bytearray)
+
+class Kwp2000Ecu(SimulatedEcu):
+	'''
+	KWP2000 (ISO 14230) ECU simulator. Answers StartCommunication, StartDiagnosticSession,
+	TesterPresent, SecurityAccess, ReadMemoryByAddress, WriteMemoryByAddress,
+	RequestUpload/RequestDownload/TransferData/RequestTransferExit from the memory image.
+	Anything else is answered with SERVICE_NOT_SUPPORTED. Works over K-Line
+	and over CAN (ISO-TP), depending on the virtual hardware it's attached to
+
+	:param address: ECU address on the K-Line (tx_id of the tester transport)
+	:param tester_address: tester address on the K-Line (rx_id of the tester transport)
+	:param request_id: CAN identifier the ECU listens on (tx_id of the tester transport)
+	:param response_id: CAN identifier the ECU answers on (rx_id of the tester transport)
+	:param isotp_parameters: block size and STmin the ECU asks the tester for, and padding
+		of the frames it sends. Consecutive frames sent by the ECU are spaced by the
+		tester's STmin or timing.st_min, whichever is longer
+	:param seed: seed returned by SecurityAccess
+	:param key_algorithm: callable calculating the expected key from the seed.
+		None - any key is accepted
+	:param response_pending: number of 0x78 (response pending) messages sent
+		before the actual response, per service identifier. For example {0x31: 5}
+	:param max_block_size: largest block ReadMemoryByAddress and TransferData will serve,
+		bigger requests are rejected with CANT_UPLOAD_REQUESTED_NUMBER_OF_BYTES
+	:param baudrates: K-Line baudrates the ECU switches to, by StartDiagnosticSession baudrate
+		identifier. For example {0x03: 38400}. The ECU switches after sending the positive
+		response, requests sent at any other baudrate are ignored until timing.p3max passes
+		without a valid request - then the ECU drops back to the baudrate of the bus
+	:param data_formats: RequestUpload/RequestDownload data formats the ECU accepts, by the
+		data format byte - compression in the high nibble, encryption in the low one.
+		For example {0x10: LzssCodec()}. Uncompressed, unencrypted data only by default
+	'''
+	def __init__ (self,
+			image: bytes = bytes(),
+			base_address: int = 0,
+			timing: EcuTiming | None = None,
+			address: int = 0x11,
+			tester_address: int = 0xF1,
+			seed: bytes = b'\x12\x34',
+			key_algorithm: Callable[[bytes], bytes] | None = None,
+			response_pending: dict[int, int] | None = None,
+			max_block_size: int = 0xFE,
+			request_id: int = 0x7E0,
+			response_id: int = 0x7E8,
+			isotp_parameters: IsoTpParameters | None = None,
+			baudrates: dict[int, int] | None = None,
+			data_formats: dict[int, Codec] | None = None
+		) -> None:
+		super().__init__(image, base_address, timing)
+		self.address, self.tester_address = address, tester_address
+		self.seed = seed
+		self.key_algorithm = key_algorithm
+		self.response_pending: dict[int, int] = response_pending or {}
+		self.max_block_size = max_block_size
+		self.request_id, self.response_id = request_id, response_id
+		self.isotp_parameters: IsoTpParameters = isotp_parameters or IsoTpParameters()
+
+		self.baudrates: dict[int, int] = baudrates if baudrates is not None else {}
+		self.baudrate: int | None = None # None - whatever the bus runs at
+		self._switch_baudrate_to: int | None = None
+		if data_formats is None:
+			data_formats = {0x00: IdentityCodec()}
+		self.data_formats: dict[int, Codec] = data_formats
+
+		self.session: int = 0x81
+		self.security_unlocked: bool = False
+		self._transfer: _Transfer | None = None
+		self._reassembler = IsoTpReassembler()
+		self._rx_block_remaining: int = 0
+		self._tx_frames: list[bytes] = []
+
+		self.handlers: dict[int, Callable[[bytes], bytes]] = {
+			commands.StartCommunication.service_identifier: self._start_communication,
+			commands.StopCommunication.service_identifier: lambda data: bytes(),
+			commands.StartDiagnosticSession.service_identifier: self._start_diagnostic_session,
+			commands.TesterPresent.service_identifier: lambda data: bytes(),
+			commands.SecurityAccess.service_identifier: self._security_access,
+			commands.ReadMemoryByAddress.service_identifier: self._read_memory_by_address,
+			commands.WriteMemoryByAddress.service_identifier: self._write_memory_by_address,
+			commands.RequestUpload.service_identifier: self._request_upload,
+			commands.RequestDownload.service_identifier: self._request_download,
+			commands.TransferData.service_identifier: self._transfer_data,
+			commands.RequestTransferExit.service_identifier: self._request_transfer_exit,
+		}
+
+	def attach (self, hardware: VirtualHardware) -> Self:
+		if not isinstance(hardware, (VirtualKLineHardware, VirtualCanHardware)):
+			raise SimulatedEcuException(
+				'{} is not supported by the KWP2000 simulator'.format(type(hardware).__name__)
+			)
+		return super().attach(hardware)
+
+	def handle_pdu (self, pdu: bytes) -> list[bytes]:
+		'''
+		Process a request PDU (service identifier + data)
+
+		:return: response PDUs, in order - response pending messages first, if any
+		'''
+		service_identifier, data = pdu[0], pdu[1:]
+		pending = Nrc.REQUEST_CORRECTLY_RECEIVED_RESPONSE_PENDING.value
+		count = self.response_pending.get(service_identifier, 0)
+		responses = [bytes([0x7F, service_identifier, pending])]*count
+
+		handler = self.handlers.get(service_identifier)
+		try:
+			if handler is None:
+				raise Kwp2000NegativeResponse(Nrc.SERVICE_NOT_SUPPORTED)
+			responses.append(bytes([service_identifier+0x40]) + handler(data))
+		except Kwp2000NegativeResponse as e:
+			responses.append(bytes([0x7F, service_identifier, e.code.value]))
+
+		return responses
+
+	def on_frame (self, frame: RawFrame) -> None:
+		if isinstance(self.hardware, VirtualCanHardware):
+			return self._on_can_frame(frame)
+
+		if not self._accepts_request():
+			logger.debug('Request received before P3min elapsed, ignoring')
+			return
+
+		bus_baudrate = self._attached_hardware().get_baudrate()
+		if self.baudrate is not None and bus_baudrate != self.baudrate:
+			if time.perf_counter_ns() < self._last_response_at + int(self.timing.p3max*1000000000):
+				logger.debug('Request received at {} baud, ECU is at {}, ignoring'.format(
+					bus_baudrate, self.baudrate))
+				return
+			logger.debug('P3max passed, back to the default session and baudrate')
+			self.baudrate, self.session = None, 0x81
+
+		pdu = self.unframe(frame.data)
+		if pdu is None:
+			return
+
+		delay = self.timing.p2
+		for response in self.handle_pdu(pdu):
+			self._send(RawFrame(identifier=False, data=self.frame(response)), delay)
+			delay += self.timing.response_pending_interval
+
+		# switched after the response went out at the current baudrate
+		if self._switch_baudrate_to is not None:
+			self.baudrate, self._switch_baudrate_to = self._switch_baudrate_to, None
+
+	def _on_can_frame (self, frame: RawFrame) -> None:
+		if frame.identifier != self.request_id:
+			return
+
+		kind = frame_type(frame.data)
+		if kind == IsoTpFrameType.FLOW_CONTROL:
+			return self._on_flow_control(frame.data)
+
+		starts_request = kind in [IsoTpFrameType.SINGLE_FRAME, IsoTpFrameType.FIRST_FRAME]
+		if starts_request and not self._accepts_request():
+			logger.debug('Request received before P3min elapsed, ignoring')
+			return
+
+		try:
+			pdu = self._reassembler.feed(frame.data)
+		except IsoTpException as e:
+			logger.debug('Dropping request: {}'.format(e))
+			return
+
+		if kind == IsoTpFrameType.FIRST_FRAME:
+			self._send_flow_control()
+		elif (kind == IsoTpFrameType.CONSECUTIVE_FRAME and self._reassembler.in_progress
+				and self.isotp_parameters.block_size):
+			self._rx_block_remaining -= 1
+			if self._rx_block_remaining == 0:
+				self._send_flow_control()
+
+		if pdu is None:
+			return
+
+		delay = self.timing.p2
+		for response in self.handle_pdu(pdu):
+			frames = segment(response, self.isotp_parameters.padding)
+			self._send(RawFrame(identifier=self.response_id, data=frames[0]), delay)
+			self._tx_frames = frames[1:] # the rest waits for the tester's flow control
+			delay += self.timing.response_pending_interval
+
+	def _send_flow_control (self) -> None:
+		parameters = self.isotp_parameters
+		self._rx_block_remaining = parameters.block_size
+		self._send(RawFrame(
+			identifier=self.response_id,
+			data=flow_control(FlowStatus.CONTINUE_TO_SEND,
+				parameters.block_size, parameters.st_min, parameters.padding)
+		))
+
+	def _on_flow_control (self, data: bytes) -> None:
+		if not self._tx_frames or len(data) < 3:
+			return
+
+		status = data[0] & 0x0F
+		if status == FlowStatus.OVERFLOW.value:
+			self._tx_frames = []
+			return
+		if status != FlowStatus.CONTINUE_TO_SEND.value:
+			return
+
+		block_size, st_min = data[1], max(decode_st_min(data[2]), self.timing.st_min)
+		block = self._tx_frames[:block_size] if block_size else self._tx_frames
+		self._tx_frames = self._tx_frames[len(block):]
+
+		for index, frame in enumerate(block):
+			self._send(RawFrame(identifier=self.response_id, data=frame), index*st_min)
+
+	def unframe (self, data: bytes) -> bytes | None:
+		'''
+		Strip K-Line header and checksum from a request, as built by Kwp2000OverKLineTransport
+
+		:return: request PDU, None if the frame is malformed or not addressed to this ECU
+		'''
+		if len(data) < 4 or (sum(data[:-1]) & 0xFF) != data[-1]:
+			return None
+
+		if data[0] == 0x80:
+			length, offset = data[3], 4
+		else:
+			length, offset = data[0]-0x80, 3
+
+		if data[1] != self.address or len(data) != offset+length+1:
+			return None
+
+		return bytes(data[offset:offset+length])
+
+	def frame (self, pdu: bytes) -> bytes:
+		'''
+		Add K-Line header (format byte with addresses, separate length byte above 63 bytes)
+		and checksum
+		'''
+		if len(pdu) <= 0x3F:
+			header = bytes([0x80 | len(pdu), self.tester_address, self.address])
+		else:
+			header = bytes([0x80, self.tester_address, self.address, len(pdu)])
+
+		payload = header + pdu
+		return payload + bytes([sum(payload) & 0xFF])
+
+	def _read (self, address: int, size: int) -> bytes:
+		try:
+			return self.read_memory(address, size)
+		except SimulatedEcuException:
+			raise Kwp2000NegativeResponse(Nrc.REQUEST_OUT_OF_RANGE)
+
+	def _start_communication (self, data: bytes) -> bytes:
+		return bytes([0xEF, 0x8F]) # key bytes
+
+	def _start_diagnostic_session (self, data: bytes) -> bytes:
+		if len(data) < 1:
+			raise Kwp2000NegativeResponse(Nrc.INCORRECT_MESSAGE_LENGTH_OR_INVALID_FORMAT)
+		if len(data) > 1:
+			if not isinstance(self.hardware, VirtualKLineHardware) or data[1] not in self.baudrates:
+				raise Kwp2000NegativeResponse(Nrc.REQUEST_OUT_OF_RANGE)
+			self._switch_baudrate_to = self.baudrates[data[1]]
+		self.session = data[0]
+		return data[0:1]
+
+	def _security_access (self, data: bytes) -> bytes:
+		if len(data) < 1:
+			raise Kwp2000NegativeResponse(Nrc.INCORRECT_MESSAGE_LENGTH_OR_INVALID_FORMAT)
+
+		access_level = data[0]
+		if access_level % 2 == 1: # request seed
+			if self.security_unlocked:
+				return bytes([access_level]) + bytes(len(self.seed))
+			return bytes([access_level]) + self.seed
+
+		if self.key_algorithm is not None and self.key_algorithm(self.seed) != data[1:]:
+			raise Kwp2000NegativeResponse(Nrc.INVALID_KEY)
+
+		self.security_unlocked = True
+		return bytes([access_level, 0x34])
+
+	def _read_memory_by_address (self, data: bytes) -> bytes:
+		if len(data) != 4:
+			raise Kwp2000NegativeResponse(Nrc.INCORRECT_MESSAGE_LENGTH_OR_INVALID_FORMAT)
+
+		size = data[3]
+		if size > self.max_block_size:
+			raise Kwp2000NegativeResponse(Nrc.CANT_UPLOAD_REQUESTED_NUMBER_OF_BYTES)
+
+		return self._read(int.from_bytes(data[0:3], 'big'), size)
+
+	def _write_memory_by_address (self, data: bytes) -> bytes:
+		if len(data) < 4 or len(data) != 4 + data[3]:
+			raise Kwp2000NegativeResponse(Nrc.INCORRECT_MESSAGE_LENGTH_OR_INVALID_FORMAT)
+
+		try:
+			self.write_memory(int.from_bytes(data[0:3], 'big'), data[4:])
+		except SimulatedEcuException:
+			raise Kwp2000NegativeResponse(Nrc.REQUEST_OUT_OF_RANGE)
+
+		return data[0:3]
+
+	def _request_transfer (self,
+			data: bytes,
+			direction: str,
+			improper_type: Nrc,
+			out_of_range: Nrc
+		) -> bytes:
+		if len(data) != 7:
+			raise Kwp2000NegativeResponse(Nrc.INCORRECT_MESSAGE_LENGTH_OR_INVALID_FORMAT)
+
+		codec = self.data_formats.get(data[3])
+		if codec is None:
+			raise Kwp2000NegativeResponse(improper_type)
+
+		address, size = int.from_bytes(data[0:3], 'big'), int.from_bytes(data[4:7], 'big')
+		offset = address - self.base_address
+		if offset < 0 or offset + size > len(self.memory):
+			raise Kwp2000NegativeResponse(out_of_range)
+
+		# upload: the image is encoded as it's read, download: decoded as it's received
+		stream = codec.encoder() if direction == 'upload' else codec.decoder()
+		self._transfer = _Transfer(direction, address, size, stream)
+		return bytes([self.max_block_size])
+
+	def _request_upload (self, data: bytes) -> bytes:
+		return self._request_transfer(data, 'upload',
+			Nrc.IMPROPER_UPLOAD_TYPE, Nrc.CANT_UPLOAD_FROM_SPECIFIED_ADDRESS)
+
+	def _request_download (self, data: bytes) -> bytes:
+		return self._request_transfer(data, 'download',
+			Nrc.IMPROPER_DOWNLOAD_TYPE, Nrc.CANT_DOWNLOAD_TO_SPECIFIC_ADDRESS)
+
+	def _transfer_data (self, data: bytes) -> bytes:
+		transfer = self._transfer
+		if transfer is None or (transfer.remaining == 0 and not transfer.pending):
+			raise Kwp2000NegativeResponse(Nrc.REQUEST_SEQUENCE_ERROR)
+
+		if transfer.direction == 'upload':
+			while len(transfer.pending) < self.max_block_size and transfer.remaining:
+				size = min(self.max_block_size, transfer.remaining)
+				transfer.pending += transfer.stream.update(self._read(transfer.address, size))
+				transfer.address += size
+				transfer.remaining -= size
+				if not transfer.remaining:
+					transfer.pending += transfer.stream.flush()
+
+			chunk = bytes(transfer.pending[:self.max_block_size])
+			del transfer.pending[:len(chunk)]
+			return chunk
+
+		if len(data) > self.max_block_size:
+			raise Kwp2000NegativeResponse(Nrc.ILLEGAL_BYTE_COUNT_IN_BLOCK_TRANSFER)
+		try:
+			decoded = transfer.stream.update(data)
+		except CodecException:
+			self._transfer = None
+			raise Kwp2000NegativeResponse(Nrc.DATA_DECOMPRESSION_FAILED)
+
+		self._write_decoded(transfer, decoded)
+		return bytes()
+
+	def _write_decoded (self, transfer: _Transfer, data: bytes) -> None:
+		if len(data) > transfer.remaining:
+			raise Kwp2000NegativeResponse(Nrc.ILLEGAL_BYTE_COUNT_IN_BLOCK_TRANSFER)
+
+		self.write_memory(transfer.address, data)
+		transfer.address += len(data)
+		transfer.remaining -= len(data)
+
+	def _request_transfer_exit (self, data: bytes) -> bytes:
+		transfer = self._transfer
+		if transfer is None:
+			raise Kwp2000NegativeResponse(Nrc.REQUEST_SEQUENCE_ERROR)
+
+		if transfer.direction == 'download':
+			try:
+				self._write_decoded(transfer, transfer.stream.flush())
+			except CodecException:
+				self._transfer = None
+				raise Kwp2000NegativeResponse(Nrc.DATA_DECOMPRESSION_FAILED)
+
+		self._transfer = None
+		return bytes()
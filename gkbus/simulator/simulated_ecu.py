@@ -0,0 +1,109 @@
+import time
+from dataclasses import dataclass
+
+from typing_extensions import Self
+
+from ..hardware.hardware_abc import RawFrame
+from ..hardware.virtual_hardware import VirtualHardware
+
+
+class SimulatedEcuException(Exception):
+	pass
+
+@dataclass
+class EcuTiming:
+	'''
+	Timing the simulated ECU follows when answering. All values in seconds
+
+	:param p2: time between the end of a request and the start of the response (P2)
+	:param p3min: minimum time between the end of a response and the next request (P3min).
+		Requests arriving earlier are ignored, like a real ECU would. 0 - accept everything
+	:param response_pending_interval: time between consecutive 0x78 response pending messages
+	:param st_min: minimum time between consecutive frames sent by the ECU (STmin), where applicable
+	:param p3max: time without a valid request after which the ECU drops back to the default
+		session and baudrate, where applicable
+	'''
+	p2: float = 0
+	p3min: float = 0
+	response_pending_interval: float = 0.02
+	st_min: float = 0
+	p3max: float = 5
+
+class SimulatedEcu:
+	'''
+	Base class for ECU simulators answering requests sent over a :py:class:`VirtualHardware`
+	bus from an in-memory flash image
+
+	:param image: initial contents of the ECU memory
+	:param base_address: address the first byte of the image is mapped at
+	:param timing: response timing, instant by default
+	'''
+	def __init__ (self,
+			image: bytes = bytes(),
+			base_address: int = 0,
+			timing: EcuTiming | None = None
+		) -> None:
+		self.memory: bytearray = bytearray(image)
+		self.base_address: int = base_address
+		self.timing: EcuTiming = timing if timing is not None else EcuTiming()
+		self.hardware: VirtualHardware | None = None
+		self._last_response_at: int = 0
+
+	def attach (self, hardware: VirtualHardware) -> Self:
+		'''
+		Plug the ECU into the virtual bus - it will receive every frame written to the hardware
+		'''
+		self.hardware = hardware
+		hardware.set_responder(self.on_frame)
+		return self
+
+	def detach (self) -> None:
+		if self.hardware is not None:
+			self.hardware.set_responder(None)
+		self.hardware = None
+
+	def on_frame (self, frame: RawFrame) -> None:
+		'''
+		Handle a frame written by the tester. Responses are injected into the hardware
+		'''
+		raise NotImplementedError
+
+	def _accepts_request (self) -> bool:
+		'''
+		Check whether P3min elapsed since the end of the last response
+		'''
+		if not self.timing.p3min:
+			return True
+		return time.perf_counter_ns() >= self._last_response_at + int(self.timing.p3min*1000000000)
+
+	def _attached_hardware (self) -> VirtualHardware:
+		'''
+		:raises SimulatedEcuException: if the ECU is not attached to any hardware
+		'''
+		if self.hardware is None:
+			raise SimulatedEcuException('ECU is not attached to any hardware')
+		return self.hardware
+
+	def _send (self, frame: RawFrame, delay: float = 0) -> None:
+		'''
+		Put a frame on the bus after delay seconds
+		'''
+		self._attached_hardware().inject(frame, delay)
+		response_at = time.perf_counter_ns() + int(delay*1000000000)
+		self._last_response_at = max(self._last_response_at, response_at)
+
+	def read_memory (self, address: int, size: int) -> bytes:
+		offset = address - self.base_address
+		if offset < 0 or size < 0 or offset + size > len(self.memory):
+			raise SimulatedEcuException(
+				'Address {} + {} bytes is out of range'.format(hex(address), size)
+			)
+		return bytes(self.memory[offset:offset+size])
+
+	def write_memory (self, address: int, data: bytes) -> None:
+		offset = address - self.base_address
+		if offset < 0 or offset + len(data) > len(self.memory):
+			raise SimulatedEcuException(
+				'Address {} + {} bytes is out of range'.format(hex(address), len(data))
+			)
+		self.memory[offset:offset+len(data)] = data
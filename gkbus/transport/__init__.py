@@ -2,9 +2,13 @@
 Transport layers
 '''
 
+from .capture import CandumpCapture, CaptureWriter, PcapngCapture
 from .ccp_over_can_transport import CcpOverCanTransport
+from .isotp import IsoTp, IsoTpException, IsoTpParameters, IsoTpTransferStatistics
+from .kline_framing import ChecksumException, KLineFrame, KLineFrameException, KLineFrameParser
 from .kwp2000_over_can_transport import Kwp2000OverCanTransport
 from .kwp2000_over_kline_transport import Kwp2000OverKLineTransport
+from .replay_transport import ReplayException, ReplayTransport
 from .transport_abc import PacketDirection, RawPacket, TransportABC
 
-__all__ = ['CcpOverCanTransport', 'Kwp2000OverCanTransport', 'Kwp2000OverKLineTransport', 'PacketDirection', 'RawPacket', 'TransportABC']
+__all__ = ['CandumpCapture', 'CaptureWriter', 'CcpOverCanTransport', 'ChecksumException', 'IsoTp', 'IsoTpException', 'IsoTpParameters', 'IsoTpTransferStatistics', 'KLineFrame', 'KLineFrameException', 'KLineFrameParser', 'Kwp2000OverCanTransport', 'Kwp2000OverKLineTransport', 'PacketDirection', 'PcapngCapture', 'RawPacket', 'ReplayException', 'ReplayTransport', 'TransportABC']
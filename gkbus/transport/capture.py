@@ -0,0 +1,262 @@
+import logging
+import queue
+import struct
+import threading
+from types import TracebackType
+from typing import BinaryIO
+
+from typing_extensions import Self
+
+from .isotp import segment
+from .transport_abc import PacketDirection, RawPacket
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+CANFD_LENGTHS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+
+def canfd_frames (data: bytes) -> list[bytes]:
+	'''
+	Cut data into CAN FD frames of up to 64 bytes, the last one padded with zeros
+	to a valid CAN FD length
+	'''
+	frames = []
+	for x in range(0, len(data), 64):
+		frame = data[x:x+64]
+		frames.append(frame + bytes(next(n for n in CANFD_LENGTHS if n >= len(frame)) - len(frame)))
+	return frames or [bytes()]
+
+class CaptureWriter:
+	'''
+	Streams every RawPacket pushed by a transport to a file. Packets are queued
+	and formatted/written in batches by a background thread, so logging a packet
+	never waits for the disk. Attach to a transport with TransportABC.set_capture(),
+	close when done (or use as a context manager) to flush what's left in the queue.
+	If writing fails, the error is logged, further packets are dropped and close() raises it
+
+	:param path: file to write to, overwritten if it exists
+	:param isotp: packets are ISO-TP payloads (KWP2000 over CAN) - log them as the
+		single/first/consecutive frames they were carried in, so CAN tools can decode them.
+		Flow control frames are not part of the log
+	:param fd: log CAN packets longer than 8 bytes as CAN FD frames, padded with zeros
+		to the next valid CAN FD length. Otherwise they are logged as ISO-TP frames -
+		a classic CAN frame can't carry them
+	:param batch_size: maximum number of packets written at once
+	'''
+	def __init__ (self,
+			path: str,
+			isotp: bool = False,
+			fd: bool = False,
+			batch_size: int = 256
+		) -> None:
+		self.path = path
+		self.isotp = isotp
+		self.fd = fd
+		self.batch_size = batch_size
+		self.packets_written: int = 0
+		self.error: Exception | None = None # why the writer thread stopped
+		self._warned_long_packet = False
+		self._queue: queue.SimpleQueue = queue.SimpleQueue()
+		self._file: BinaryIO = open(path, 'wb')
+		self._file.write(self.header())
+		self._thread = threading.Thread(target=self._writer, daemon=True)
+		self._thread.start()
+
+	def push (self, packet: RawPacket) -> None:
+		'''
+		Queue a packet to be written, dropped if the writer thread stopped on an error
+		'''
+		if self.error is None:
+			self._queue.put(packet)
+
+	def header (self) -> bytes:
+		'''
+		Written once, at the beginning of the file
+		'''
+		return bytes()
+
+	def format (self, packet: RawPacket) -> bytes:
+		'''
+		Serialize a single packet
+		'''
+		raise NotImplementedError
+
+	def frames (self, packet: RawPacket) -> list[bytes]:
+		'''
+		Split a packet into CAN frame payloads
+		'''
+		if packet.identifier is None:
+			return [packet.data]
+
+		if self.isotp:
+			return segment(packet.data, padding=None)
+
+		if len(packet.data) <= 8:
+			return [packet.data]
+
+		if not self.fd:
+			if not self._warned_long_packet:
+				self._warned_long_packet = True
+				logger.warning('{} byte packet on {} logged as ISO-TP frames, pass isotp=True '
+					'to log all packets this way or fd=True for CAN FD'.format(
+						len(packet.data), hex(packet.identifier)))
+			return segment(packet.data, padding=None)
+
+		return canfd_frames(packet.data)
+
+	def _writer (self) -> None:
+		stopping = False
+
+		while not stopping:
+			batch = [self._queue.get()]
+			while len(batch) < self.batch_size:
+				try:
+					batch.append(self._queue.get_nowait())
+				except queue.Empty:
+					break
+
+			if _STOP in batch:
+				stopping = True
+				batch = [x for x in batch if x is not _STOP]
+
+			try:
+				self._file.write(b''.join([self.format(x) for x in batch]))
+			except (OSError, ValueError) as e:
+				logger.error('Writing capture to {} failed: {}'.format(self.path, e))
+				self.error = e
+				return
+
+			self.packets_written += len(batch)
+
+	def close (self) -> None:
+		'''
+		Write everything that's queued and close the file
+
+		:raises OSError, ValueError: if the writer thread stopped on an error
+		'''
+		if self._file.closed:
+			return
+		self._queue.put(_STOP)
+		self._thread.join()
+		self._file.close()
+
+		if self.error is not None:
+			raise self.error
+
+	def __enter__ (self) -> Self:
+		return self
+
+	def __exit__ (self,
+			exc_type: type[BaseException] | None,
+			exc_value: BaseException | None,
+			traceback: TracebackType | None
+		) -> None:
+		self.close()
+
+class CandumpCapture(CaptureWriter):
+	'''
+	can-utils candump log format (candump -l), readable by canplayer, log2asc and most CAN tools.
+	Every line ends with the direction: T - transmitted by us, R - received.
+	Packets without a CAN identifier (K-Line) are logged with identifier 0, cut into
+	frames of up to 8 bytes (64 with fd=True)
+
+	:param interface: interface name written to the log
+	'''
+	def __init__ (self,
+			path: str,
+			interface: str = 'can0',
+			isotp: bool = False,
+			fd: bool = False,
+			batch_size: int = 256
+		) -> None:
+		self.interface = interface
+		super().__init__(path, isotp, fd, batch_size)
+
+	def frames (self, packet: RawPacket) -> list[bytes]:
+		if packet.identifier is not None:
+			return super().frames(packet)
+		if self.fd:
+			return canfd_frames(packet.data)
+		return [packet.data[x:x+8] for x in range(0, len(packet.data), 8)] or [bytes()]
+
+	def format (self, packet: RawPacket) -> bytes:
+		can_id = packet.identifier or 0
+		identifier = '{:03X}'.format(can_id) if can_id <= 0x7FF else '{:08X}'.format(can_id)
+		seconds, fraction = divmod(packet.wall_clock_ns(), 1000000000)
+		timestamp = '({}.{:06d})'.format(seconds, fraction // 1000)
+		direction = 'R' if packet.direction == PacketDirection.INCOMING else 'T'
+
+		lines = []
+		for frame in self.frames(packet):
+			separator = '#' if len(frame) <= 8 else '##0'
+			lines.append('{} {} {}{}{} {}\n'.format(
+				timestamp, self.interface, identifier, separator, frame.hex().upper(), direction))
+
+		return ''.join(lines).encode('ascii')
+
+class PcapngCapture(CaptureWriter):
+	'''
+	pcapng, readable by Wireshark and tshark. CAN packets are written to a SocketCAN
+	(LINKTYPE_CAN_SOCKETCAN) interface, CAN FD for frames longer than 8 bytes.
+	Packets without a CAN identifier (K-Line) go to a second interface, LINKTYPE_USER0,
+	as they are. Direction is stored in the packet flags, timestamps have nanosecond resolution
+	'''
+	LINKTYPE_USER0 = 147
+	LINKTYPE_CAN_SOCKETCAN = 227
+	CAN_INTERFACE, RAW_INTERFACE = 0, 1
+	CAN_EFF_FLAG = 0x80000000
+	CANFD_FDF = 0x04
+
+	@staticmethod
+	def _block (block_type: int, body: bytes) -> bytes:
+		body += bytes(-len(body) % 4)
+		length = len(body) + 12
+		return struct.pack('<II', block_type, length) + body + struct.pack('<I', length)
+
+	@staticmethod
+	def _option (code: int, value: bytes) -> bytes:
+		return struct.pack('<HH', code, len(value)) + value + bytes(-len(value) % 4)
+
+	def header (self) -> bytes:
+		section_header = self._block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1))
+
+		interfaces = bytes()
+		for linktype in [self.LINKTYPE_CAN_SOCKETCAN, self.LINKTYPE_USER0]:
+			# if_tsresol: 10^-9, end of options
+			options = self._option(9, bytes([9])) + self._option(0, bytes())
+			interfaces += self._block(0x00000001, struct.pack('<HHI', linktype, 0, 0) + options)
+
+		return section_header + interfaces
+
+	def _enhanced_packet (self,
+			interface: int,
+			timestamp: int,
+			direction: PacketDirection,
+			data: bytes
+		) -> bytes:
+		# epb_flags: inbound/outbound
+		flags = 0b01 if direction == PacketDirection.INCOMING else 0b10
+		options = self._option(2, struct.pack('<I', flags)) + self._option(0, bytes())
+		body = struct.pack('<IIIII',
+			interface, timestamp >> 32, timestamp & 0xFFFFFFFF, len(data), len(data))
+		return self._block(0x00000006, body + data + bytes(-len(data) % 4) + options)
+
+	def format (self, packet: RawPacket) -> bytes:
+		timestamp = packet.wall_clock_ns()
+
+		if packet.identifier is None:
+			return self._enhanced_packet(
+				self.RAW_INTERFACE, timestamp, packet.direction, packet.data)
+
+		can_id = packet.identifier | (self.CAN_EFF_FLAG if packet.identifier > 0x7FF else 0)
+
+		blocks = []
+		for frame in self.frames(packet):
+			fd_flags = self.CANFD_FDF if len(frame) > 8 else 0
+			# SocketCAN header: identifier in network byte order, length, FD flags, 2 reserved bytes
+			data = struct.pack('>IBBxx', can_id, len(frame), fd_flags) + frame
+			blocks.append(self._enhanced_packet(
+				self.CAN_INTERFACE, timestamp, packet.direction, data))
+
+		return b''.join(blocks)
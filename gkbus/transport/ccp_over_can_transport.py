@@ -13,8 +13,7 @@ class CcpOverCanTransport (TransportABC):
 	a standard CAN frame
 	'''
 	def __init__ (self, hardware: HardwareABC, tx_id: int, rx_id: int, crm_only: bool = False) -> None:
-		self.hardware = hardware
-		self.tx_id, self.rx_id = tx_id, rx_id
+		super().__init__(hardware, tx_id, rx_id)
 		self.crm_only = crm_only
 		self.hardware.set_filters([CanFilter(can_id=self.rx_id, can_mask=0x7ff)])
 		
@@ -22,7 +21,8 @@ class CcpOverCanTransport (TransportABC):
 		data = pdu
 		bytes_written = self.hardware.write(RawFrame(identifier=self.tx_id, data=data))
 
-		self.buffer_push(RawPacket(direction=PacketDirection.OUTGOING, data=data, timestamp=int(time.time()*1000)))
+		self.buffer_push(RawPacket(direction=PacketDirection.OUTGOING, data=data,
+			timestamp=self.packet_timestamp(), identifier=self.tx_id))
 
 		return len(data) # can socket doesnt return how many bytes were written @TODO: verify
 
@@ -64,7 +64,8 @@ class CcpOverCanTransport (TransportABC):
 				RawPacket(
 					direction=PacketDirection.INCOMING,
 					data=data,
-					timestamp=int(time.time() * 1000)
+					timestamp=self.packet_timestamp(frame.timestamp),
+					identifier=frame.identifier
 				)
 			)
 
@@ -0,0 +1,372 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+from enum import Enum
+
+from ..hardware.hardware_abc import HardwareABC, RawFrame, TimeoutException
+from ..utils import sleep_until_ns
+from .transport_abc import PacketDirection
+
+logger = logging.getLogger(__name__)
+
+CAN_MAX_DLEN = 8
+
+class IsoTpException(IOError):
+	pass
+
+class IsoTpFrameType(Enum):
+	SINGLE_FRAME = 0x0
+	FIRST_FRAME = 0x1
+	CONSECUTIVE_FRAME = 0x2
+	FLOW_CONTROL = 0x3
+
+class FlowStatus(Enum):
+	CONTINUE_TO_SEND = 0x0
+	WAIT = 0x1
+	OVERFLOW = 0x2
+
+@dataclass
+class IsoTpParameters:
+	'''
+	ISO 15765-2 parameters
+
+	:param block_size: BS sent in our flow control frames - how many consecutive frames
+		the ECU may send before waiting for the next flow control frame. 0 - no limit
+	:param st_min: STmin sent in our flow control frames, raw byte: 0x00-0x7F milliseconds,
+		0xF1-0xF9 100-900 microseconds
+	:param padding: byte frames are padded to 8 bytes with, None - no padding,
+		frames are only as long as their contents
+	:param max_wait_frames: how many consecutive flow control WAIT frames are tolerated
+		before the transfer is aborted (N_WFTmax)
+	'''
+	block_size: int = 0
+	st_min: int = 0
+	padding: int | None = 0xCC
+	max_wait_frames: int = 10
+
+@dataclass(slots=True)
+class IsoTpTransferStatistics:
+	'''
+	Summary of a single ISO-TP transfer
+
+	:param direction: outgoing - sent by us, incoming - received
+	:param size: payload size in bytes
+	:param frames: number of single/first/consecutive frames the payload took
+	:param flow_control_frames: number of flow control frames exchanged, including WAIT frames
+	:param wait_frames: number of flow control WAIT frames received
+	:param block_size: effective block size, 0 - no limit
+	:param st_min: effective separation time between consecutive frames, in seconds
+	:param duration_ns: time from the first to the last frame
+	'''
+	direction: PacketDirection
+	size: int
+	frames: int = 0
+	flow_control_frames: int = 0
+	wait_frames: int = 0
+	block_size: int = 0
+	st_min: float = 0
+	duration_ns: int = 0
+
+	@property
+	def bytes_per_second (self) -> float:
+		if not self.duration_ns:
+			return float('inf')
+		return self.size / (self.duration_ns / 1000000000)
+
+def decode_st_min (value: int) -> float:
+	'''
+	Convert STmin from its raw byte representation to seconds.
+	Reserved values are treated as the longest valid one, 127ms - as the standard requires
+	'''
+	if value <= 0x7F:
+		return value / 1000
+	if 0xF1 <= value <= 0xF9:
+		return (value - 0xF0) / 10000
+	return 0.127
+
+def encode_st_min (seconds: float) -> int:
+	'''
+	Convert STmin in seconds to its raw byte representation, rounding up
+	'''
+	if seconds <= 0:
+		return 0x00
+	if seconds < 0.001:
+		return 0xF0 + min(9, math.ceil(round(seconds*10000, 6)))
+	return min(0x7F, math.ceil(round(seconds*1000, 6)))
+
+def pad (data: bytes, padding: int | None) -> bytes:
+	if padding is None or len(data) >= CAN_MAX_DLEN:
+		return data
+	return data + bytes([padding])*(CAN_MAX_DLEN-len(data))
+
+def segment (payload: bytes, padding: int | None = 0xCC) -> list[bytes]:
+	'''
+	Split a payload into ISO-TP frames: a single frame if it fits, first frame
+	followed by consecutive frames otherwise. Payloads above 4095 bytes
+	use the 32 bit first frame length escape
+
+	:return: list of CAN frame data fields
+	'''
+	if len(payload) <= CAN_MAX_DLEN-1:
+		return [pad(bytes([len(payload)]) + payload, padding)]
+
+	if len(payload) <= 0xFFF:
+		header = bytes([0x10 | (len(payload) >> 8), len(payload) & 0xFF])
+	else:
+		header = bytes([0x10, 0x00]) + len(payload).to_bytes(4, 'big')
+
+	first_size = CAN_MAX_DLEN-len(header)
+	frames = [header + payload[:first_size]]
+
+	for index, offset in enumerate(range(first_size, len(payload), CAN_MAX_DLEN-1)):
+		header = bytes([0x20 | ((index+1) & 0x0F)])
+		frames.append(pad(header + payload[offset:offset+CAN_MAX_DLEN-1], padding))
+
+	return frames
+
+def flow_control (status: FlowStatus,
+		block_size: int,
+		st_min: int,
+		padding: int | None = 0xCC
+	) -> bytes:
+	return pad(bytes([0x30 | status.value, block_size, st_min]), padding)
+
+def frame_type (data: bytes) -> IsoTpFrameType | None:
+	try:
+		return IsoTpFrameType(data[0] >> 4)
+	except (IndexError, ValueError):
+		return None
+
+class IsoTpReassembler:
+	'''
+	Reassemble a payload from received ISO-TP frames. Not tied to any hardware -
+	feed it frame data fields, flow control is up to the caller
+	'''
+	def __init__ (self) -> None:
+		self.reset()
+
+	def reset (self) -> None:
+		self.payload: bytearray = bytearray()
+		self.expected_length: int = 0
+		self.sequence_number: int = 0
+		self.in_progress: bool = False
+
+	def feed (self, data: bytes) -> bytes | None:
+		'''
+		Process a single or first or consecutive frame
+
+		:return: complete payload, None if more frames are needed
+		'''
+		kind = frame_type(data)
+
+		if kind == IsoTpFrameType.SINGLE_FRAME:
+			if self.in_progress:
+				logger.warning('Single frame during a multi frame transfer, dropping the transfer')
+			self.reset()
+			length = data[0] & 0x0F
+			if length == 0 or length > len(data)-1:
+				raise IsoTpException('Invalid single frame length: {}'.format(length))
+			return bytes(data[1:1+length])
+
+		if kind == IsoTpFrameType.FIRST_FRAME:
+			if self.in_progress:
+				logger.warning('First frame during a multi frame transfer, dropping the transfer')
+			self.reset()
+			length = ((data[0] & 0x0F) << 8) | data[1]
+			offset = 2
+			if length == 0:
+				length, offset = int.from_bytes(data[2:6], 'big'), 6
+			self.expected_length = length
+			self.payload += data[offset:]
+			self.sequence_number = 1
+			self.in_progress = True
+			return None
+
+		if kind == IsoTpFrameType.CONSECUTIVE_FRAME:
+			if not self.in_progress:
+				logger.debug('Unexpected consecutive frame, ignoring')
+				return None
+			if (data[0] & 0x0F) != self.sequence_number:
+				expected = self.sequence_number
+				self.reset()
+				raise IsoTpException(
+					'Wrong sequence number: expected {}, got {}'.format(expected, data[0] & 0x0F)
+				)
+			self.sequence_number = (self.sequence_number + 1) & 0x0F
+			self.payload += data[1:1+min(CAN_MAX_DLEN-1, self.expected_length-len(self.payload))]
+
+			if len(self.payload) >= self.expected_length:
+				payload = bytes(self.payload)
+				self.reset()
+				return payload
+
+		return None
+
+class IsoTp:
+	'''
+	ISO 15765-2 (ISO-TP) engine working on top of any CAN hardware - frames are written
+	and read through HardwareABC, so it doesn't depend on the kernel module or Scapy.
+	Flow control parameters of the other side are honoured when sending,
+	our own (IsoTpParameters) are advertised when receiving
+
+	:param hardware: CAN hardware, opened
+	:param tx_id: identifier to transmit on
+	:param rx_id: identifier to listen for
+	:param parameters: flow control and padding parameters
+	'''
+	def __init__ (self,
+			hardware: HardwareABC,
+			tx_id: int,
+			rx_id: int,
+			parameters: IsoTpParameters | None = None
+		) -> None:
+		self.hardware = hardware
+		self.tx_id, self.rx_id = tx_id, rx_id
+		self.parameters: IsoTpParameters = parameters or IsoTpParameters()
+		self.last_sent: IsoTpTransferStatistics | None = None
+		self.last_received: IsoTpTransferStatistics | None = None
+		self._reassembler = IsoTpReassembler()
+
+	def _write (self, data: bytes) -> None:
+		self.hardware.write(RawFrame(identifier=self.tx_id, data=data))
+
+	def _read (self) -> RawFrame:
+		'''
+		Read the next frame sent on rx_id, within the hardware timeout
+		'''
+		deadline = time.perf_counter() + self.hardware.get_timeout()
+		while True:
+			frame = self.hardware.read(CAN_MAX_DLEN)
+			if frame.identifier == self.rx_id and len(frame.data) > 0:
+				return frame
+			if time.perf_counter() > deadline:
+				raise TimeoutException
+
+	def _wait_for_flow_control (self, statistics: IsoTpTransferStatistics) -> tuple[int, float]:
+		'''
+		:return: block size, STmin in seconds
+		'''
+		wait_frames = 0
+		while True:
+			data = self._read().data
+			if frame_type(data) != IsoTpFrameType.FLOW_CONTROL or len(data) < 3:
+				logger.debug('Expected flow control, got {}. Ignoring'.format(data.hex()))
+				continue
+
+			statistics.flow_control_frames += 1
+			status = data[0] & 0x0F
+
+			if status == FlowStatus.CONTINUE_TO_SEND.value:
+				return data[1], decode_st_min(data[2])
+
+			if status == FlowStatus.WAIT.value:
+				wait_frames += 1
+				statistics.wait_frames += 1
+				if wait_frames > self.parameters.max_wait_frames:
+					raise IsoTpException('Exceeded {} flow control WAIT frames'.format(
+						self.parameters.max_wait_frames))
+				continue
+
+			if status == FlowStatus.OVERFLOW.value:
+				raise IsoTpException('Receiver buffer overflow for a {} bytes payload'.format(
+					statistics.size))
+
+			raise IsoTpException('Invalid flow status: {}'.format(hex(status)))
+
+	def send (self, payload: bytes) -> IsoTpTransferStatistics:
+		'''
+		Send a payload, segmenting it if needed
+
+		:return: transfer statistics
+		'''
+		frames = segment(payload, self.parameters.padding)
+		statistics = IsoTpTransferStatistics(
+			direction=PacketDirection.OUTGOING, size=len(payload), frames=len(frames)
+		)
+		started = time.perf_counter_ns()
+
+		self._write(frames[0])
+
+		if len(frames) > 1:
+			block_size, st_min = self._wait_for_flow_control(statistics)
+			statistics.block_size, statistics.st_min = block_size, st_min
+			st_min_ns = int(st_min*1000000000)
+			block_remaining = block_size
+
+			next_frame_at = 0
+			for data in frames[1:]:
+				if block_size and block_remaining == 0:
+					block_size, st_min = self._wait_for_flow_control(statistics)
+					st_min_ns = int(st_min*1000000000)
+					block_remaining = block_size
+					next_frame_at = 0
+
+				if next_frame_at:
+					sleep_until_ns(next_frame_at)
+
+				self._write(data)
+				next_frame_at = time.perf_counter_ns() + st_min_ns
+				block_remaining -= 1
+
+		statistics.duration_ns = time.perf_counter_ns() - started
+		self.last_sent = statistics
+		return statistics
+
+	def recv (self) -> RawFrame:
+		'''
+		Receive a payload, sending flow control frames as needed.
+		Every frame has to arrive within the hardware timeout
+
+		:return: RawFrame with the complete payload, timestamped with the first frame
+		'''
+		self._reassembler.reset()
+		statistics = IsoTpTransferStatistics(
+			direction=PacketDirection.INCOMING, size=0,
+			block_size=self.parameters.block_size, st_min=decode_st_min(self.parameters.st_min)
+		)
+		timestamp, started, frames = 0, 0, 0
+		block_remaining = self.parameters.block_size
+
+		while True:
+			frame = self._read()
+			kind = frame_type(frame.data)
+
+			if kind == IsoTpFrameType.FLOW_CONTROL:
+				continue
+
+			if kind in [IsoTpFrameType.SINGLE_FRAME, IsoTpFrameType.FIRST_FRAME]:
+				timestamp, started, frames = frame.timestamp, time.perf_counter_ns(), 0
+
+			payload = self._reassembler.feed(frame.data)
+			frames += 1
+
+			if payload is not None:
+				break
+
+			if kind == IsoTpFrameType.FIRST_FRAME:
+				self._send_flow_control(statistics)
+				block_remaining = self.parameters.block_size
+			elif (kind == IsoTpFrameType.CONSECUTIVE_FRAME and self._reassembler.in_progress
+					and self.parameters.block_size):
+				block_remaining -= 1
+				if block_remaining == 0:
+					self._send_flow_control(statistics)
+					block_remaining = self.parameters.block_size
+
+		statistics.size = len(payload)
+		statistics.frames = frames
+		statistics.duration_ns = time.perf_counter_ns() - started
+		self.last_received = statistics
+
+		return RawFrame(identifier=self.rx_id, data=payload, timestamp=timestamp)
+
+	def send_recv (self, payload: bytes) -> RawFrame:
+		self.send(payload)
+		return self.recv()
+
+	def _send_flow_control (self, statistics: IsoTpTransferStatistics) -> None:
+		parameters = self.parameters
+		self._write(flow_control(FlowStatus.CONTINUE_TO_SEND,
+			parameters.block_size, parameters.st_min, parameters.padding))
+		statistics.flow_control_frames += 1
@@ -0,0 +1,149 @@
+from dataclasses import dataclass
+
+
+class KLineFrameException(IOError):
+	pass
+
+class ChecksumException(KLineFrameException):
+	pass
+
+ADDRESS_MODE_MASK = 0xC0
+LENGTH_MASK = 0x3F
+MIN_FRAME_LENGTH = 3 # format byte, one data or length byte, checksum
+
+@dataclass(slots=True)
+class KLineFrame:
+	'''
+	Single ISO 14230-2 frame
+
+	:param target: target address, None if the header carries no addresses
+	:param source: source address, None if the header carries no addresses
+	:param data: frame payload - service identifier and parameters
+	:param raw: the whole frame, header and checksum included
+	'''
+	target: int | None
+	source: int | None
+	data: bytes
+	raw: bytes
+
+def checksum (data: bytes) -> int:
+	return sum(data) & 0xFF
+
+def header_length (format_byte: int) -> int:
+	'''
+	Length of the header starting with the given format byte: format byte, target and
+	source address if the address mode bits are set, length byte if the length bits are 0
+	'''
+	length = 3 if format_byte & ADDRESS_MODE_MASK else 1
+	return length if format_byte & LENGTH_MASK else length+1
+
+class KLineFrameParser:
+	'''
+	Incremental parser for ISO 14230-2 frames, all header formats: with and without
+	addresses, with length in the format byte or in a separate length byte.
+	Feed it bytes as they come, take frames out with next_frame().
+
+	Every frame's checksum is verified. A frame failing it is not dropped as a whole -
+	only its first byte is, and parsing starts over from the next one, so the parser
+	resynchronizes on the first valid frame following garbage (i.e. leftovers after FastInit).
+	Garbage can also claim a frame longer than anything that follows - the caller tells
+	the parser to skip() a byte when the bus goes quiet in the middle of a frame
+
+	:param frames: number of valid frames parsed
+	:param checksum_errors: number of frames which failed the checksum
+	:param discarded_bytes: number of bytes skipped while resynchronizing
+	'''
+	def __init__ (self) -> None:
+		self.frames: int = 0
+		self.checksum_errors: int = 0
+		self.discarded_bytes: int = 0
+		self.reset()
+
+	def reset (self) -> None:
+		'''
+		Drop buffered bytes, counters are kept
+		'''
+		self.buffer: bytearray = bytearray()
+
+	def feed (self, data: bytes) -> None:
+		self.buffer += data
+
+	def skip (self) -> None:
+		'''
+		Drop the first buffered byte - the frame it starts is never going to complete
+		'''
+		if self.buffer:
+			del self.buffer[0]
+			self.discarded_bytes += 1
+
+	def bytes_needed (self) -> int:
+		'''
+		Minimum number of bytes to feed before the next frame can be complete.
+		0 if a frame is ready to be parsed
+		'''
+		if not self.buffer:
+			return MIN_FRAME_LENGTH
+
+		header = header_length(self.buffer[0])
+		length = self.buffer[0] & LENGTH_MASK
+
+		if not length:
+			if len(self.buffer) < header:
+				# length byte unknown yet, at least the checksum follows
+				return header+1 - len(self.buffer)
+			length = self.buffer[header-1]
+
+		return max(header+length+1 - len(self.buffer), 0)
+
+	def next_frame (self) -> KLineFrame | None:
+		'''
+		:return: next valid frame from the buffer, None if more bytes are needed
+		'''
+		while self.buffer and not self.bytes_needed():
+			header = header_length(self.buffer[0])
+			length = (self.buffer[0] & LENGTH_MASK) or self.buffer[header-1]
+			raw = bytes(self.buffer[:header+length+1])
+
+			if checksum(raw[:-1]) != raw[-1]:
+				self.checksum_errors += 1
+				self.discarded_bytes += 1
+				del self.buffer[0]
+				continue
+
+			del self.buffer[:len(raw)]
+			self.frames += 1
+
+			if raw[0] & ADDRESS_MODE_MASK:
+				return KLineFrame(target=raw[1], source=raw[2], data=raw[header:-1], raw=raw)
+			return KLineFrame(target=None, source=None, data=raw[header:-1], raw=raw)
+
+		return None
+
+def parse_frame (data: bytes) -> KLineFrame:
+	'''
+	Parse a single, complete frame
+
+	:raises ChecksumException: if the checksum doesn't match
+	:raises KLineFrameException: if the length doesn't match the header
+	'''
+	parser = KLineFrameParser()
+	parser.feed(data)
+	frame = parser.next_frame()
+
+	if parser.checksum_errors:
+		raise ChecksumException('Invalid checksum: {!r}'.format(data))
+	if frame is None or parser.buffer:
+		raise KLineFrameException('Frame length doesn\'t match its header: {!r}'.format(data))
+
+	return frame
+
+def build_frame (data: bytes, target: int, source: int) -> bytes:
+	'''
+	Frame a payload with a physically addressed header - the length goes to the format byte
+	if it fits, to a separate length byte otherwise
+	'''
+	if len(data) <= LENGTH_MASK:
+		header = bytes([0x80 + len(data), target, source])
+	else:
+		header = bytes([0x80, target, source, len(data)])
+	return header + data + bytes([checksum(header + data)])
@@ -1,62 +1,182 @@
-import time
+import functools
+import logging
 from sys import platform
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
 
-from scapy.config import conf
-
-if platform.startswith('win32'):
-	conf.contribs['ISOTP'] = {'use-can-isotp-kernel-module': False}
-else:
-	conf.contribs['ISOTP'] = {'use-can-isotp-kernel-module': True}
-from scapy.contrib.isotp import ISOTP, ISOTPSocket
-
-from ..hardware.can_hardware import CanFilter
+from ..hardware.can_hardware import CanFilter, import_scapy_can, scapy_timestamp
 from ..hardware.hardware_abc import HardwareABC, TimeoutException
+from ..hardware.socketcan_hardware import SocketCanHardware
+from .isotp import IsoTp, IsoTpException, IsoTpParameters
 from .transport_abc import PacketDirection, RawPacket, TransportABC
 
+if TYPE_CHECKING:
+	from scapy.contrib.isotp import ISOTPSocket
+
+logger = logging.getLogger(__name__)
+
+@functools.cache
+def import_scapy_isotp () -> SimpleNamespace:
+	'''
+	Import Scapy ISO-TP support on first use, see :py:func:`import_scapy_can`
+
+	:return: namespace with ISOTP and ISOTPSocket
+	'''
+	import_scapy_can()
+	from scapy.config import conf
+
+	if platform.startswith('win32'):
+		conf.contribs['ISOTP'] = {'use-can-isotp-kernel-module': False}
+	else:
+		conf.contribs['ISOTP'] = {'use-can-isotp-kernel-module': True}
+
+	from scapy.contrib.isotp import ISOTP, ISOTPSocket
+
+	return SimpleNamespace(ISOTP=ISOTP, ISOTPSocket=ISOTPSocket)
 
 class Kwp2000OverCanTransport (TransportABC):
-	def __init__ (self, hardware: HardwareABC, tx_id: int, rx_id: int) -> None:
-		self.hardware = hardware
-		self.tx_id, self.rx_id = tx_id, rx_id
-		self.isotp: ISOTPSocket | None = None
+	'''
+	KWP2000 over ISO-TP. By default ISO-TP is handled by Scapy (and the kernel module,
+	where available). Pass isotp_parameters to use the built-in ISO-TP engine instead -
+	it works with any CAN hardware, lets you choose the block size and STmin
+	the ECU is asked to respect, and records statistics of every transfer
+	(isotp_engine.last_sent, isotp_engine.last_received)
+
+	Scapy's ISO-TP socket needs a Scapy CAN socket underneath - with SocketCanHardware,
+	the built-in engine is used even if isotp_parameters is None.
+
+	With Scapy, requests are sent and responses received directly on the ISO-TP socket.
+	Scapy's sr1()/sniff() spin up a matching engine per call, which dominated the latency
+	of short requests - use_sr1 brings that behaviour back, for comparison
+
+	:param isotp_parameters: IsoTpParameters for the built-in engine, None - use Scapy
+	:param use_sr1: use Scapy's sr1() and sniff() instead of direct send/recv
+	'''
+	def __init__ (self,
+			hardware: HardwareABC,
+			tx_id: int,
+			rx_id: int,
+			isotp_parameters: IsoTpParameters | None = None,
+			use_sr1: bool = False
+		) -> None:
+		super().__init__(hardware, tx_id, rx_id)
+		self.isotp: 'ISOTPSocket | None' = None
+		self.isotp_parameters = isotp_parameters
+		self.isotp_engine: IsoTp | None = None
+		self.use_sr1 = use_sr1
 
 	def init (self) -> bool:
+		if self.tx_id is None or self.rx_id is None:
+			raise IsoTpException('Transmit (tx_id) and receive (rx_id) identifier are required')
+
 		self.hardware.set_filters([CanFilter(can_id=self.rx_id, can_mask=0x7ff)])
 		
 		if not self.hardware.is_open():
 			self.hardware.open()
 
-		if not self.isotp:
-			self.isotp = ISOTPSocket(self.hardware.socket, self.tx_id, self.rx_id, padding=True)
+		if self.isotp_parameters is None and isinstance(self.hardware, SocketCanHardware):
+			logger.info('SocketCanHardware has no Scapy socket, using the built-in ISO-TP engine')
+			self.isotp_parameters = IsoTpParameters()
+
+		if self.isotp_parameters is not None:
+			self.isotp_engine = IsoTp(self.hardware, self.tx_id, self.rx_id, self.isotp_parameters)
+		elif not self.isotp:
+			self.isotp = import_scapy_isotp().ISOTPSocket(
+				self.hardware.socket, self.tx_id, self.rx_id, padding=True
+			)
 
 		return True
+
+	def _isotp_socket (self) -> 'ISOTPSocket':
+		'''
+		:raises IsoTpException: if init() wasn't called yet
+		'''
+		if self.isotp is None:
+			raise IsoTpException('Transport is not initialized, call init() first')
+		return self.isotp
 		
 	def send_pdu (self, pdu: bytes) -> int:
 		data = pdu
-		bytes_written = self.isotp.send(data)
 
-		self.buffer_push(RawPacket(direction=PacketDirection.OUTGOING, data=data, timestamp=int(time.time()*1000)))
+		if self.isotp_engine is not None:
+			self.isotp_engine.send(data)
+		else:
+			self._isotp_socket().send(data)
+
+		self.buffer_push(RawPacket(direction=PacketDirection.OUTGOING, data=data,
+			timestamp=self.packet_timestamp(), identifier=self.tx_id))
 
 		return len(data) # isotp socket doesnt return how many bytes were written
 
 	def read_pdu (self) -> bytes:
+		if self.isotp_engine is not None:
+			frame = self.isotp_engine.recv()
+			self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=frame.data,
+				timestamp=self.packet_timestamp(frame.timestamp), identifier=self.rx_id))
+			return frame.data
+
+		if self.use_sr1:
+			return self._sniff_pdu()
+
+		isotp = self._isotp_socket()
+		if not isotp.select([isotp], self.hardware.get_timeout()):
+			raise TimeoutException
+
+		packet = isotp.recv()
+		if packet is None: # flow control or an incomplete transfer
+			raise TimeoutException
+
+		data: bytes = packet.data
+		self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=data,
+			timestamp=scapy_timestamp(packet), identifier=self.rx_id))
+
+		return data
+
+	def _sniff_pdu (self) -> bytes:
+		isotp = self._isotp_socket()
 		try:
-			frame = self.isotp.sniff(timeout=self.hardware.get_timeout(), count=1)[0]
+			frame = isotp.sniff(timeout=self.hardware.get_timeout(), count=1)[0]
 		except IndexError:
-			self.isotp.close() # close the background thread that sends flow control frames
+			isotp.close() # close the background thread that sends flow control frames
 			raise TimeoutException
 
-		self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=frame.data, timestamp=int(time.time() * 1000)))
+		data: bytes = frame.data
+		self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=data,
+			timestamp=scapy_timestamp(frame), identifier=self.rx_id))
+
+		return data
 
-		return frame.data
+	def _drain (self) -> None:
+		'''
+		Drop responses left over from previous requests (i.e. ones that arrived after a timeout),
+		so they aren't taken for the answer to the next request. sr1() did that by matching
+		'''
+		isotp = self._isotp_socket()
+		while isotp.select([isotp], 0):
+			if isotp.recv() is None:
+				break
 
 	def send_read_pdu (self, data: bytes) -> bytes:
-		self.buffer_push(RawPacket(direction=PacketDirection.OUTGOING, data=data, timestamp=int(time.time()*1000)))
-		response = self.isotp.sr1(ISOTP(bytes(data)), verbose=False, timeout=self.hardware.get_timeout())
+		if self.isotp_engine is not None:
+			self.send_pdu(data)
+			return self.read_pdu()
+
+		if not self.use_sr1:
+			self._drain()
+			self.send_pdu(data)
+			return self.read_pdu()
+
+		self.buffer_push(RawPacket(direction=PacketDirection.OUTGOING, data=data,
+			timestamp=self.packet_timestamp(), identifier=self.tx_id))
+		request = import_scapy_isotp().ISOTP(bytes(data))
+		isotp = self._isotp_socket()
+		response = isotp.sr1(request, verbose=False, timeout=self.hardware.get_timeout())
 
 		if not response:
 			raise TimeoutException
 
-		self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=response.data, timestamp=int(time.time() * 1000)))
+		payload: bytes = response.data
+		self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=payload,
+			timestamp=scapy_timestamp(response), identifier=self.rx_id))
 
-		return response.data
\ No newline at end of file
+		return payload
@@ -1,57 +1,100 @@
 import logging
-import time
 
-from ..hardware.hardware_abc import HardwareABC, RawFrame
+from ..hardware.hardware_abc import HardwareABC, RawFrame, TimeoutException
+from .kline_framing import (
+    ChecksumException,
+    KLineFrameException,
+    KLineFrameParser,
+    build_frame,
+    checksum,
+)
 from .transport_abc import PacketDirection, RawPacket, TransportABC
 
 logger = logging.getLogger(__name__)
 
 class Kwp2000OverKLineTransport (TransportABC):
-	def __init__ (self, hardware: HardwareABC, tx_id: int, rx_id: int) -> None:
-		self.hardware: HardwareABC = hardware
-		self.tx_id, self.rx_id = tx_id, rx_id
+	'''
+	KWP2000 over K-Line (ISO 14230-2). Responses are parsed by a KLineFrameParser:
+	every header format is understood, checksums are verified and the parser resynchronizes
+	after garbage. Parser counters (frame_parser.checksum_errors, .discarded_bytes) tell how
+	healthy the line is
+
+	:param inter_byte_timeout: longest gap between bytes of a frame (ISO 14230 P1max is 20ms,
+		the rest is a margin for USB adapters). A frame which stalls for longer is considered
+		garbage and the parser resynchronizes
+	'''
+	max_pdu_size = 0xFF # length byte
+
+	def __init__ (self,
+			hardware: HardwareABC,
+			tx_id: int,
+			rx_id: int,
+			inter_byte_timeout: float = 0.05
+		) -> None:
+		super().__init__(hardware, tx_id, rx_id)
+		self.inter_byte_timeout = inter_byte_timeout
+		self.frame_parser = KLineFrameParser()
 
 	def send_pdu (self, pdu: bytes) -> int:
 		data = self.build_payload(pdu)
+		self.frame_parser.reset() # whatever is left belongs to the previous exchange
 
 		bytes_written = self._write(data)
-		self.buffer_push(RawPacket(direction=PacketDirection.OUTGOING, data=data, timestamp=int(time.time()*1000)))
+		self.buffer_push(RawPacket(direction=PacketDirection.OUTGOING, data=data,
+			timestamp=self.packet_timestamp()))
 
 		return bytes_written
 
 	def read_pdu (self) -> bytes:
-		frame = bytes()
-		data = bytes()
+		'''
+		Read the next valid frame. Everything the hardware has received is taken at once
+		and parsed from memory, bytes following the frame are kept for the next read_pdu()
+
+		:raises ChecksumException: if a corrupted frame was received and nothing valid followed it
+		'''
+		parser = self.frame_parser
+		checksum_errors = parser.checksum_errors
+		timestamp = 0
 
-		frame += self._read(4)
+		while (frame := parser.next_frame()) is None:
+			if not parser.buffer and parser.checksum_errors > checksum_errors:
+				raise ChecksumException(
+					'Received a corrupted frame, {} checksum errors so far'.format(
+						parser.checksum_errors))
 
-		counter = frame[0]
-		tx_rx_id = frame[1:3]
+			try:
+				chunk = self._read(None if not parser.buffer else self.inter_byte_timeout)
+			except TimeoutException:
+				if not parser.buffer:
+					raise
+				logger.debug('K-Line: frame stalled, resynchronizing')
+				parser.skip()
+				continue
 
-		if (counter == 0x80): # more than 127 bytes incoming, counter overflowed. counter is gonna come after IDs
-			counter = frame[3]+1
-			logger.debug('More than 127 bytes incoming: {}'.format(counter))
-		else:
-			counter = counter-0x80
-			data += frame[3:4] # frame[3] == python would automatically convert it to int. frame[3:3] == byte slice 
+			timestamp = timestamp or chunk.timestamp
+			parser.feed(chunk.data)
 
-		data_and_checksum = self._read(counter)
-		frame += data_and_checksum
-		data += data_and_checksum[:-1] # last byte is the checksum
+		if parser.checksum_errors > checksum_errors:
+			logger.warning('K-Line: skipped {} corrupted frame(s) before a valid one'.format(
+				parser.checksum_errors - checksum_errors))
 
-		self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=frame, timestamp=int(time.time() * 1000)))
+		self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=frame.raw,
+			timestamp=self.packet_timestamp(timestamp)))
 
-		return data
+		return frame.data
 
 	def _write (self, data: bytes) -> int:
 		logger.debug('K-Line sending: {}'.format(' '.join([hex(x) for x in list(data)])))
 		return self.hardware.write(RawFrame(identifier=0, data=data))
 
-	def _read (self, length: int) -> bytes:
-		logger.debug('K-Line trying to read {} bytes'.format(length))
-		data = self.hardware.read(length).data
-		logger.debug('K-Line success: {}'.format(' '.join([hex(x) for x in list(data)])))
-		return data
+	def _read (self, timeout: float | None = None) -> RawFrame:
+		'''
+		Read everything received so far, waiting up to timeout (hardware timeout if None)
+		for the first byte
+		'''
+		frame = self.hardware.read_many(max_frames=1, timeout=timeout)[0]
+		logger.debug('K-Line received: {}'.format(' '.join([hex(x) for x in list(frame.data)])))
+		return frame
 
 	def init (self, payload: bytes) -> list[tuple[bytes, int, int]]:
 		'''
@@ -62,28 +105,20 @@ class Kwp2000OverKLineTransport (TransportABC):
 
 		init_payload = self.build_payload(payload)
 		responses = []
-		responses.append(self.hardware.iso14230_fast_init(init_payload, timing_offset_ms=0))
-		# @todo: find out if there is some way to self-test and automatically measure the timing offset we should apply
+		# timing offset calibrated for the adapter (KLineHardware.calibrate()), 0 if it wasn't
+		responses.append(self.hardware.iso14230_fast_init(init_payload))
 		if responses[0][0][0:1] not in [b'\x00', b'\x81', b'\xC1']: # most often seen responses, depends on the adapter
-			responses.append(self.hardware.iso14230_fast_init(init_payload, timing_offset_ms=-2))
-			responses.append(self.hardware.iso14230_fast_init(init_payload, timing_offset_ms=2))
+			offset = getattr(self.hardware, 'timing_offset_ms', 0)
+			for retry_offset in (offset-2, offset+2):
+				responses.append(
+					self.hardware.iso14230_fast_init(init_payload, timing_offset_ms=retry_offset))
 
 		return responses
 
 	def calculate_checksum (self, payload: bytes) -> int:
-		return sum(payload) & 0xFF
+		return checksum(payload)
 
 	def build_payload (self, data: bytes) -> bytes:
-		data_length = len(data)
-
-		if (data_length < 127):
-			counter = 0x80 + data_length
-		else:
-			counter = 0x80
-			data = bytes([data_length]) + data
-
-		payload = bytes([counter, self.tx_id, self.rx_id]) 
-		payload += data
-		payload += self.calculate_checksum(payload).to_bytes(1, 'big')
-
-		return payload
\ No newline at end of file
+		if self.tx_id is None or self.rx_id is None:
+			raise KLineFrameException('Target (tx_id) and source (rx_id) address are required')
+		return build_frame(data, self.tx_id, self.rx_id)
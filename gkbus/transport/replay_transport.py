@@ -0,0 +1,253 @@
+import logging
+import re
+import time
+from typing import Iterable
+
+from typing_extensions import Self
+
+from ..hardware.hardware_abc import HardwareABC, TimeoutException
+from ..hardware.virtual_hardware import VirtualHardware
+from ..utils import monotonic_from_wall_clock_ns
+from .isotp import IsoTpFrameType, IsoTpReassembler, frame_type
+from .kline_framing import KLineFrameParser, build_frame, parse_frame
+from .kwp2000_over_kline_transport import Kwp2000OverKLineTransport
+from .transport_abc import PacketDirection, RawPacket, TransportABC
+
+logger = logging.getLogger(__name__)
+
+# (timestamp) interface identifier#data, ## and a flags nibble for CAN FD, optional T/R direction
+CANDUMP_LINE = re.compile(
+	r'^\((\d+)\.(\d+)\)\s+\S+\s+([0-9A-Fa-f]+)#(#[0-9A-Fa-f])?([0-9A-Fa-f]*)(?:\s+([TR]))?\s*$'
+)
+
+class ReplayException(IOError):
+	pass
+
+class ReplayTransport (TransportABC):
+	'''
+	Transport answering from a recorded session instead of a bus - drop-in for
+	Kwp2000Protocol and CcpProtocol. Every sent PDU consumes the next recorded outgoing
+	packet, read_pdu() returns the recorded incoming packets that followed it, in order.
+	Once they run out, reads raise TimeoutException - exactly what a silent ECU would cause.
+
+	By default responses are returned immediately, so whatever is measured is the
+	overhead of the library itself.
+
+	:param packets: recorded session, i.e. transport.buffer_dump() or from_candump()
+	:param hardware: hardware handed to the protocol for open()/close()/set_timeout(),
+		not used for transfers. Defaults to a VirtualHardware
+	:param realtime: preserve recorded timing - a response becomes readable only after
+		the time that passed between it and the previous packet in the recording
+	:param strict: raise ReplayException if a sent PDU differs from the recorded one
+	:param kline: packets were recorded by Kwp2000OverKLineTransport and include the K-Line
+		header and checksum - strip them, like the K-Line transport does. PDUs are limited
+		to what a K-Line frame carries, so protocols request the same block sizes
+	:param loop: start over from the beginning once the recording runs out
+	'''
+	def __init__ (self,
+			packets: Iterable[RawPacket],
+			hardware: HardwareABC | None = None,
+			tx_id: int | None = None,
+			rx_id: int | None = None,
+			realtime: bool = False,
+			strict: bool = False,
+			kline: bool = False,
+			loop: bool = False
+		) -> None:
+		super().__init__(hardware or VirtualHardware(port='replay'), tx_id, rx_id)
+		self.packets: list[RawPacket] = list(packets)
+		self.realtime = realtime
+		self.strict = strict
+		self.kline = kline
+		self.loop = loop
+		if kline:
+			self.max_pdu_size = Kwp2000OverKLineTransport.max_pdu_size
+		self.rewind()
+
+	@classmethod
+	def from_candump (cls,
+			path: str,
+			tx_id: int | None = None,
+			rx_id: int | None = None,
+			isotp: bool = False,
+			hardware: HardwareABC | None = None,
+			realtime: bool = False,
+			strict: bool = False,
+			loop: bool = False,
+			kline: bool = False
+		) -> Self:
+		'''
+		Load a candump log (candump -l, or written by CandumpCapture). The direction of
+		a frame is taken from the T/R flag at the end of the line if present, otherwise
+		frames on tx_id are outgoing and frames on rx_id incoming. When both ids are given,
+		frames on other identifiers are ignored
+
+		:param isotp: reassemble ISO-TP payloads (KWP2000 over CAN), flow control frames are dropped
+		:param kline: the log was written by CandumpCapture from Kwp2000OverKLineTransport -
+			K-Line frames are rebuilt from the identifier 0 lines, see read_candump()
+		'''
+		packets = read_candump(path, tx_id, rx_id, isotp, kline)
+		return cls(
+			packets, hardware, tx_id, rx_id,
+			realtime=realtime, strict=strict, kline=kline, loop=loop
+		)
+
+	def rewind (self) -> Self:
+		'''
+		Start replaying from the beginning of the recording
+		'''
+		self.position: int = 0
+		self._reference_timestamp: int | None = None
+		self._reference_time: float = time.perf_counter()
+		return self
+
+	def _next_request (self) -> RawPacket | None:
+		for _ in range(2 if self.loop else 1):
+			for index in range(self.position, len(self.packets)):
+				if self.packets[index].direction == PacketDirection.OUTGOING:
+					self.position = index+1
+					return self.packets[index]
+			if self.loop:
+				self.rewind()
+		return None
+
+	def _unwrap (self, data: bytes) -> bytes:
+		if not self.kline:
+			return data
+		return parse_frame(data).data
+
+	def _wrap (self, pdu: bytes, recorded: RawPacket) -> bytes:
+		'''
+		Packet for the sent PDU, as the original transport would log it - on K-Line
+		framed with the addresses of the recorded request
+		'''
+		if not self.kline:
+			return pdu
+		frame = parse_frame(recorded.data)
+		if frame.data == pdu:
+			return recorded.data
+		return build_frame(pdu, frame.target or 0, frame.source or 0)
+
+	def _wait (self, packet: RawPacket) -> None:
+		if self.realtime and self._reference_timestamp is not None:
+			recorded_delay = (packet.timestamp - self._reference_timestamp)/1000000000
+			delay = recorded_delay - (time.perf_counter() - self._reference_time)
+			if delay > 0:
+				time.sleep(delay)
+		self._reference_timestamp = packet.timestamp
+		self._reference_time = time.perf_counter()
+
+	def send_pdu (self, pdu: bytes) -> int:
+		recorded = self._next_request()
+
+		if recorded is None:
+			raise ReplayException('Recording ended, nothing recorded for {!r}'.format(pdu))
+
+		if self.strict and self._unwrap(recorded.data) != pdu:
+			raise ReplayException('Sent {!r}, recording has {!r} (packet {})'.format(
+				pdu, self._unwrap(recorded.data), self.position-1))
+
+		self._reference_timestamp, self._reference_time = recorded.timestamp, time.perf_counter()
+		self.buffer_push(RawPacket(
+			direction=PacketDirection.OUTGOING, data=self._wrap(pdu, recorded),
+			timestamp=self.packet_timestamp(), identifier=recorded.identifier
+		))
+
+		return len(pdu)
+
+	def read_pdu (self) -> bytes:
+		# a response belongs to the last sent request - don't run into the next exchange
+		if self.position >= len(self.packets):
+			raise TimeoutException
+
+		recorded = self.packets[self.position]
+		if recorded.direction != PacketDirection.INCOMING:
+			raise TimeoutException
+		self.position += 1
+
+		self._wait(recorded)
+		self.buffer_push(RawPacket(direction=PacketDirection.INCOMING, data=recorded.data,
+			timestamp=self.packet_timestamp(), identifier=recorded.identifier))
+
+		return self._unwrap(recorded.data)
+
+def read_candump (path: str,
+		tx_id: int | None = None,
+		rx_id: int | None = None,
+		isotp: bool = False,
+		kline: bool = False
+	) -> list[RawPacket]:
+	'''
+	Parse a candump log into a list of RawPackets, see ReplayTransport.from_candump()
+
+	:param kline: rebuild K-Line frames, logged by CandumpCapture on identifier 0 and cut into
+		lines of 8 (or, padded, up to 64) bytes. Only lines with the T/R flag are used,
+		tx_id and rx_id are K-Line addresses then and don't filter anything
+	:raises ReplayException: if both isotp and kline are set
+	'''
+	if isotp and kline:
+		raise ReplayException('A log holds either ISO-TP or K-Line packets, not both')
+
+	packets = []
+	reassemblers = {direction: IsoTpReassembler() for direction in PacketDirection}
+	parsers = {direction: KLineFrameParser() for direction in PacketDirection}
+	first_frame_timestamps = {}
+
+	with open(path, 'r') as f:
+		for line in f:
+			match = CANDUMP_LINE.match(line)
+			if match is None:
+				continue
+
+			seconds, fraction, identifier, _fd_flags, data, flag = match.groups()
+			identifier, data = int(identifier, 16), bytes.fromhex(data)
+			nanoseconds = int(seconds)*1000000000 + int(fraction.ljust(9, '0')[:9])
+			timestamp = monotonic_from_wall_clock_ns(nanoseconds)
+
+			if kline:
+				if identifier != 0 or not flag:
+					continue
+				direction = PacketDirection.INCOMING if flag == 'R' else PacketDirection.OUTGOING
+				parser = parsers[direction]
+				if not parser.buffer:
+					first_frame_timestamps[direction] = timestamp
+				parser.feed(data)
+				frame = parser.next_frame()
+				if frame is None:
+					continue
+				parser.reset() # every packet starts on a new line, the rest is CAN FD padding
+				packets.append(RawPacket(
+					direction=direction, data=frame.raw, timestamp=first_frame_timestamps[direction]
+				))
+				continue
+
+			if tx_id is not None and rx_id is not None and identifier not in (tx_id, rx_id):
+				continue
+
+			if flag:
+				direction = PacketDirection.INCOMING if flag == 'R' else PacketDirection.OUTGOING
+			elif identifier == tx_id:
+				direction = PacketDirection.OUTGOING
+			elif identifier == rx_id:
+				direction = PacketDirection.INCOMING
+			else:
+				continue
+
+			if isotp:
+				kind = frame_type(data)
+				if kind is None or kind == IsoTpFrameType.FLOW_CONTROL:
+					continue
+				if kind != IsoTpFrameType.CONSECUTIVE_FRAME:
+					first_frame_timestamps[direction] = timestamp
+				data = reassemblers[direction].feed(data)
+				if data is None:
+					continue
+				timestamp = first_frame_timestamps.get(direction, timestamp)
+
+			packets.append(RawPacket(
+				direction=direction, data=data, timestamp=timestamp, identifier=identifier
+			))
+
+	logger.debug('Loaded {} packets from {}'.format(len(packets), path))
+
+	return packets
@@ -1,17 +1,26 @@
+import threading
 from abc import ABC
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum
+from typing import TYPE_CHECKING, Iterable, Iterator
 
 from typing_extensions import Self
 
 from ..hardware.hardware_abc import HardwareABC
+from ..utils import monotonic_ns, wall_clock_ns
 
+if TYPE_CHECKING:
+	from .capture import CaptureWriter
+
+# guards the lazy creation of the per-instance buffer, see TransportABC._buffer_state()
+_buffer_init_lock = threading.Lock()
 
 class PacketDirection(Enum):
 	INCOMING = 0
 	OUTGOING = 1
 
-@dataclass
+@dataclass(slots=True)
 class RawPacket:
 	'''
 	Raw packet being sent over the hardware port
@@ -20,17 +29,35 @@ class RawPacket:
 	:type direction: PacketDirection
 	:param data: Raw data being sent over the hardware port
 	:type data: bytes
-	:param timestamp: Timestamp in miliseconds
+	:param timestamp: Monotonic timestamp in nanoseconds, see gkbus.utils.monotonic_ns().
+		For incoming packets it's the receive timestamp of the (first) frame reported
+		by the hardware. Use wall_clock_ns() for the time since the epoch
 	:type timestamp: int
+	:param identifier: CAN identifier the packet was sent on, None for K-Line
+	:type identifier: int | None
+	:param round_trip_ns: Incoming packets only - nanoseconds since the last outgoing packet,
+		the request this packet answers
+	:type round_trip_ns: int | None
 	'''
 
 	direction: PacketDirection
 	data: bytes
 	timestamp: int
+	identifier: int | None = None
+	round_trip_ns: int | None = None
+
+	def wall_clock_ns (self) -> int:
+		'''
+		Timestamp in nanoseconds since the epoch, see gkbus.utils.wall_clock_ns()
+		'''
+		return wall_clock_ns(self.timestamp)
 
 	def __str__ (self) -> str:
 		direction = 'Incoming' if self.direction == PacketDirection.INCOMING else 'Outgoing'
-		return 'RawPacket({}, ts={}, data={!r})'.format(direction, self.timestamp, self.data)
+		if self.identifier is None:
+			return 'RawPacket({}, ts={}, data={!r})'.format(direction, self.timestamp, self.data)
+		return 'RawPacket({}, id={}, ts={}, data={!r})'.format(
+			direction, hex(self.identifier), self.timestamp, self.data)
 
 	def __repr__ (self) -> str:
 		return self.__str__()
@@ -39,15 +66,27 @@ class TransportABC(ABC):
 	'''
 	Transport layer for protocols
 
-	:param buffer: Buffer storing last X packets, X determined by 
-		buffer_size
-	:type buffer: list[RawPacket]
+	:param buffer: Ring buffer storing last X packets, X determined by 
+		buffer_size. Every transport instance has its own
+	:type buffer: collections.deque[RawPacket]
 	:param buffer_size: Determines the size of the buffer.
 		0 - unlimited buffer, None - no buffer
 	:type buffer_size: int
+	:param capture: Writer streaming every packet to a file, see set_capture()
+	:type capture: CaptureWriter | None
+	:param last_round_trip_ns: Nanoseconds between the last request and the latest response to it
+	:type last_round_trip_ns: int | None
+	:param max_pdu_size: Largest PDU the transport can carry, None - no limit
+	:type max_pdu_size: int | None
 	'''
-	buffer: list[RawPacket] = [] # is this shared between all transports? @todo critical
-	buffer_size: int = 20
+	buffer_size: int | None = 20
+	max_pdu_size: int | None = None
+	capture: 'CaptureWriter | None' = None
+	last_round_trip_ns: int | None = None
+	_request_timestamp: int | None = None
+	# replaced per instance, class level so that subclasses not calling __init__() still work
+	_buffer: 'deque[RawPacket] | None' = None
+	_buffer_lock: 'threading.Lock | None' = None
 
 	def __init__ (self, hardware: HardwareABC, tx_id: int | None = None, rx_id: int | None = None) -> None:
 		'''
@@ -60,7 +99,8 @@ class TransportABC(ABC):
 		'''
 		self.hardware = hardware
 		self.tx_id, self.rx_id = tx_id, rx_id
-		self.buffer = []
+		self._buffer_lock = threading.Lock()
+		self._buffer = deque(maxlen=self.buffer_size or None)
 
 	def init (self) -> bool:
 		'''
@@ -113,35 +153,117 @@ class TransportABC(ABC):
 		'''
 		return self.rx_id
 
-	def set_buffer_size (self, buffer_size: int) -> Self:
+	def _buffer_state (self) -> tuple[threading.Lock, 'deque[RawPacket]']:
+		'''
+		Lock and ring buffer of this instance, created on first use if __init__() didn't
+		'''
+		if self._buffer_lock is None or self._buffer is None:
+			with _buffer_init_lock:
+				if self._buffer_lock is None:
+					self._buffer_lock = threading.Lock()
+				if self._buffer is None:
+					self._buffer = deque(maxlen=self.buffer_size or None)
+		return self._buffer_lock, self._buffer
+
+	@property
+	def buffer (self) -> 'deque[RawPacket]':
+		return self._buffer_state()[1]
+
+	@buffer.setter
+	def buffer (self, packets: Iterable[RawPacket]) -> None:
+		lock, _ = self._buffer_state()
+		with lock:
+			self._buffer = deque(packets, maxlen=self.buffer_size or None)
+
+	def set_buffer_size (self, buffer_size: int | None) -> Self:
 		'''
-		Set size of the buffer. 
+		Set size of the buffer. The most recent packets are kept if the buffer shrinks
 
 		:param buffer_size: 0 for unlimited, None for no logging
 		:type buffer_size: int
 		:rtype: TransportABC
 		'''
-		self.buffer_size = buffer_size
+		lock, buffer = self._buffer_state()
+		with lock:
+			self.buffer_size = buffer_size
+			self._buffer = deque(buffer, maxlen=buffer_size or None)
+		return self
 
-	def get_buffer_size (self) -> int:
+	def get_buffer_size (self) -> int | None:
 		return self.buffer_size
 
+	@staticmethod
+	def packet_timestamp (hardware_timestamp: int = 0) -> int:
+		'''
+		Timestamp for a RawPacket
+
+		:param hardware_timestamp: RawFrame.timestamp of the received frame,
+			0 - take the current time
+		:return: monotonic timestamp in nanoseconds
+		'''
+		return hardware_timestamp or monotonic_ns()
+
+	def set_capture (self, capture: 'CaptureWriter | None') -> Self:
+		'''
+		Stream every packet to a capture file, independently of the buffer - 
+		works with buffer_size None too. The writer is not closed by the transport
+
+		:param capture: CaptureWriter instance, i.e. CandumpCapture or PcapngCapture.
+			None to stop capturing
+		:rtype: TransportABC
+		'''
+		self.capture = capture
+		return self
+
 	def buffer_push (self, packet: RawPacket) -> Self:
-		if (self.buffer_size == None):
+		'''
+		Log a packet. O(1) - once the buffer is full, the oldest packet is dropped.
+		Incoming packets get their round_trip_ns filled in here
+		'''
+		if packet.direction == PacketDirection.OUTGOING:
+			self._request_timestamp = packet.timestamp
+		elif self._request_timestamp is not None:
+			packet.round_trip_ns = packet.timestamp - self._request_timestamp
+			self.last_round_trip_ns = packet.round_trip_ns
+
+		if self.capture is not None:
+			self.capture.push(packet)
+
+		if self.buffer_size is None:
 			return self
 
-		self.buffer.append(packet)
-		if (self.buffer_size != 0 and len(self.buffer) > self.buffer_size):
-			del self.buffer[0:(len(self.buffer)-self.buffer_size)]
-		
+		lock, buffer = self._buffer_state()
+		with lock:
+			buffer.append(packet)
+
 		return self
 
+	def buffer_snapshot (self) -> tuple[RawPacket, ...]:
+		'''
+		Retrieve contents of the buffer without emptying it. Packets are not copied,
+		only references to them - cheap even for long traces
+
+		:return: A tuple of RawPacket objects, oldest first
+		'''
+		lock, buffer = self._buffer_state()
+		with lock:
+			return tuple(buffer)
+
+	def buffer_iter (self) -> Iterator[RawPacket]:
+		'''
+		Iterate over the buffer, oldest packet first. Iterates over a snapshot,
+		so packets pushed meanwhile (i.e. by another thread) don't break the iteration
+		'''
+		return iter(self.buffer_snapshot())
+
 	def buffer_dump (self) -> list[RawPacket]:
 		'''
 		Retrieve contents of the buffer and empty the buffer
 
 		:return: A list of RawPacket objects
 		'''
-		packets = self.buffer
-		self.buffer = []
-		return packets
\ No newline at end of file
+		lock, buffer = self._buffer_state()
+		with lock:
+			packets = list(buffer)
+			buffer.clear()
+		return packets
@@ -1,3 +1,4 @@
+import time
 from ctypes import LittleEndianStructure
 
 
@@ -13,8 +14,51 @@ class LittleEndianBitfield(LittleEndianStructure):
 			', '.join([f'{k}={v}' for k,v in self._to_dict().items()])
 		)
 
-def ms_to_ns (miliseconds: int) -> int:
-	return miliseconds*1000000
+def ms_to_ns (miliseconds: float) -> int:
+	return int(miliseconds*1000000)
 
 def ns_to_ms (nanoseconds: int) -> int:
-	return round(nanoseconds/1000000)
\ No newline at end of file
+	return round(nanoseconds/1000000)
+
+def monotonic_ns () -> int:
+	'''
+	Current time of the clock packets and frames are timestamped with: time.perf_counter_ns() -
+	nanoseconds, highest resolution available, never jumps (NTP, DST, manual changes).
+	Meaningful only when compared to other readings of the same clock, within one process
+	'''
+	return time.perf_counter_ns()
+
+# (wall clock, monotonic_ns()) read together once, all conversions are relative to it -
+# timestamps keep their order and spacing even if the wall clock is stepped later
+WALL_CLOCK_ANCHOR = (time.time_ns(), time.perf_counter_ns())
+
+def wall_clock_ns (monotonic: int) -> int:
+	'''
+	Convert a monotonic_ns() timestamp to nanoseconds since the epoch, as the wall clock
+	read when gkbus was imported
+	'''
+	return WALL_CLOCK_ANCHOR[0] + monotonic - WALL_CLOCK_ANCHOR[1]
+
+def monotonic_from_wall_clock_ns (wall_clock: int) -> int:
+	'''
+	Convert nanoseconds since the epoch (i.e. kernel receive timestamp of a frame) to a
+	monotonic_ns() timestamp, the inverse of wall_clock_ns()
+	'''
+	return WALL_CLOCK_ANCHOR[1] + wall_clock - WALL_CLOCK_ANCHOR[0]
+
+SPIN_THRESHOLD_NS = 2000000
+
+def sleep_until_ns (deadline: int, spin_threshold: int = SPIN_THRESHOLD_NS) -> int:
+	'''
+	Wait until time.perf_counter_ns() reaches the deadline. Sleeps through most of the interval
+	and busy waits only the last spin_threshold nanoseconds - time.sleep() alone is too coarse
+	for sub-millisecond timing, spinning alone burns a CPU core for the whole interval
+
+	:return: time.perf_counter_ns() at the moment the deadline was reached
+	'''
+	remaining = deadline - time.perf_counter_ns()
+	if remaining > spin_threshold:
+		time.sleep((remaining - spin_threshold) / 1000000000)
+	while (now := time.perf_counter_ns()) < deadline:
+		pass
+	return now
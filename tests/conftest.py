@@ -0,0 +1,37 @@
+import pytest
+
+from gkbus.hardware import VirtualCanHardware, VirtualKLineHardware
+from gkbus.protocol import kwp2000
+from gkbus.simulator import Kwp2000Ecu
+from gkbus.transport import IsoTpParameters, Kwp2000OverCanTransport, Kwp2000OverKLineTransport
+
+BASE_ADDRESS = 0x080000
+IMAGE_SIZE = 0x1000
+# short enough for lost responses to keep the tests fast
+TIMEOUT = 0.05
+
+def image (size: int = IMAGE_SIZE) -> bytes:
+	return bytes([(x*7 + (x >> 8)) & 0xFF for x in range(size)])
+
+@pytest.fixture
+def kline_client () -> tuple[kwp2000.Kwp2000Protocol, Kwp2000Ecu]:
+	hardware = VirtualKLineHardware()
+	ecu = Kwp2000Ecu(image(), BASE_ADDRESS).attach(hardware)
+
+	client = kwp2000.Kwp2000Protocol(Kwp2000OverKLineTransport(hardware, tx_id=0x11, rx_id=0xF1))
+	client.init(kwp2000.commands.StartCommunication())
+	hardware.set_timeout(TIMEOUT)
+	return client, ecu
+
+@pytest.fixture
+def can_client () -> tuple[kwp2000.Kwp2000Protocol, Kwp2000Ecu]:
+	hardware = VirtualCanHardware()
+	ecu = Kwp2000Ecu(image(), BASE_ADDRESS, request_id=0x7E0, response_id=0x7E8)
+	ecu.attach(hardware)
+
+	transport = Kwp2000OverCanTransport(hardware, tx_id=0x7E0, rx_id=0x7E8,
+		isotp_parameters=IsoTpParameters())
+	client = kwp2000.Kwp2000Protocol(transport)
+	client.init(kwp2000.commands.StartCommunication())
+	hardware.set_timeout(TIMEOUT)
+	return client, ecu
@@ -0,0 +1,103 @@
+from pathlib import Path
+
+import pytest
+from conftest import BASE_ADDRESS, image
+
+from gkbus.hardware import TimeoutException
+from gkbus.protocol import kwp2000
+from gkbus.simulator import Kwp2000Ecu
+from gkbus.transport import (
+    CandumpCapture,
+    PacketDirection,
+    PcapngCapture,
+    ReplayException,
+    ReplayTransport,
+)
+
+Client = tuple[kwp2000.Kwp2000Protocol, Kwp2000Ecu]
+
+def replay_client (replay: ReplayTransport) -> kwp2000.Kwp2000Protocol:
+	client = kwp2000.Kwp2000Protocol(replay)
+	client.init(kwp2000.commands.StartCommunication())
+	return client
+
+def record (client: kwp2000.Kwp2000Protocol, path: Path, isotp: bool = False) -> bytes:
+	with CandumpCapture(str(path), isotp=isotp) as capture:
+		client.transport.set_capture(capture)
+		data = client.read_memory(BASE_ADDRESS, 0x200)
+		client.transport.set_capture(None)
+	return bytes(data)
+
+def test_kline_round_trip (kline_client: Client, tmp_path: Path) -> None:
+	client, _ecu = kline_client
+	path = tmp_path / 'kline.log'
+	assert record(client, path) == image()[:0x200]
+
+	replay = ReplayTransport.from_candump(str(path), kline=True, strict=True)
+	assert replay_client(replay).read_memory(BASE_ADDRESS, 0x200) == image()[:0x200]
+
+def test_can_round_trip (can_client: Client, tmp_path: Path) -> None:
+	client, _ecu = can_client
+	path = tmp_path / 'can.log'
+	assert record(client, path, isotp=True) == image()[:0x200]
+
+	replay = ReplayTransport.from_candump(str(path), tx_id=0x7E0, rx_id=0x7E8, isotp=True,
+		strict=True)
+	assert replay_client(replay).read_memory(BASE_ADDRESS, 0x200) == image()[:0x200]
+
+def test_replay_matches_recorded_packets (can_client: Client, tmp_path: Path) -> None:
+	client, _ecu = can_client
+	path = tmp_path / 'can.log'
+	client.transport.buffer_dump()
+	record(client, path, isotp=True)
+	recorded = client.transport.buffer_dump()
+
+	packets = ReplayTransport.from_candump(str(path), tx_id=0x7E0, rx_id=0x7E8, isotp=True).packets
+	assert [(x.direction, x.data) for x in packets] == [(x.direction, x.data) for x in recorded]
+	assert {x.direction for x in packets} == set(PacketDirection)
+
+def test_replay_from_buffer (kline_client: Client) -> None:
+	client, _ecu = kline_client
+	client.transport.buffer_dump()
+	client.read_memory(BASE_ADDRESS, 0x100)
+
+	replay = ReplayTransport(client.transport.buffer_dump(), kline=True, strict=True)
+	replayed = replay_client(replay)
+	assert replayed.read_memory(BASE_ADDRESS, 0x100) == image()[:0x100]
+
+	# the recording is over - a silent ECU
+	with pytest.raises(ReplayException):
+		replayed.read_memory(BASE_ADDRESS, 0x100)
+
+def test_strict_replay_rejects_other_requests (kline_client: Client) -> None:
+	client, _ecu = kline_client
+	client.transport.buffer_dump()
+	client.read_memory(BASE_ADDRESS, 0x10)
+
+	replay = ReplayTransport(client.transport.buffer_dump(), kline=True, strict=True)
+	with pytest.raises(ReplayException):
+		replay_client(replay).read_memory(BASE_ADDRESS+0x10, 0x10)
+
+def test_replay_without_response (kline_client: Client) -> None:
+	client, _ecu = kline_client
+	client.transport.buffer_dump()
+	client.read_memory(BASE_ADDRESS, 0x10)
+	packets = [x for x in client.transport.buffer_dump() if x.direction == PacketDirection.OUTGOING]
+
+	replay = ReplayTransport(packets, kline=True)
+	with pytest.raises(TimeoutException):
+		replay_client(replay).read_memory(BASE_ADDRESS, 0x10, retries=0)
+
+def test_pcapng_capture (can_client: Client, tmp_path: Path) -> None:
+	client, _ecu = can_client
+	path = tmp_path / 'can.pcapng'
+
+	with PcapngCapture(str(path), isotp=True) as capture:
+		client.transport.set_capture(capture)
+		client.read_memory(BASE_ADDRESS, 0x100)
+		client.transport.set_capture(None)
+
+	data = path.read_bytes()
+	assert data[:4] == b'\x0A\x0D\x0D\x0A' # section header block
+	assert capture.packets_written > 0
+	assert capture.error is None
@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+from gkbus.protocol.kwp2000.codecs import (
+    COMPRESSION_CODECS,
+    Codec,
+    CodecException,
+    DataFormatCodec,
+    IdentityCodec,
+    LzssCodec,
+    XorCodec,
+    data_format_codec,
+    register_compression_codec,
+)
+
+SAMPLES = {
+	'empty': bytes(),
+	'short': b'ab',
+	'erased': b'\xFF' * 0x2000,
+	'text': b'calibration table ' * 300,
+	'random': random.Random(1).randbytes(0x1800),
+	'mixed': random.Random(2).randbytes(0x800) + bytes(0x1800) + bytes(range(256)) * 20,
+}
+
+def encode_chunked (codec: Codec, data: bytes, chunk_size: int) -> bytes:
+	stream = codec.encoder()
+	chunks = [stream.update(data[x:x+chunk_size]) for x in range(0, len(data), chunk_size)]
+	return b''.join(chunks) + stream.flush()
+
+def decode_chunked (codec: Codec, data: bytes, chunk_size: int) -> bytes:
+	stream = codec.decoder()
+	chunks = [stream.update(data[x:x+chunk_size]) for x in range(0, len(data), chunk_size)]
+	return b''.join(chunks) + stream.flush()
+
+@pytest.mark.parametrize('name', SAMPLES.keys())
+def test_lzss_round_trip (name: str) -> None:
+	data, codec = SAMPLES[name], LzssCodec()
+	assert codec.decode(codec.encode(data)) == data
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 0xFE, 0x1001])
+def test_lzss_streaming (chunk_size: int) -> None:
+	data, codec = SAMPLES['mixed'], LzssCodec()
+	encoded = codec.encode(data)
+
+	assert encode_chunked(codec, data, chunk_size) == encoded
+	assert decode_chunked(codec, encoded, chunk_size) == data
+
+def test_lzss_compresses () -> None:
+	codec = LzssCodec()
+	assert len(codec.encode(SAMPLES['erased'])) < len(SAMPLES['erased']) // 8
+	assert len(codec.encode(SAMPLES['text'])) < len(SAMPLES['text']) // 4
+	# incompressible data grows by the flag bytes only
+	assert len(codec.encode(SAMPLES['random'])) <= len(SAMPLES['random']) * 9 // 8 + 1
+
+def test_lzss_decode_reference () -> None:
+	codec = LzssCodec()
+	# literal 'A' written at 0xFEE, then 5 bytes copied from 0xFEE - overlapping the output
+	assert codec.decode(b'\x01A\xEE\xF2') == b'AAAAAA'
+	# the window starts filled with spaces
+	assert codec.decode(b'\x00\x00\x00') == b'   '
+	assert codec.decode(b'\xFF' + b'ABCDEFGH') == b'ABCDEFGH'
+
+def test_lzss_truncated_reference () -> None:
+	stream = LzssCodec().decoder()
+	assert stream.update(b'\x01A\xEE') == b'A'
+	with pytest.raises(CodecException):
+		stream.flush()
+
+def test_xor () -> None:
+	codec = XorCodec(b'\x5A\xA5\x01')
+	data = SAMPLES['mixed']
+	encoded = encode_chunked(codec, data, 7)
+
+	assert encoded[:3] == bytes([data[0] ^ 0x5A, data[1] ^ 0xA5, data[2] ^ 0x01])
+	assert decode_chunked(codec, encoded, 0xFE) == data
+
+	with pytest.raises(CodecException):
+		XorCodec(bytes())
+
+def test_data_format_codec () -> None:
+	codec = DataFormatCodec(LzssCodec(), XorCodec(b'\x5A'))
+	data = SAMPLES['text']
+	encoded = encode_chunked(codec, data, 0xFE)
+
+	assert XorCodec(b'\x5A').decode(encoded) == LzssCodec().encode(data)
+	assert decode_chunked(codec, encoded, 0xFE) == data
+	assert not codec.is_identity()
+	assert DataFormatCodec(IdentityCodec(), IdentityCodec()).is_identity()
+
+def test_registered_codecs () -> None:
+	assert data_format_codec(0x0, 0x0).is_identity()
+	with pytest.raises(CodecException):
+		data_format_codec(0x7, 0x0)
+
+	register_compression_codec(0x7, LzssCodec)
+	try:
+		codec = data_format_codec(0x7, 0x0)
+		assert codec.decode(codec.encode(SAMPLES['text'])) == SAMPLES['text']
+	finally:
+		del COMPRESSION_CODECS[0x7]
@@ -0,0 +1,81 @@
+import pytest
+from conftest import BASE_ADDRESS, image
+
+from gkbus.protocol import kwp2000
+from gkbus.simulator import Kwp2000Ecu
+from gkbus.transport import IsoTpException, IsoTpParameters
+from gkbus.transport.isotp import IsoTpReassembler, segment
+
+Client = tuple[kwp2000.Kwp2000Protocol, Kwp2000Ecu]
+
+def reassemble (frames: list[bytes]) -> bytes | None:
+	reassembler = IsoTpReassembler()
+	payloads = [reassembler.feed(frame) for frame in frames]
+	assert payloads[:-1] == [None]*(len(frames)-1)
+	return payloads[-1]
+
+@pytest.mark.parametrize('length', [1, 7, 8, 13, 14, 0xFE, 0xFFF, 0x1000, 0x2345])
+def test_segment_reassemble (length: int) -> None:
+	payload = bytes([x & 0xFF for x in range(length)])
+	frames = segment(payload)
+
+	assert all(len(frame) == 8 for frame in frames)
+	assert reassemble(frames) == payload
+
+def test_segment_frame_layout () -> None:
+	assert segment(b'\x01\x02\x03') == [b'\x03\x01\x02\x03\xCC\xCC\xCC\xCC']
+	assert segment(b'\x01\x02\x03', padding=None) == [b'\x03\x01\x02\x03']
+
+	frames = segment(bytes(range(20)), padding=None)
+	assert frames[0] == b'\x10\x14' + bytes(range(6))
+	assert [frame[0] for frame in frames[1:]] == [0x21, 0x22]
+	assert frames[-1] == b'\x22' + bytes(range(13, 20))
+
+def test_segment_long_payload_escape () -> None:
+	frames = segment(bytes(0x1000))
+	assert frames[0][:6] == b'\x10\x00\x00\x00\x10\x00'
+
+def test_sequence_number_wraps () -> None:
+	frames = segment(bytes(range(256))*2)
+	assert [frame[0] for frame in frames[15:18]] == [0x2F, 0x20, 0x21]
+	assert reassemble(frames) == bytes(range(256))*2
+
+def test_wrong_sequence_number () -> None:
+	frames = segment(bytes(0x40))
+	reassembler = IsoTpReassembler()
+	reassembler.feed(frames[0])
+
+	with pytest.raises(IsoTpException):
+		reassembler.feed(frames[2])
+	assert not reassembler.in_progress
+
+def test_invalid_single_frame_length () -> None:
+	with pytest.raises(IsoTpException):
+		IsoTpReassembler().feed(b'\x07\x01\x02')
+
+def test_new_transfer_replaces_unfinished_one () -> None:
+	first, second = segment(bytes(0x40)), segment(b'\x01\x02')
+	reassembler = IsoTpReassembler()
+	reassembler.feed(first[0])
+
+	assert reassembler.feed(second[0]) == b'\x01\x02'
+	assert reassembler.feed(first[1]) is None
+
+def test_unexpected_consecutive_frame_ignored () -> None:
+	assert IsoTpReassembler().feed(b'\x21' + bytes(7)) is None
+
+@pytest.mark.parametrize('parameters', [
+	IsoTpParameters(),
+	IsoTpParameters(block_size=2),
+	IsoTpParameters(padding=None),
+])
+def test_multi_frame_exchange (can_client: Client, parameters: IsoTpParameters) -> None:
+	client, ecu = can_client
+	ecu.isotp_parameters = parameters
+	data = bytes(reversed(image()))[:0x400]
+
+	# multi frame requests, flow controlled by the ECU
+	client.download(BASE_ADDRESS, data, verify=False)
+	assert ecu.memory[:0x400] == data
+	# multi frame responses, flow controlled by the tester
+	assert client.read_memory(BASE_ADDRESS, 0x400) == data
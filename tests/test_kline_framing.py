@@ -0,0 +1,97 @@
+import pytest
+
+from gkbus.hardware import VirtualKLineHardware
+from gkbus.simulator import Kwp2000Ecu
+from gkbus.transport import KLineFrameParser, Kwp2000OverKLineTransport
+from gkbus.transport.kline_framing import (
+    ChecksumException,
+    KLineFrameException,
+    build_frame,
+    parse_frame,
+)
+
+TX_ID, RX_ID = 0x11, 0xF1
+
+@pytest.fixture
+def transport () -> Kwp2000OverKLineTransport:
+	return Kwp2000OverKLineTransport(VirtualKLineHardware(), tx_id=TX_ID, rx_id=RX_ID)
+
+@pytest.fixture
+def ecu () -> Kwp2000Ecu:
+	return Kwp2000Ecu(address=TX_ID, tester_address=RX_ID)
+
+def test_short_payload_length_in_format_byte (transport: Kwp2000OverKLineTransport) -> None:
+	frame = transport.build_payload(b'\x21\x01')
+	assert frame == bytes([0x82, TX_ID, RX_ID, 0x21, 0x01, (0x82+TX_ID+RX_ID+0x22) & 0xFF])
+
+@pytest.mark.parametrize('length', [1, 2, 0x3E, 0x3F])
+def test_format_byte_length (
+		transport: Kwp2000OverKLineTransport,
+		ecu: Kwp2000Ecu,
+		length: int
+	) -> None:
+	data = bytes(range(length))
+	frame = transport.build_payload(data)
+
+	assert frame[0] == 0x80 | length
+	assert frame[1:3] == bytes([TX_ID, RX_ID])
+	assert frame[3:-1] == data
+	assert parse_frame(frame).data == data
+	assert ecu.unframe(frame) == data
+
+@pytest.mark.parametrize('length', [0x40, 0x41, 0x7E, 0x7F, 0x80, 0xFF])
+def test_length_byte (
+		transport: Kwp2000OverKLineTransport,
+		ecu: Kwp2000Ecu,
+		length: int
+	) -> None:
+	data = bytes([x & 0xFF for x in range(length)])
+	frame = transport.build_payload(data)
+
+	assert frame[0] == 0x80, 'address mode bits must not be touched by the length'
+	assert frame[1:4] == bytes([TX_ID, RX_ID, length])
+	assert frame[4:-1] == data
+	assert parse_frame(frame).data == data
+	assert ecu.unframe(frame) == data
+
+def test_simulator_frames_parse (ecu: Kwp2000Ecu) -> None:
+	for length in (1, 0x3F, 0x40, 0xFF):
+		data = bytes(length)
+		frame = parse_frame(ecu.frame(data))
+		assert (frame.target, frame.source, frame.data) == (RX_ID, TX_ID, data)
+
+def test_missing_addresses () -> None:
+	transport = Kwp2000OverKLineTransport(VirtualKLineHardware(), tx_id=TX_ID, rx_id=None) # type: ignore[arg-type]
+	with pytest.raises(KLineFrameException):
+		transport.build_payload(b'\x3E')
+
+def test_parse_frame_errors () -> None:
+	frame = build_frame(b'\x50\x81', TX_ID, RX_ID)
+	with pytest.raises(ChecksumException):
+		parse_frame(frame[:-1] + bytes([frame[-1] ^ 0xFF]))
+	with pytest.raises(KLineFrameException):
+		parse_frame(frame + b'\x00')
+
+def test_parser_resynchronizes () -> None:
+	frames = [build_frame(bytes(length), RX_ID, TX_ID) for length in (3, 0x50)]
+	parser = KLineFrameParser()
+
+	parser.feed(b'\x00\x55' + frames[0] + frames[1])
+	assert parser.next_frame().raw == frames[0]
+	assert parser.next_frame().raw == frames[1]
+	assert parser.next_frame() is None
+	assert parser.discarded_bytes == 2
+	assert parser.checksum_errors > 0
+
+def test_parser_incremental () -> None:
+	frame = build_frame(bytes(0x50), RX_ID, TX_ID)
+	parser = KLineFrameParser()
+
+	for byte in frame[:-1]:
+		parser.feed(bytes([byte]))
+		assert parser.next_frame() is None
+		assert parser.bytes_needed() > 0
+
+	parser.feed(frame[-1:])
+	assert parser.bytes_needed() == 0
+	assert parser.next_frame().data == bytes(0x50)
@@ -0,0 +1,42 @@
+from gkbus.protocol.kwp2000 import Kwp2000NegativeStatusIdentifierEnum as Nrc
+from gkbus.protocol.kwp2000.codecs import Codec, CodecException, CodecStream, IdentityCodec
+from gkbus.simulator import Kwp2000Ecu
+
+BASE_ADDRESS = 0x10000
+
+
+class _CorruptStream(CodecStream):
+	def update (self, data: bytes) -> bytes:
+		raise CodecException('Corrupted stream')
+
+class _CorruptCodec(Codec):
+	def encoder (self) -> CodecStream:
+		return _CorruptStream()
+
+	def decoder (self) -> CodecStream:
+		return _CorruptStream()
+
+def request_download (ecu: Kwp2000Ecu, data_format: int, size: int) -> list[bytes]:
+	return ecu.handle_pdu(bytes([0x34])
+		+ BASE_ADDRESS.to_bytes(3, 'big') + bytes([data_format]) + size.to_bytes(3, 'big'))
+
+def negative_response (service_identifier: int, code: Nrc) -> list[bytes]:
+	return [bytes([0x7F, service_identifier, code.value])]
+
+def test_transfer_data_decoding_failure () -> None:
+	ecu = Kwp2000Ecu(image=bytes(0x100), base_address=BASE_ADDRESS,
+		data_formats={0x00: IdentityCodec(), 0x10: _CorruptCodec()})
+
+	assert request_download(ecu, 0x10, 0x10)[-1][0] == 0x74
+	block = b'\x36' + bytes(0x10)
+	assert ecu.handle_pdu(block) == negative_response(0x36, Nrc.DATA_DECOMPRESSION_FAILED)
+	# the transfer is over, further blocks are out of sequence
+	assert ecu.handle_pdu(block) == negative_response(0x36, Nrc.REQUEST_SEQUENCE_ERROR)
+
+def test_transfer_data_download () -> None:
+	ecu = Kwp2000Ecu(image=bytes(0x100), base_address=BASE_ADDRESS)
+
+	assert request_download(ecu, 0x00, 0x10)[-1][0] == 0x74
+	assert ecu.handle_pdu(b'\x36' + bytes(range(0x10))) == [b'\x76']
+	assert ecu.handle_pdu(b'\x37') == [b'\x77']
+	assert ecu.memory[:0x10] == bytes(range(0x10))
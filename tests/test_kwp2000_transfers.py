@@ -0,0 +1,171 @@
+from typing import Callable
+
+import pytest
+from conftest import BASE_ADDRESS, image
+
+from gkbus.hardware import TimeoutException
+from gkbus.protocol import kwp2000
+from gkbus.protocol.kwp2000 import Kwp2000NegativeResponseException
+from gkbus.protocol.kwp2000 import Kwp2000NegativeStatusIdentifierEnum as Nrc
+from gkbus.protocol.kwp2000.codecs import LzssCodec
+from gkbus.simulator import Kwp2000Ecu
+from gkbus.simulator.kwp2000_ecu import Kwp2000NegativeResponse
+
+Client = tuple[kwp2000.Kwp2000Protocol, Kwp2000Ecu]
+
+READ_MEMORY_BY_ADDRESS = kwp2000.commands.ReadMemoryByAddress.service_identifier
+TRANSFER_DATA = kwp2000.commands.TransferData.service_identifier
+
+def fail (ecu: Kwp2000Ecu,
+		service_identifier: int,
+		code: Nrc,
+		after: int = 0,
+		times: int = 1
+	) -> None:
+	'''
+	Answer requests after the first after ones with a negative response, times times
+	'''
+	handler = ecu.handlers[service_identifier]
+	calls = 0
+
+	def failing (data: bytes) -> bytes:
+		nonlocal calls
+		calls += 1
+		if after < calls <= after+times:
+			raise Kwp2000NegativeResponse(code)
+		return handler(data)
+
+	ecu.handlers[service_identifier] = failing
+
+def lose (ecu: Kwp2000Ecu, service_identifier: int, after: int = 0, times: int = 1) -> None:
+	'''
+	Process requests as usual, but drop the responses after the first after ones, times times
+	'''
+	handle_pdu: Callable[[bytes], list[bytes]] = ecu.handle_pdu
+	calls = 0
+
+	def losing (pdu: bytes) -> list[bytes]:
+		nonlocal calls
+		responses = handle_pdu(pdu)
+		if pdu[0] != service_identifier:
+			return responses
+		calls += 1
+		return [] if after < calls <= after+times else responses
+
+	ecu.handle_pdu = losing # type: ignore[method-assign]
+
+def test_read_memory (kline_client: Client) -> None:
+	client, ecu = kline_client
+	assert client.read_memory(BASE_ADDRESS, 0x400) == image()[:0x400]
+	assert client.last_transfer.retries == 0
+
+def test_read_memory_halves_rejected_block_size (kline_client: Client) -> None:
+	client, ecu = kline_client
+	ecu.max_block_size = 0x40
+
+	assert client.read_memory(BASE_ADDRESS, 0x400) == image()[:0x400]
+	assert client.last_transfer.block_size <= 0x40
+
+def test_read_memory_retries_lost_response (kline_client: Client) -> None:
+	client, ecu = kline_client
+	lose(ecu, READ_MEMORY_BY_ADDRESS, after=2)
+
+	assert client.read_memory(BASE_ADDRESS, 0x400) == image()[:0x400]
+	assert client.last_transfer.retries == 1
+
+def test_read_memory_gives_up (kline_client: Client) -> None:
+	client, ecu = kline_client
+	lose(ecu, READ_MEMORY_BY_ADDRESS, after=1, times=10)
+
+	with pytest.raises(TimeoutException):
+		client.read_memory(BASE_ADDRESS, 0x400, retries=2)
+	assert client.last_transfer.retries == 2
+
+def test_upload (kline_client: Client) -> None:
+	client, ecu = kline_client
+	assert b''.join(client.upload(BASE_ADDRESS, 0x800)) == image()[:0x800]
+	assert client.last_transfer.retries == 0
+
+@pytest.mark.parametrize('code', [Nrc.TRANSFER_SUSPENDED, Nrc.REQUEST_SEQUENCE_ERROR])
+def test_upload_resumes_after_sequence_error (kline_client: Client, code: Nrc) -> None:
+	client, ecu = kline_client
+	fail(ecu, TRANSFER_DATA, code, after=3)
+
+	assert b''.join(client.upload(BASE_ADDRESS, 0x800)) == image()[:0x800]
+	assert client.last_transfer.retries == 1
+
+def test_upload_resumes_after_lost_response (kline_client: Client) -> None:
+	client, ecu = kline_client
+	lose(ecu, TRANSFER_DATA, after=2)
+
+	assert b''.join(client.upload(BASE_ADDRESS, 0x800)) == image()[:0x800]
+	assert client.last_transfer.retries == 1
+
+def test_compressed_upload_restarts_from_the_beginning (kline_client: Client) -> None:
+	client, ecu = kline_client
+	ecu.data_formats[0x10] = LzssCodec()
+	fail(ecu, TRANSFER_DATA, Nrc.TRANSFER_SUSPENDED, after=2)
+
+	data = b''.join(client.upload(BASE_ADDRESS, 0x1000, compression_type=0x1, codec=LzssCodec()))
+	assert data == image()
+	assert client.last_transfer.retries == 1
+	assert client.last_transfer.wire_bytes < 0x1000
+
+def test_upload_gives_up (kline_client: Client) -> None:
+	client, ecu = kline_client
+	fail(ecu, TRANSFER_DATA, Nrc.TRANSFER_SUSPENDED, after=1, times=10)
+
+	with pytest.raises(Kwp2000NegativeResponseException):
+		b''.join(client.upload(BASE_ADDRESS, 0x800, retries=2))
+	assert client.last_transfer.retries == 2
+
+def test_download (kline_client: Client) -> None:
+	client, ecu = kline_client
+	data = bytes(reversed(image()))
+
+	transfer = client.download(BASE_ADDRESS, data)
+	assert ecu.memory == data
+	assert (transfer.done, transfer.retries) == (len(data), 0)
+
+def test_download_resumes_after_transfer_suspended (kline_client: Client) -> None:
+	client, ecu = kline_client
+	data = bytes(reversed(image()))
+	fail(ecu, TRANSFER_DATA, Nrc.TRANSFER_SUSPENDED, after=3)
+
+	transfer = client.download(BASE_ADDRESS, data)
+	assert ecu.memory == data
+	assert transfer.retries == 1
+
+def test_download_resumes_after_lost_response (kline_client: Client) -> None:
+	client, ecu = kline_client
+	data = bytes(reversed(image()))
+	lose(ecu, TRANSFER_DATA, after=3)
+
+	transfer = client.download(BASE_ADDRESS, data)
+	assert ecu.memory == data
+	assert transfer.retries == 1
+
+def test_download_resumes_with_offset (kline_client: Client) -> None:
+	client, ecu = kline_client
+	data = bytes(reversed(image()))
+
+	transfer = client.download(BASE_ADDRESS, data, offset=0x800)
+	assert ecu.memory == image()[:0x800] + data[0x800:]
+	assert (transfer.address, transfer.size) == (BASE_ADDRESS+0x800, 0x800)
+
+def test_compressed_download (kline_client: Client) -> None:
+	client, ecu = kline_client
+	ecu.data_formats[0x10] = LzssCodec()
+	data = bytes(0x800) + bytes(reversed(image()))[0x800:]
+
+	transfer = client.download(BASE_ADDRESS, data, compression_type=0x1, codec=LzssCodec())
+	assert ecu.memory == data
+	assert transfer.wire_bytes < len(data)
+
+def test_compressed_download_fails_on_lost_block (kline_client: Client) -> None:
+	client, ecu = kline_client
+	ecu.data_formats[0x10] = LzssCodec()
+	fail(ecu, TRANSFER_DATA, Nrc.TRANSFER_SUSPENDED, after=1)
+
+	with pytest.raises(Kwp2000NegativeResponseException):
+		client.download(BASE_ADDRESS, image(), compression_type=0x1, codec=LzssCodec())
@@ -0,0 +1,46 @@
+import time
+
+from gkbus.hardware import RawFrame, VirtualCanHardware, VirtualKLineHardware
+
+
+def test_read_many_returns_arrived_frames_only () -> None:
+	hardware = VirtualCanHardware(timeout=1)
+	hardware.inject(RawFrame(identifier=0x100, data=b'\x01'))
+	hardware.inject(RawFrame(identifier=0x100, data=b'\x02'), delay=0.5)
+
+	started = time.perf_counter()
+	frames = hardware.read_many(10)
+	assert time.perf_counter() - started < 0.25, 'must not wait for frames still on the bus'
+	assert [frame.data for frame in frames] == [b'\x01']
+
+	frames = hardware.read_many(10)
+	assert time.perf_counter() - started >= 0.5
+	assert [frame.data for frame in frames] == [b'\x02']
+
+def test_read_many_waits_for_the_first_frame () -> None:
+	hardware = VirtualCanHardware(timeout=1, latency=0.05)
+	hardware.inject(RawFrame(identifier=0x100, data=b'\x01'))
+
+	started = time.perf_counter()
+	assert [frame.data for frame in hardware.read_many(10)] == [b'\x01']
+	assert time.perf_counter() - started >= 0.05
+
+def test_kline_read_many_returns_arrived_bytes_only () -> None:
+	hardware = VirtualKLineHardware(timeout=1)
+	hardware.inject(RawFrame(identifier=False, data=b'\x01\x02'))
+	hardware.inject(RawFrame(identifier=False, data=b'\x03'), delay=0.5)
+
+	started = time.perf_counter()
+	assert hardware.read_many(10)[0].data == b'\x01\x02'
+	assert time.perf_counter() - started < 0.25
+	assert hardware.read(1).data == b'\x03'
+
+def test_flush_drops_pending_frames () -> None:
+	hardware = VirtualCanHardware(timeout=0.01)
+	hardware.inject(RawFrame(identifier=0x100, data=b'\x01'))
+	hardware.inject(RawFrame(identifier=0x100, data=b'\x02'), delay=0.5)
+	hardware.read_many(10)
+	hardware.flush()
+
+	hardware.inject(RawFrame(identifier=0x100, data=b'\x03'))
+	assert [frame.data for frame in hardware.read_many(10)] == [b'\x03']